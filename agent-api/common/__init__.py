@@ -0,0 +1,4 @@
+# __init__.py
+# Copy of the modules of the repository's common/ package that the function
+# app uses, so this folder can be published on its own. Edit them in common/
+# and copy them here again (see readme.md).
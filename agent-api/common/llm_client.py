@@ -0,0 +1,570 @@
+# llm_client.py
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.metrics import record_tokens, record_upstream, span
+from common.single_flight import AsyncSingleFlight, SingleFlight, request_key
+
+try:
+    import httpx
+except ImportError:
+    # Only needed by AsyncLLMClient (ASGI serving mode)
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_VERSION = "2023-05-15"
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (3.05, 60)
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_MAX_CONCURRENCY = 16
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Number of recent latencies kept per deployment for percentiles
+LATENCY_WINDOW = 1000
+# Service label of the upstream metrics
+METRICS_SERVICE = "azure_openai"
+
+class LLMError(Exception):
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class TokenBucket:
+    """Limits the request rate; rate <= 0 disables the limit."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+class _DeploymentStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.coalesced = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "coalesced": self.coalesced,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_p50": percentile(0.50),
+            "latency_p95": percentile(0.95),
+            "latency_p99": percentile(0.99),
+        }
+
+class CompletionStream:
+    """Iterates over the text deltas of a streaming completion and frees its slot when done."""
+
+    def __init__(self, response: requests.Response, release):
+        self._response = response
+        self._release = release
+        self._received = 0
+
+    def __iter__(self):
+        try:
+            for line in self._response.iter_lines(decode_unicode=True):
+                self._received += len(line) + 1
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                # Azure sends a first chunk with no choices (content filter results)
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+        finally:
+            self.close()
+
+    def close(self):
+        if self._release is not None:
+            self._response.close()
+            self._release()
+            self._release = None
+            record_upstream(METRICS_SERVICE, received=self._received)
+
+    def __del__(self):
+        self.close()
+
+def settings_from_env(**overrides) -> dict:
+    """Client settings from the AZURE_OPENAI_* and LLM_* environment variables."""
+    settings = {
+        "endpoint": os.getenv("AZURE_OPENAI_ENDPOINT"),
+        "api_key": os.getenv("AZURE_OPENAI_KEY"),
+        "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION", DEFAULT_API_VERSION),
+        "max_retries": int(os.getenv("LLM_MAX_RETRIES", str(DEFAULT_MAX_RETRIES))),
+        "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY))),
+        "rate_limit": float(os.getenv("LLM_RATE_LIMIT", "0")),
+        "hedge_after": float(os.getenv("LLM_HEDGE_AFTER", "0")),
+        "coalesce": os.getenv("LLM_COALESCE", "1") == "1",
+        "coalesce_timeout": float(os.getenv("LLM_COALESCE_TIMEOUT", "0")),
+    }
+    if os.getenv("LLM_TIMEOUT"):
+        settings["timeout"] = (3.05, float(os.getenv("LLM_TIMEOUT")))
+    settings.update(overrides)
+    return settings
+
+class LLMClient:
+    """
+    Azure OpenAI chat completions client shared by the backends.
+
+    All calls go through one keep-alive requests.Session. Each deployment has
+    a semaphore bounding its in-flight requests, and all calls share a token
+    bucket rate limiter. 429 and 5xx responses are retried with jittered
+    exponential backoff (honouring Retry-After). When hedge_after is set, a
+    non-streaming call that has not finished after that many seconds is sent
+    a second time and whichever answer arrives first wins. With coalesce on,
+    identical non-streaming requests (same deployment, messages and parameters)
+    made while one is in flight share its response instead of calling Azure
+    again; coalesce_timeout (0 = no limit) bounds how long they wait for it.
+    The endpoint is a plain URL, so the client can be pointed at a local mock
+    server.
+    """
+
+    def __init__(self, endpoint: str, api_key: str, deployment: str = None,
+                 api_version: str = DEFAULT_API_VERSION, timeout=DEFAULT_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 rate_limit: float = 0.0, hedge_after: float = 0.0, coalesce: bool = True,
+                 coalesce_timeout: float = 0.0):
+        self.endpoint = (endpoint or "").rstrip("/")
+        self.api_key = api_key
+        self.deployment = deployment
+        self.api_version = api_version
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.hedge_after = hedge_after
+        self.coalesce_timeout = coalesce_timeout or None
+        self._single_flight = SingleFlight() if coalesce else None
+        self._rate_limiter = TokenBucket(rate_limit, burst=max_concurrency)
+        self._semaphores = defaultdict(lambda: threading.BoundedSemaphore(max_concurrency))
+        self._semaphores_lock = threading.Lock()
+        self._stats = defaultdict(_DeploymentStats)
+        self._stats_lock = threading.Lock()
+
+        self._session = requests.Session()
+        # Hedged calls can double the number of connections in use
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrency * 2)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="llm-hedge")
+
+    @classmethod
+    def from_env(cls, **overrides) -> "LLMClient":
+        return cls(**settings_from_env(**overrides))
+
+    def _semaphore(self, deployment: str) -> threading.BoundedSemaphore:
+        with self._semaphores_lock:
+            return self._semaphores[deployment]
+
+    def _url(self, deployment: str) -> str:
+        return f"{self.endpoint}/openai/deployments/{deployment}/chat/completions?api-version={self.api_version}"
+
+    def _record(self, deployment: str, **counts):
+        with self._stats_lock:
+            stats = self._stats[deployment]
+            for name, value in counts.items():
+                if name == "latency":
+                    stats.latencies.append(value)
+                else:
+                    setattr(stats, name, getattr(stats, name) + value)
+
+    def _post(self, deployment: str, payload: dict, stream: bool = False) -> requests.Response:
+        """Sends one request, retrying throttled and failed attempts."""
+        url = self._url(deployment)
+        headers = {"Content-Type": "application/json", "api-key": self.api_key}
+        for attempt in range(self.max_retries + 1):
+            self._rate_limiter.acquire()
+            retry_after = None
+            try:
+                response = self._session.post(url, headers=headers, json=payload,
+                                              timeout=self.timeout, stream=stream)
+                if response.status_code == 200:
+                    return response
+                error = LLMError(f"Error calling OpenAI API: {response.status_code} - {response.text}",
+                                 response.status_code)
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+            except requests.RequestException as e:
+                error = LLMError(f"Error calling OpenAI API: {str(e)}")
+
+            if attempt == self.max_retries:
+                raise error
+            self._record(deployment, retries=1)
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt + 1)))
+            if retry_after is not None:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            logger.warning(f"LLM call to {deployment} failed ({str(error)}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def _call(self, deployment: str, payload: dict) -> dict:
+        with self._semaphore(deployment):
+            response = self._post(deployment, payload)
+            record_upstream(METRICS_SERVICE, sent=len(response.request.body or b""), received=len(response.content))
+            return response.json()
+
+    def _hedged_call(self, deployment: str, payload: dict) -> dict:
+        primary = self._hedge_pool.submit(self._call, deployment, payload)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self._record(deployment, hedges=1)
+        hedge = self._hedge_pool.submit(self._call, deployment, payload)
+        pending = {primary, hedge}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+        raise last_error
+
+    def chat(self, messages: list, deployment: str = None, **params) -> dict:
+        """Returns the full chat completion response as a dict."""
+        deployment = deployment or self.deployment
+        payload = {"messages": messages, **params}
+        if self._single_flight is None:
+            return self._chat(deployment, payload)
+        try:
+            result, shared = self._single_flight.do(request_key(deployment, payload),
+                                                    lambda: self._chat(deployment, payload), self.coalesce_timeout)
+        except TimeoutError as e:
+            raise LLMError(f"Error calling OpenAI API: {str(e)}", 504)
+        if shared:
+            self._record(deployment, coalesced=1)
+        return result
+
+    def _chat(self, deployment: str, payload: dict) -> dict:
+        start = time.perf_counter()
+        try:
+            with span("llm"):
+                if self.hedge_after > 0:
+                    result = self._hedged_call(deployment, payload)
+                else:
+                    result = self._call(deployment, payload)
+        except Exception:
+            self._record(deployment, calls=1, errors=1)
+            record_upstream(METRICS_SERVICE, "error")
+            raise
+        usage = result.get("usage") or {}
+        self._record(deployment, calls=1, latency=time.perf_counter() - start,
+                     prompt_tokens=usage.get("prompt_tokens", 0),
+                     completion_tokens=usage.get("completion_tokens", 0))
+        record_upstream(METRICS_SERVICE, "ok")
+        record_tokens(deployment, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        return result
+
+    def chat_text(self, messages: list, deployment: str = None, **params) -> str:
+        """Returns just the assistant's reply."""
+        result = self.chat(messages, deployment, **params)
+        choices = result.get("choices") or [{}]
+        return choices[0].get("message", {}).get("content", "")
+
+    def chat_stream(self, messages: list, deployment: str = None, **params) -> CompletionStream:
+        """
+        Starts a streaming completion and returns an iterator over its text deltas.
+        Errors in the request itself are raised here, before anything is streamed.
+        """
+        deployment = deployment or self.deployment
+        payload = {"messages": messages, "stream": True, **params}
+        semaphore = self._semaphore(deployment)
+        semaphore.acquire()
+        start = time.perf_counter()
+        try:
+            with span("llm.first_byte"):
+                response = self._post(deployment, payload, stream=True)
+        except Exception:
+            semaphore.release()
+            self._record(deployment, calls=1, errors=1)
+            record_upstream(METRICS_SERVICE, "error")
+            raise
+        # Latency of a stream is its time to first byte
+        self._record(deployment, calls=1, latency=time.perf_counter() - start)
+        record_upstream(METRICS_SERVICE, "ok", sent=len(response.request.body or b""))
+        return CompletionStream(response, semaphore.release)
+
+    def predial(self) -> bool:
+        """
+        Opens a keep-alive connection to the endpoint ahead of the first call, so
+        that call does not pay for DNS, TCP and TLS setup. Any HTTP answer will do
+        (the resource root returns 404), and no key is sent. Returns False when the
+        endpoint could not be reached.
+        """
+        try:
+            self._session.get(self.endpoint + "/", timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning(f"Pre-dial to {self.endpoint} failed: {str(e)}")
+            return False
+        return True
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {deployment: stats.summary() for deployment, stats in self._stats.items()}
+
+class AsyncLLMClient:
+    """
+    asyncio counterpart of LLMClient for the ASGI serving mode.
+
+    Same settings, retries, hedging, coalescing and stats, but built on one pooled
+    httpx.AsyncClient, so a single event loop can keep hundreds of upstream
+    calls outstanding without a thread per call.
+    """
+
+    def __init__(self, endpoint: str, api_key: str, deployment: str = None,
+                 api_version: str = DEFAULT_API_VERSION, timeout=DEFAULT_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 rate_limit: float = 0.0, hedge_after: float = 0.0, coalesce: bool = True,
+                 coalesce_timeout: float = 0.0):
+        if httpx is None:
+            raise RuntimeError("AsyncLLMClient requires the httpx package")
+        self.endpoint = (endpoint or "").rstrip("/")
+        self.api_key = api_key
+        self.deployment = deployment
+        self.api_version = api_version
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.hedge_after = hedge_after
+        self.coalesce_timeout = coalesce_timeout or None
+        self._single_flight = AsyncSingleFlight() if coalesce else None
+        self._next_slot = 0.0
+        self._semaphores = defaultdict(lambda: asyncio.Semaphore(max_concurrency))
+        self._stats = defaultdict(_DeploymentStats)
+        connect_timeout, read_timeout = timeout
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_concurrency * 2, max_keepalive_connections=max_concurrency * 2),
+        )
+
+    @classmethod
+    def from_env(cls, **overrides) -> "AsyncLLMClient":
+        return cls(**settings_from_env(**overrides))
+
+    async def _acquire_rate_slot(self):
+        if self.rate_limit <= 0:
+            return
+        # Single event loop, so no lock is needed to hand out start times
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.rate_limit
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _record(self, deployment: str, **counts):
+        stats = self._stats[deployment]
+        for name, value in counts.items():
+            if name == "latency":
+                stats.latencies.append(value)
+            else:
+                setattr(stats, name, getattr(stats, name) + value)
+
+    def _url(self, deployment: str) -> str:
+        return f"{self.endpoint}/openai/deployments/{deployment}/chat/completions?api-version={self.api_version}"
+
+    async def _send(self, deployment: str, payload: dict, stream: bool = False):
+        """Sends one request, retrying throttled and failed attempts."""
+        headers = {"Content-Type": "application/json", "api-key": self.api_key}
+        request = self._client.build_request("POST", self._url(deployment), headers=headers, json=payload)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_rate_slot()
+            retry_after = None
+            try:
+                response = await self._client.send(request, stream=stream)
+                if response.status_code == 200:
+                    return response
+                body = (await response.aread()).decode("utf-8", "replace")
+                error = LLMError(f"Error calling OpenAI API: {response.status_code} - {body}", response.status_code)
+                retry_after = response.headers.get("Retry-After")
+                await response.aclose()
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+            except httpx.HTTPError as e:
+                error = LLMError(f"Error calling OpenAI API: {str(e)}")
+
+            if attempt == self.max_retries:
+                raise error
+            self._record(deployment, retries=1)
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt + 1)))
+            if retry_after is not None:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            logger.warning(f"LLM call to {deployment} failed ({str(error)}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _call(self, deployment: str, payload: dict) -> dict:
+        async with self._semaphores[deployment]:
+            response = await self._send(deployment, payload)
+            record_upstream(METRICS_SERVICE, sent=len(response.request.content), received=len(response.content))
+            return response.json()
+
+    async def _hedged_call(self, deployment: str, payload: dict) -> dict:
+        primary = asyncio.ensure_future(self._call(deployment, payload))
+        done, _ = await asyncio.wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self._record(deployment, hedges=1)
+        pending = {primary, asyncio.ensure_future(self._call(deployment, payload))}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def chat(self, messages: list, deployment: str = None, **params) -> dict:
+        """Returns the full chat completion response as a dict."""
+        deployment = deployment or self.deployment
+        payload = {"messages": messages, **params}
+        if self._single_flight is None:
+            return await self._chat(deployment, payload)
+        try:
+            result, shared = await self._single_flight.do(request_key(deployment, payload),
+                                                          lambda: self._chat(deployment, payload), self.coalesce_timeout)
+        except TimeoutError as e:
+            raise LLMError(f"Error calling OpenAI API: {str(e)}", 504)
+        if shared:
+            self._record(deployment, coalesced=1)
+        return result
+
+    async def _chat(self, deployment: str, payload: dict) -> dict:
+        start = time.perf_counter()
+        try:
+            with span("llm"):
+                if self.hedge_after > 0:
+                    result = await self._hedged_call(deployment, payload)
+                else:
+                    result = await self._call(deployment, payload)
+        except Exception:
+            self._record(deployment, calls=1, errors=1)
+            record_upstream(METRICS_SERVICE, "error")
+            raise
+        usage = result.get("usage") or {}
+        self._record(deployment, calls=1, latency=time.perf_counter() - start,
+                     prompt_tokens=usage.get("prompt_tokens", 0),
+                     completion_tokens=usage.get("completion_tokens", 0))
+        record_upstream(METRICS_SERVICE, "ok")
+        record_tokens(deployment, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        return result
+
+    async def chat_text(self, messages: list, deployment: str = None, **params) -> str:
+        """Returns just the assistant's reply."""
+        result = await self.chat(messages, deployment, **params)
+        choices = result.get("choices") or [{}]
+        return choices[0].get("message", {}).get("content", "")
+
+    async def chat_stream(self, messages: list, deployment: str = None, **params):
+        """Async generator over the text deltas of a streaming completion."""
+        deployment = deployment or self.deployment
+        payload = {"messages": messages, "stream": True, **params}
+        async with self._semaphores[deployment]:
+            start = time.perf_counter()
+            try:
+                with span("llm.first_byte"):
+                    response = await self._send(deployment, payload, stream=True)
+            except Exception:
+                self._record(deployment, calls=1, errors=1)
+                record_upstream(METRICS_SERVICE, "error")
+                raise
+            self._record(deployment, calls=1, latency=time.perf_counter() - start)
+            record_upstream(METRICS_SERVICE, "ok", sent=len(response.request.content))
+            received = 0
+            try:
+                async for line in response.aiter_lines():
+                    received += len(line) + 1
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or []
+                    content = choices[0].get("delta", {}).get("content") if choices else None
+                    if content:
+                        yield content
+            finally:
+                await response.aclose()
+                record_upstream(METRICS_SERVICE, received=received)
+
+    def stats(self) -> dict:
+        return {deployment: stats.summary() for deployment, stats in self._stats.items()}
+
+    async def aclose(self):
+        await self._client.aclose()
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+    """Returns the process-wide client, configured from the environment on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = LLMClient.from_env()
+        return _default_client
+
+_default_async_client = None
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """Returns the event loop's shared async client (ASGI apps serve from a single loop)."""
+    global _default_async_client
+    if _default_async_client is None:
+        _default_async_client = AsyncLLMClient.from_env()
+    return _default_async_client
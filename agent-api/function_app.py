@@ -1,10 +1,60 @@
 import azure.functions as func
 import logging
 import os
-import requests
+import threading
+
+# Vendored copy of the repository's shared helpers (see common/__init__.py)
+from common.llm_client import LLMClient, LLMError
+from common.metrics import CONTENT_TYPE, render as render_metrics
+
+# Settings are resolved once per worker, not on every invocation
+# Azure OpenAI endpoint and deployment used by the agent
+OPENAI_ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT", "https://openai-1667358.openai.azure.com/")
+OPENAI_DEPLOYMENT = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-35-turbo")
+OPENAI_API_VERSION = "2025-01-01-preview"
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+
+# The agent/stream route needs the FastAPI-based HTTP streams extension, most of this
+# app's import time; AGENT_STREAMING=false leaves both out to shorten cold starts
+STREAMING_ENABLED = os.environ.get("AGENT_STREAMING", "true").lower() == "true"
+# Connect to Azure OpenAI in the background while the worker loads, not on the first request
+PREDIAL = os.environ.get("AGENT_PREDIAL", "true").lower() == "true"
+# Register a warm-up trigger, which Premium and Dedicated plans run on a new instance before it gets traffic
+WARMUP_TRIGGER = os.environ.get("AGENT_WARMUP_TRIGGER", "false").lower() == "true"
+# NCRONTAB schedule of a timer keeping the instance and its connection warm, e.g. "0 */4 * * * *"
+KEEP_WARM_SCHEDULE = os.environ.get("AGENT_KEEP_WARM_SCHEDULE", "")
+
+if STREAMING_ENABLED:
+   import asyncio
+   import json
+   from azurefunctions.extensions.http.fastapi import Request, StreamingResponse, PlainTextResponse
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+   """Pooled client reused across invocations on the same worker."""
+   global _llm_client
+   if _llm_client is None:
+      with _llm_client_lock:
+         if _llm_client is None:
+            _llm_client = LLMClient.from_env(endpoint=OPENAI_ENDPOINT, api_key=OPENAI_API_KEY,
+                                             deployment=OPENAI_DEPLOYMENT, api_version=OPENAI_API_VERSION)
+   return _llm_client
+
+def warm_up():
+   """Creates the pooled client and opens its connection to Azure OpenAI."""
+   if OPENAI_API_KEY:
+      get_llm_client().predial()
+
+def build_messages(user_message: str) -> list:
+   return [
+      {"role": "system", "content": "You are a helpful assistant."},
+      {"role": "user", "content": user_message}
+   ]
+
 @app.route(route="agent", methods=["GET", "POST"])
 def agent(req: func.HttpRequest) -> func.HttpResponse:
    logging.info("Processing request for GPT‑4 agent.")
@@ -27,35 +77,77 @@ def agent(req: func.HttpRequest) -> func.HttpResponse:
             status_code=400
       )
    
-   # Retrieve your API key from the environment variables.
-   api_key = os.environ.get("OPENAI_API_KEY")
-   if not api_key:
+   # The API key comes from the OPENAI_API_KEY app setting.
+   if not OPENAI_API_KEY:
       return func.HttpResponse("API key not configured.", status_code=500)
    
-   # Define the Azure OpenAI endpoint URL.
-   url = ("https://openai-1667358.openai.azure.com/openai/deployments/gpt-35-turbo/chat/completions?api-version=2025-01-01-preview")
-   
-   headers = {
-      "Content-Type": "application/json",
-      "api-key": api_key
-   }
-   
-   payload = {
-      "messages": [
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": user_message}
-      ]
-   }
-   
-   # Post the request to the OpenAI endpoint.
-   response = requests.post(url, headers=headers, json=payload)
-   
-   if response.status_code != 200:
-      logging.error(f"Error calling OpenAI API: {response.status_code} - {response.text}")
-      return func.HttpResponse("Error calling OpenAI API.", status_code=response.status_code)
+   # Post the request to the OpenAI endpoint (pooled connection, retries on 429/5xx).
+   try:
+      result = get_llm_client().chat(build_messages(user_message))
+   except LLMError as e:
+      logging.error(str(e))
+      return func.HttpResponse("Error calling OpenAI API.", status_code=e.status_code or 502)
    
-   result = response.json()
    # Extract the assistant's reply from the API response.
    assistant_reply = result.get("choices", [{}])[0].get("message", {}).get("content", "No response")
    
-   return func.HttpResponse(assistant_reply, status_code=200)
\ No newline at end of file
+   return func.HttpResponse(assistant_reply, status_code=200)
+
+# Prometheus metrics of this worker (LLM latency, upstream tokens and bytes)
+@app.route(route="metrics", methods=["GET"])
+def metrics(req: func.HttpRequest) -> func.HttpResponse:
+   return func.HttpResponse(render_metrics(), status_code=200, headers={"Content-Type": CONTENT_TYPE})
+
+if STREAMING_ENABLED:
+   def iter_sse_deltas(stream):
+      """Re-emits the text deltas of a streaming chat completion as server-sent events."""
+      for content in stream:
+         yield f"data: {json.dumps({'delta': content})}\n\n"
+      yield f"data: {json.dumps({'done': True})}\n\n"
+
+   # Streaming variant: relays tokens as server-sent events while they are generated.
+   # Requires the HTTP streams extension (PYTHON_ENABLE_INIT_INDEXING=1, see readme.md).
+   @app.route(route="agent/stream", methods=["GET", "POST"])
+   async def agent_stream(req: Request) -> StreamingResponse:
+      logging.info("Processing streaming request for GPT‑4 agent.")
+
+      user_message = req.query_params.get("message")
+      if not user_message and req.method == "POST":
+         try:
+               req_body = await req.json()
+         except ValueError:
+               return PlainTextResponse("Invalid JSON payload.", status_code=400)
+         else:
+               user_message = req_body.get("message")
+
+      if not user_message:
+         return PlainTextResponse(
+               "Please provide a 'message' parameter (in the query string or request body).",
+               status_code=400
+         )
+
+      if not OPENAI_API_KEY:
+         return PlainTextResponse("API key not configured.", status_code=500)
+
+      # Run the blocking call off the event loop; the body is read later by the StreamingResponse
+      try:
+         stream = await asyncio.to_thread(get_llm_client().chat_stream, build_messages(user_message))
+      except LLMError as e:
+         logging.error(str(e))
+         return PlainTextResponse("Error calling OpenAI API.", status_code=e.status_code or 502)
+
+      return StreamingResponse(iter_sse_deltas(stream), media_type="text/event-stream",
+                               headers={"Cache-Control": "no-cache"})
+
+if WARMUP_TRIGGER:
+   @app.warm_up_trigger("warmup_context")
+   def warmup(warmup_context) -> None:
+      warm_up()
+
+if KEEP_WARM_SCHEDULE:
+   @app.timer_trigger(arg_name="timer", schedule=KEEP_WARM_SCHEDULE)
+   def keep_warm(timer: func.TimerRequest) -> None:
+      warm_up()
+
+if PREDIAL:
+   threading.Thread(target=warm_up, name="predial", daemon=True).start()
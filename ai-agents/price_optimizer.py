@@ -0,0 +1,385 @@
+# price_optimizer.py
+"""
+Batch price optimization agent.
+
+Streams a product CSV in chunks, asks the LLM for a pricing strategy for each
+product from a bounded thread pool, and appends results to the output CSV as
+they complete. Every finished row is recorded in a checkpoint file next to the
+output, so an interrupted run resumes where it stopped. Rows whose LLM call
+still fails after retrying are left out of both, so the next run retries them.
+
+Usage:
+    python price_optimizer.py --input price_optimization_data.csv --output optimized_price_strategies.csv
+    python price_optimizer.py --benchmark 1,4,16,64    # throughput with a fake LLM
+    python price_optimizer.py --report-savings 100000  # LLM calls avoided by the pre-filter
+"""
+import argparse
+import csv
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+import openai
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+azure_openai_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+azure_openai_key = os.getenv("AZURE_OPENAI_KEY")
+azure_openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+
+logger = logging.getLogger(__name__)
+
+# Configure OpenAI with Azure settings
+openai.api_type = "azure"
+openai.api_key = azure_openai_key
+openai.api_base = azure_openai_endpoint
+openai.api_version = "2023-05-15"
+
+PROMPT_TEMPLATE = (
+    "The product '{product_name}' has a stock level of {stock_level} and sales last month were {sales_last_month}. "
+    "Suggest an optimal pricing strategy to maximize revenue and reduce overstock."
+)
+
+# Prompt for a whole bucket of products with similar stock and sales
+BUCKET_PROMPT_TEMPLATE = (
+    "A product has a stock level of about {stock_level} units and sales last month were about {sales_last_month} units. "
+    "Suggest an optimal pricing strategy to maximize revenue and reduce overstock."
+)
+
+OUTPUT_COLUMNS = ["Product Name", "Optimal Strategy"]
+
+# Pre-filter: products are grouped into (stock band, sales band) buckets and only one
+# prompt is sent per bucket. Obvious cases are handled by rules without any LLM call.
+OVERSTOCK_THRESHOLD = 300
+OVERSTOCK_MONTHS_OF_COVER = 6
+STOCK_BAND_EDGES = [0, 1, 25, 50, 100, 200, 300, 500, 1000, 2000, 5000]
+SALES_BAND_EDGES = [0, 1, 10, 25, 50, 100, 200, 500, 1000]
+
+RULE_STRATEGIES = {
+    "out_of_stock": "Out of stock: keep the current price (or raise it slightly) until inventory is replenished.",
+    "no_sales": "No sales last month: apply a 30-40% clearance discount and bundle the product with best sellers.",
+    "overstock": "Overstocked: run a 20-25% promotional discount and volume offers until stock covers under "
+                 f"{OVERSTOCK_MONTHS_OF_COVER} months of sales.",
+}
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE_LIMIT = 5.0    # LLM requests per second
+DEFAULT_CHUNK_SIZE = 1000   # CSV rows read at a time
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+
+def azure_llm(prompt: str) -> str:
+    response = openai.ChatCompletion.create(
+        engine=azure_openai_deployment,
+        messages=[{"role": "system", "content": "You are a pricing optimization assistant."},
+                  {"role": "user", "content": prompt}],
+        temperature=0.7,
+        max_tokens=800,
+        request_timeout=60
+    )
+    return response['choices'][0]['message']['content']
+
+def make_fake_llm(mean_latency: float = 0.2):
+    """Returns a stand-in for azure_llm that sleeps instead of calling Azure, for benchmarking."""
+    def fake_llm(prompt: str) -> str:
+        time.sleep(random.expovariate(1 / mean_latency))
+        return f"Fake strategy for: {prompt[:40]}"
+    return fake_llm
+
+class RateLimiter:
+    """Token bucket shared by all worker threads."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def _ask_llm(prompt: str, label: str, llm=azure_llm, rate_limiter: RateLimiter = None) -> str:
+    """Calls the LLM, retrying failed calls with jittered backoff; raises the last error if every attempt fails."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return llm(prompt)
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                logger.error(f"Giving up on '{label}' after {attempt} attempts: {str(e)}")
+                raise
+            logger.warning(f"LLM call for '{label}' failed (attempt {attempt}): {str(e)}")
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+
+def optimize_price(product_name, stock_level, sales_last_month, llm=azure_llm, rate_limiter: RateLimiter = None):
+    """Asks the LLM for a pricing strategy for one product."""
+    prompt = PROMPT_TEMPLATE.format(product_name=product_name, stock_level=stock_level,
+                                    sales_last_month=sales_last_month)
+    return _ask_llm(prompt, product_name, llm, rate_limiter)
+
+def prefilter(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds a "rule" column (a RULE_STRATEGIES key, or None when the LLM is needed)
+    and a "bucket" column (stock band, sales band) to a chunk of products.
+    """
+    stock = data["Stock Level"].to_numpy(dtype=float)
+    sales = data["Sales Last Month"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months_of_cover = np.where(sales > 0, stock / sales, np.inf)
+
+    rule = np.select(
+        [
+            stock <= 0,
+            sales <= 0,
+            (stock > OVERSTOCK_THRESHOLD) & (months_of_cover > OVERSTOCK_MONTHS_OF_COVER),
+        ],
+        ["out_of_stock", "no_sales", "overstock"],
+        default="",
+    )
+    stock_band = np.searchsorted(STOCK_BAND_EDGES, stock, side="right")
+    sales_band = np.searchsorted(SALES_BAND_EDGES, sales, side="right")
+
+    result = data.copy()
+    result["rule"] = np.where(rule == "", None, rule)
+    result["bucket"] = list(zip(stock_band.tolist(), sales_band.tolist()))
+    return result
+
+def _bucket_midpoint(edges: list, band: int) -> int:
+    """Representative value for a band: the middle of its range, or its lower edge if open-ended."""
+    if band >= len(edges):
+        return edges[-1]
+    return (edges[band - 1] + edges[band]) // 2
+
+def optimize_bucket(bucket: tuple, llm=azure_llm, rate_limiter: RateLimiter = None) -> str:
+    """Asks the LLM for one strategy shared by every product in a (stock band, sales band) bucket."""
+    stock_band, sales_band = bucket
+    prompt = BUCKET_PROMPT_TEMPLATE.format(
+        stock_level=_bucket_midpoint(STOCK_BAND_EDGES, stock_band),
+        sales_last_month=_bucket_midpoint(SALES_BAND_EDGES, sales_band),
+    )
+    return _ask_llm(prompt, f"bucket {bucket}", llm, rate_limiter)
+
+def estimate_savings(data: pd.DataFrame) -> dict:
+    """Counts how many LLM calls the pre-filter avoids for a catalog."""
+    filtered = prefilter(data)
+    needs_llm = filtered["rule"].isna()
+    llm_calls = int(filtered.loc[needs_llm, "bucket"].nunique())
+    return {
+        "rows": len(filtered),
+        "rule_rows": int((~needs_llm).sum()),
+        "llm_calls": llm_calls,
+        "llm_calls_saved": len(filtered) - llm_calls,
+    }
+
+def synthetic_catalog(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "Product Name": [f"Product {i}" for i in range(rows)],
+        "Stock Level": rng.integers(0, 2000, rows),
+        "Sales Last Month": rng.poisson(rng.choice([0, 5, 50, 200], rows)),
+    })
+
+def _load_checkpoint(checkpoint_path: str) -> set:
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r") as f:
+        return {int(line) for line in f if line.strip().isdigit()}
+
+def run_batch(input_path: str, output_path: str, llm=azure_llm, concurrency: int = DEFAULT_CONCURRENCY,
+              rate_limit: float = DEFAULT_RATE_LIMIT, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              resume: bool = True, use_prefilter: bool = True) -> int:
+    """
+    Optimizes every row of input_path and writes the results to output_path.
+
+    With use_prefilter, rows matching a rule get the rule's strategy and the
+    rest share one LLM call per (stock band, sales band) bucket; otherwise
+    every row gets its own call. Rows are written in completion order.
+    Rows whose LLM call fails are neither written nor checkpointed; the
+    checkpoint is then kept so the next run retries only those rows.
+    Returns the number of rows processed in this run.
+    """
+    checkpoint_path = output_path + ".checkpoint"
+    done = _load_checkpoint(checkpoint_path) if resume else set()
+    if not done:
+        # Fresh run: start new output and checkpoint files
+        with open(output_path, "w", newline="") as f:
+            csv.writer(f).writerow(OUTPUT_COLUMNS)
+        open(checkpoint_path, "w").close()
+    else:
+        logger.info(f"Resuming: {len(done)} rows already processed")
+
+    rate_limiter = RateLimiter(rate_limit, burst=concurrency)
+    # Bounds the number of LLM calls queued for a worker
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+    lock = threading.Lock()
+    stats = {"processed": 0, "rule_rows": 0, "llm_calls": 0, "failed": 0}
+    # bucket -> [future, rows waiting for its strategy]
+    buckets = {}
+
+    with open(output_path, "a", newline="") as out, open(checkpoint_path, "a") as checkpoint, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        writer = csv.writer(out)
+
+        def write_rows(rows: list, strategy: str):
+            with lock:
+                for index, product_name in rows:
+                    writer.writerow([product_name, strategy])
+                out.flush()
+                checkpoint.writelines(f"{index}\n" for index, _ in rows)
+                checkpoint.flush()
+                stats["processed"] += len(rows)
+
+        def finish(rows: list, future):
+            if future.exception() is not None:
+                with lock:
+                    stats["failed"] += len(rows)
+                return
+            write_rows(rows, future.result())
+
+        def submit(fn, *args):
+            in_flight.acquire()
+            stats["llm_calls"] += 1
+
+            def run():
+                try:
+                    return fn(*args, llm=llm, rate_limiter=rate_limiter)
+                finally:
+                    in_flight.release()
+            return executor.submit(run)
+
+        def on_bucket_done(bucket):
+            def callback(future):
+                with lock:
+                    rows = buckets[bucket][1]
+                    buckets[bucket][1] = []
+                    if future.exception() is not None:
+                        # Later rows in this bucket get a new call
+                        del buckets[bucket]
+                finish(rows, future)
+            return callback
+
+        futures = []
+        for chunk in pd.read_csv(input_path, chunksize=chunk_size):
+            chunk = chunk[~chunk.index.isin(done)]
+            if chunk.empty:
+                continue
+
+            if not use_prefilter:
+                for index, row in chunk.iterrows():
+                    future = submit(optimize_price, row['Product Name'], row['Stock Level'], row['Sales Last Month'])
+                    future.add_done_callback(lambda f, rows=[(index, row['Product Name'])]: finish(rows, f))
+                    futures.append(future)
+            else:
+                chunk = prefilter(chunk)
+                ruled = chunk[chunk["rule"].notna()]
+                for rule, group in ruled.groupby("rule"):
+                    write_rows(list(zip(group.index, group["Product Name"])), RULE_STRATEGIES[rule])
+                stats["rule_rows"] += len(ruled)
+
+                for bucket, group in chunk[chunk["rule"].isna()].groupby("bucket"):
+                    rows = list(zip(group.index, group["Product Name"]))
+                    with lock:
+                        entry = buckets.get(bucket)
+                        if entry is not None:
+                            # A failed call's callback counts these rows as failed along with its own
+                            if not entry[0].done() or entry[0].exception() is not None:
+                                entry[1].extend(rows)
+                                continue
+                            strategy = entry[0].result()
+                    if entry is not None:
+                        write_rows(rows, strategy)
+                        continue
+                    buckets[bucket] = [None, rows]
+                    future = submit(optimize_bucket, bucket)
+                    buckets[bucket][0] = future
+                    future.add_done_callback(on_bucket_done(bucket))
+                    futures.append(future)
+
+            # Drop references to finished futures so memory stays bounded
+            futures = [f for f in futures if not f.done()]
+
+        wait(futures)
+
+    logger.info(f"Processed {stats['processed']} rows: {stats['rule_rows']} by rules, "
+                f"{stats['llm_calls']} LLM calls")
+    if stats["failed"]:
+        logger.error(f"{stats['failed']} rows failed and were left out of {output_path}; "
+                     f"run again to retry them")
+    else:
+        # Every row is done; the next run starts from scratch
+        os.remove(checkpoint_path)
+    return stats["processed"]
+
+def benchmark(concurrency_levels: list, rows: int = 200, mean_latency: float = 0.2):
+    """Measures rows/second at each concurrency level with a fake LLM and a synthetic catalog."""
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "catalog.csv")
+        synthetic_catalog(rows).to_csv(input_path, index=False)
+        for concurrency in concurrency_levels:
+            start = time.perf_counter()
+            # Pre-filter off so every row makes an LLM call
+            run_batch(input_path, os.path.join(tmp, "out.csv"), llm=make_fake_llm(mean_latency),
+                      concurrency=concurrency, rate_limit=0, resume=False, use_prefilter=False)
+            elapsed = time.perf_counter() - start
+            print(f"concurrency={concurrency:4d}  {rows / elapsed:8.1f} rows/s  ({elapsed:.2f}s)")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Batch price optimization agent")
+    parser.add_argument("--input", default="price_optimization_data.csv")
+    parser.add_argument("--output", default="optimized_price_strategies.csv")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rate-limit", type=float, default=DEFAULT_RATE_LIMIT,
+                        help="maximum LLM requests per second (0 = unlimited)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--no-resume", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--no-prefilter", action="store_true",
+                        help="send one prompt per product instead of one per stock/sales bucket")
+    parser.add_argument("--fake-llm", type=float, metavar="LATENCY",
+                        help="use a fake LLM with this mean latency in seconds instead of Azure")
+    parser.add_argument("--benchmark", metavar="LEVELS",
+                        help="comma-separated concurrency levels to benchmark with a fake LLM")
+    parser.add_argument("--report-savings", type=int, metavar="ROWS",
+                        help="report LLM calls saved by the pre-filter on a synthetic catalog of ROWS products")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark([int(level) for level in args.benchmark.split(",")])
+        return
+    if args.report_savings:
+        savings = estimate_savings(synthetic_catalog(args.report_savings))
+        print(f"{savings['rows']} products: {savings['rule_rows']} handled by rules, "
+              f"{savings['llm_calls']} LLM calls instead of {savings['rows']} "
+              f"({savings['llm_calls_saved']} saved)")
+        return
+
+    llm = make_fake_llm(args.fake_llm) if args.fake_llm is not None else azure_llm
+    start = time.perf_counter()
+    processed = run_batch(args.input, args.output, llm=llm, concurrency=args.concurrency,
+                          rate_limit=args.rate_limit, chunk_size=args.chunk_size,
+                          resume=not args.no_resume, use_prefilter=not args.no_prefilter)
+    print(f"Price optimization completed: {processed} products in {time.perf_counter() - start:.1f}s. "
+          f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Offline benchmark and load-test suite (see README.md)
@@ -0,0 +1,76 @@
+# batch_images.py
+"""
+Image throughput of the multimodal backend against the mock Vision and
+OpenAI services: N images sent one /api/analyze-image request after another
+(what a client does today) versus one /api/analyze-images batch request,
+combined and streamed.
+
+  python -m benchmarks.batch_images [--images 32] [--vision-median 0.3] [--asgi]
+"""
+import argparse
+import json
+import time
+
+import httpx
+
+from benchmarks.mock_services import LatencyProfile, MockServices
+from benchmarks.run import make_image, start_backend
+
+def _files(images: list) -> list:
+    return [("images", (f"image{i}.png", data, "image/png")) for i, data in enumerate(images)]
+
+def measure(base_url: str, images: list) -> dict:
+    results = {}
+    with httpx.Client(timeout=300) as client:
+        start = time.perf_counter()
+        for i, data in enumerate(images):
+            response = client.post(f"{base_url}/api/analyze-image",
+                                   files={"image": (f"image{i}.png", data, "image/png")})
+            response.raise_for_status()
+        results["sequential"] = {"seconds": time.perf_counter() - start}
+
+        # Fresh images, so the vision cache filled above does not help the batches
+        batch = [make_image(10_000 + i) for i in range(len(images))]
+        start = time.perf_counter()
+        response = client.post(f"{base_url}/api/analyze-images", files=_files(batch))
+        response.raise_for_status()
+        results["batch"] = {"seconds": time.perf_counter() - start}
+
+        batch = [make_image(20_000 + i) for i in range(len(images))]
+        start = time.perf_counter()
+        arrivals = []
+        with client.stream("POST", f"{base_url}/api/analyze-images", files=_files(batch),
+                           data={"stream": "true"}) as response:
+            for line in response.iter_lines():
+                if line.startswith("data: ") and "image" in json.loads(line[len("data: "):]):
+                    arrivals.append(time.perf_counter() - start)
+        results["batch_stream"] = {"seconds": time.perf_counter() - start,
+                                   "first_image_seconds": arrivals[0] if arrivals else None}
+
+    for result in results.values():
+        result["images_per_second"] = len(images) / result["seconds"]
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs batch image analysis throughput")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--vision-median", type=float, default=0.3, help="Median mock Vision latency (s)")
+    parser.add_argument("--openai-median", type=float, default=0.2, help="Median mock Azure OpenAI latency (s)")
+    parser.add_argument("--asgi", action="store_true", help="Serve asgi.py with uvicorn")
+    args = parser.parse_args()
+
+    mocks = MockServices(vision=LatencyProfile(args.vision_median), openai=LatencyProfile(args.openai_median)).start()
+    images = [make_image(i) for i in range(args.images)]
+    try:
+        with start_backend("multimodal", mocks.url, args.asgi) as (base_url, _):
+            results = measure(base_url, images)
+    finally:
+        mocks.stop()
+
+    for name, result in results.items():
+        extra = f", first image after {result['first_image_seconds']:.2f}s" if result.get("first_image_seconds") else ""
+        print(f"{name:<13} {result['seconds']:6.2f}s  {result['images_per_second']:6.1f} images/s{extra}")
+    print(f"batch speed-up: {results['sequential']['seconds'] / results['batch']['seconds']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# coalescing.py
+"""
+Checks that concurrent identical upstream calls are coalesced (see
+common/single_flight.py), against the mock services:
+
+  python -m benchmarks.coalescing [concurrency]
+
+N duplicate chat completions and N uploads of the same image, sync and async,
+must each reach the mock exactly once; an upstream error must reach every
+waiter; a waiter whose coalesce timeout expires must fail alone. Exits with
+status 1 if any check fails.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_services import LatencyProfile, MockServices
+
+def _check(name: str, condition: bool, detail: str) -> bool:
+    print(f"{'ok  ' if condition else 'FAIL'} {name}: {detail}")
+    return condition
+
+def _calls(mocks: MockServices, service: str, before: dict) -> int:
+    return mocks.counts[service] - before[service]
+
+def check_llm(mocks: MockServices, n: int) -> list:
+    from common.llm_client import AsyncLLMClient, LLMClient, LLMError
+    messages = [{"role": "user", "content": "What are your business hours?"}]
+    results = []
+
+    client = LLMClient(mocks.url, "benchmark", "benchmark", max_concurrency=n)
+    before = dict(mocks.counts)
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        replies = list(pool.map(lambda _: client.chat_text(messages, temperature=0), range(n)))
+    calls = _calls(mocks, "openai", before)
+    results.append(_check("sync chat", calls == 1 and len(set(replies)) == 1,
+                          f"{n} concurrent duplicates, {calls} upstream call(s)"))
+
+    async def async_duplicates():
+        async_client = AsyncLLMClient(mocks.url, "benchmark", "benchmark", max_concurrency=n)
+        try:
+            return await asyncio.gather(*[async_client.chat_text(messages, temperature=0) for _ in range(n)])
+        finally:
+            await async_client.aclose()
+
+    before = dict(mocks.counts)
+    replies = asyncio.run(async_duplicates())
+    calls = _calls(mocks, "openai", before)
+    results.append(_check("async chat", calls == 1 and len(set(replies)) == 1,
+                          f"{n} concurrent duplicates, {calls} upstream call(s)"))
+
+    # Different parameters are different requests
+    before = dict(mocks.counts)
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        list(pool.map(lambda i: client.chat_text(messages, temperature=i / n), range(n)))
+    calls = _calls(mocks, "openai", before)
+    results.append(_check("distinct parameters", calls == n, f"{n} requests, {calls} upstream call(s)"))
+
+    # An upstream failure reaches every waiter, from a single call
+    profile = mocks.profiles["openai"]
+    profile.error_rate, profile.throttle_share = 1.0, 0.0
+    failing = LLMClient(mocks.url, "benchmark", "benchmark", max_retries=0, max_concurrency=n)
+    before = dict(mocks.counts)
+
+    def call_failing(_):
+        try:
+            failing.chat_text(messages)
+            return None
+        except LLMError as e:
+            return e.status_code
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        statuses = list(pool.map(call_failing, range(n)))
+    profile.error_rate = 0.0
+    calls = _calls(mocks, "openai", before)
+    results.append(_check("error propagation", calls == 1 and statuses == [500] * n,
+                          f"{statuses.count(500)}/{n} waiters got the 500, {calls} upstream call(s)"))
+
+    # Waiters that time out fail on their own; the call still completes for the caller that made it
+    profile.median, profile.sigma = 0.5, 0.0
+    impatient = LLMClient(mocks.url, "benchmark", "benchmark", max_concurrency=n, coalesce_timeout=0.1)
+
+    def call_impatient(i):
+        try:
+            impatient.chat_text(messages, max_tokens=42)
+            return "ok"
+        except LLMError as e:
+            return e.status_code
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        outcomes = list(pool.map(call_impatient, range(n)))
+    profile.median, profile.sigma = 0.2, 0.5
+    results.append(_check("waiter timeout", outcomes.count("ok") == 1 and outcomes.count(504) == n - 1,
+                          f"{outcomes.count('ok')} completed, {outcomes.count(504)} timed out waiting"))
+    return results
+
+def check_vision(mocks: MockServices, n: int) -> list:
+    from azure.core.credentials import AzureKeyCredential
+    from azure.ai.vision.imageanalysis import ImageAnalysisClient
+    from azure.ai.vision.imageanalysis.aio import ImageAnalysisClient as AsyncImageAnalysisClient
+    from common.vision_cache import VisionCache, analyze_image, analyze_image_async
+    results = []
+    credential = AzureKeyCredential("benchmark")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = VisionCache(path=os.path.join(workdir, "vision_cache.sqlite"), phash_distance=-1)
+        client = ImageAnalysisClient(endpoint=mocks.url, credential=credential)
+        image = random.Random(1).randbytes(4096)
+        before = dict(mocks.counts)
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            captions = list(pool.map(lambda _: analyze_image(client, image, cache)[0], range(n)))
+        calls = _calls(mocks, "vision", before)
+        results.append(_check("sync vision", calls == 1 and len(set(captions)) == 1,
+                              f"{n} concurrent uploads of one image, {calls} upstream call(s)"))
+
+        async def async_duplicates():
+            async with AsyncImageAnalysisClient(endpoint=mocks.url, credential=credential) as async_client:
+                other = random.Random(2).randbytes(4096)
+                return await asyncio.gather(*[analyze_image_async(async_client, other, cache) for _ in range(n)])
+
+        before = dict(mocks.counts)
+        asyncio.run(async_duplicates())
+        calls = _calls(mocks, "vision", before)
+        results.append(_check("async vision", calls == 1,
+                              f"{n} concurrent uploads of one image, {calls} upstream call(s)"))
+    return results
+
+def main(n: int = 50):
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    # A slow upstream so the duplicates overlap
+    mocks = MockServices(openai=LatencyProfile(median=0.2), vision=LatencyProfile(median=0.2)).start()
+    try:
+        results = check_llm(mocks, n) + check_vision(mocks, n)
+    finally:
+        mocks.stop()
+    if not all(results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
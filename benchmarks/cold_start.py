@@ -0,0 +1,115 @@
+# cold_start.py
+"""
+Cold-start latency of the agent-api function app, against the mock services:
+
+  python -m benchmarks.cold_start [--runs 5] [--warm-requests 20] [--connect-delay 0.15] [--gap 0.25]
+
+Each run is a fresh Python process that imports function_app (what the
+Functions worker does when an instance starts), waits --gap seconds (the time
+between the worker loading the app and the first invocation arriving), then
+sends one request followed by --warm-requests more through the WSGI adapter of
+benchmarks/serve.py. The mock adds --connect-delay to every new connection to
+stand in for DNS, TCP and TLS setup to Azure. Configurations compared:
+
+  baseline    streaming route loaded, no pre-dial (the app before the startup settings)
+  predial     the defaults: streaming route loaded, connection pre-dialled while loading
+  fast-start  AGENT_STREAMING=false and pre-dial: no FastAPI import, warm connection
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.load import percentile
+from benchmarks.mock_services import LatencyProfile, MockServices
+from benchmarks.run import backend_env
+from benchmarks.serve import BACKENDS, REPO_ROOT
+
+CONFIGS = {
+    "baseline": {"AGENT_STREAMING": "true", "AGENT_PREDIAL": "false"},
+    "predial": {"AGENT_STREAMING": "true", "AGENT_PREDIAL": "true"},
+    "fast-start": {"AGENT_STREAMING": "false", "AGENT_PREDIAL": "true"},
+}
+
+def child(gap: float, warm_requests: int):
+    """Runs inside the measured process; prints one JSON line of timings."""
+    sys.path.insert(0, BACKENDS["agent-api"])
+    start = time.perf_counter()
+    import function_app
+    import_seconds = time.perf_counter() - start
+
+    from werkzeug.test import Client
+    from benchmarks.serve import function_wsgi_app
+    client = Client(function_wsgi_app(function_app.app))
+    time.sleep(gap)
+
+    def timed_request(i: int) -> float:
+        start = time.perf_counter()
+        response = client.post("/api/agent", json={"message": f"Cold start request {i}"})
+        if response.status_code != 200:
+            raise RuntimeError(f"Request failed with status {response.status_code}")
+        return time.perf_counter() - start
+
+    first = timed_request(0)
+    warm = [timed_request(i + 1) for i in range(warm_requests)]
+    print(json.dumps({"import": import_seconds, "first": first, "warm": warm}))
+
+def measure(config: dict, mock_url: str, runs: int, gap: float, warm_requests: int) -> dict:
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = backend_env(mock_url, workdir)
+        env.update(config)
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.cold_start", "--child", "--gap", str(gap),
+                 "--warm-requests", str(warm_requests)],
+                env=env, cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+    warm = sorted(latency for sample in samples for latency in sample["warm"])
+    return {
+        "import_median": statistics.median(sample["import"] for sample in samples),
+        "first_median": statistics.median(sample["first"] for sample in samples),
+        "warm_p50": percentile(warm, 50),
+        "warm_p99": percentile(warm, 99),
+        "runs": samples,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="agent-api import, first-request and warm-request latency")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per configuration")
+    parser.add_argument("--warm-requests", type=int, default=20)
+    parser.add_argument("--connect-delay", type=float, default=0.15, help="Mock cost of a new connection (s)")
+    parser.add_argument("--gap", type=float, default=0.25, help="Seconds between loading the app and the first request")
+    parser.add_argument("--openai-median", type=float, default=0.2, help="Median mock Azure OpenAI latency (s)")
+    parser.add_argument("--config", choices=list(CONFIGS), action="append", help="Only these configurations")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.gap, args.warm_requests)
+        return
+
+    mocks = MockServices(openai=LatencyProfile(args.openai_median, sigma=0.0),
+                         connect_delay=args.connect_delay).start()
+    results = {}
+    try:
+        for name in args.config or list(CONFIGS):
+            results[name] = measure(CONFIGS[name], mocks.url, args.runs, args.gap, args.warm_requests)
+            result = results[name]
+            print(f"{name:<11} import {result['import_median'] * 1000:7.1f} ms   "
+                  f"first request {result['first_median'] * 1000:7.1f} ms   "
+                  f"warm p50 {result['warm_p50'] * 1000:7.1f} ms   p99 {result['warm_p99'] * 1000:7.1f} ms")
+    finally:
+        mocks.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# context.py
+"""
+Per-request cost of the multi-agent conversation context once a session has
+10k turns, for the bounded ContextManager vs the unbounded list it replaced:
+
+  python -m benchmarks.context [turns]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+class UnboundedContextManager:
+    """The previous implementation: every turn kept, the whole list re-joined on every read."""
+
+    def __init__(self):
+        self.history = []
+
+    def add_interaction(self, interaction: str):
+        self.history.append(interaction)
+
+    def get_context(self) -> str:
+        return "\n".join(self.history)
+
+def request(manager, turn: int, reply: str) -> str:
+    # What one /api/multi-agent request did before: add the user turn, read the context
+    # for the planner and again for the execution agent, then add the reply
+    manager.add_interaction(f"User: question number {turn} about the picture")
+    manager.get_context()
+    context = manager.get_context()
+    manager.add_interaction(f"AI: {reply}")
+    return context
+
+def measure(manager, turns: int = 10000, reply_chars: int = 400, sample: int = 200) -> dict:
+    reply = "lorem ipsum " * (reply_chars // 12)
+    tracemalloc.start()
+    for turn in range(turns // 2):
+        request(manager, turn, reply)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Requests made after the session already holds `turns` turns
+    start = time.perf_counter()
+    for turn in range(sample):
+        context = request(manager, turns // 2 + turn, reply)
+    per_request = (time.perf_counter() - start) / sample
+    return {"per_request_us": per_request * 1e6, "prompt_chars": len(context), "memory_bytes": memory}
+
+def main(turns: int = 10000):
+    sys.path.insert(0, os.path.join(REPO_ROOT, "multi-agent", "backend"))
+    from agents.context_manager import ContextManager
+
+    results = {name: measure(manager, turns) for name, manager in
+               (("unbounded", UnboundedContextManager()), ("bounded", ContextManager()))}
+    for name, result in results.items():
+        print(f"{name:<9} after {turns} turns: {result['per_request_us']:9.1f} us per request, "
+              f"context {result['prompt_chars'] / 1024:8.1f} KiB, history {result['memory_bytes'] / 1024:8.1f} KiB")
+    print(f"{results['unbounded']['per_request_us'] / results['bounded']['per_request_us']:.0f}x faster per request")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
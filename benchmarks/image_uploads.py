@@ -0,0 +1,96 @@
+# image_uploads.py
+"""
+Checks that concurrent image uploads never get each other's image, in both
+backends that analyze an uploaded image (multimodal /api/analyze-image and the
+multi-agent image_analysis plan):
+
+  python -m benchmarks.image_uploads [--requests 200] [--concurrency 50] [--asgi]
+
+Every request uploads its own image (some above Werkzeug's 500 KB in-memory
+limit, so they are spooled to disk, and some repeating an earlier image, so
+they go through the Vision cache) with a prompt naming the request. The mock
+Vision captions each image with a digest of the bytes it received and the mock
+OpenAI echoes the prompt, so each answer must carry its own request's prompt
+and its own image's digest. Exits with status 1 if any check fails.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import sys
+
+import httpx
+
+from benchmarks.mock_services import LatencyProfile, MockServices
+from benchmarks.run import start_backend
+
+ENDPOINTS = {"multimodal": "/api/analyze-image", "multi-agent": "/api/multi-agent"}
+# Werkzeug keeps smaller uploads in memory and spools larger ones to a temporary file
+SIZES = (20 * 1024, 200 * 1024, 700 * 1024, 3 * 1024 * 1024)
+
+def _check(name: str, condition: bool, detail: str) -> bool:
+    print(f"{'ok  ' if condition else 'FAIL'} {name}: {detail}")
+    return condition
+
+def make_images(n: int) -> list:
+    """Random bytes (passed to Vision unchanged); every fifth upload repeats the previous image."""
+    images = []
+    for i in range(n):
+        if i % 5 == 4:
+            images.append(images[-1])
+        else:
+            rng = random.Random(i)
+            images.append(rng.randbytes(SIZES[i % len(SIZES)]))
+    return images
+
+async def upload(client: httpx.AsyncClient, slots: asyncio.Semaphore, url: str, i: int, image: bytes,
+                 results: dict):
+    prompt = f"request {i:05d}"
+    async with slots:
+        try:
+            response = await client.post(url, files={"image": (f"image{i}.jpg", image, "image/jpeg")},
+                                         data={"prompt": prompt}, headers={"X-Session-Id": f"upload{i:05d}"})
+        except httpx.HTTPError as e:
+            results["errors"].append(type(e).__name__)
+            return
+    if response.status_code != 200:
+        results["errors"].append(str(response.status_code))
+        return
+    message = response.json().get("message", "")
+    digest = hashlib.sha256(image).hexdigest()[:16]
+    if f"User prompt: {prompt}" not in message or f"a benchmark image {digest}" not in message:
+        results["mismatched"].append(i)
+
+async def run_uploads(url: str, images: list, concurrency: int) -> dict:
+    results = {"errors": [], "mismatched": []}
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        await asyncio.gather(*[upload(client, slots, url, i, image, results) for i, image in enumerate(images)])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent image uploads must each be analyzed on their own image")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--asgi", action="store_true", help="Serve asgi.py with uvicorn")
+    args = parser.parse_args()
+
+    images = make_images(args.requests)
+    checks = []
+    mocks = MockServices(openai=LatencyProfile(median=0.05), vision=LatencyProfile(median=0.1), echo=True).start()
+    try:
+        for backend, path in ENDPOINTS.items():
+            with start_backend(backend, mocks.url, args.asgi) as (base_url, process):
+                results = asyncio.run(run_uploads(base_url + path, images, args.concurrency))
+            checks.append(_check(backend, not results["errors"] and not results["mismatched"],
+                                 f"{args.requests} uploads, {args.concurrency} at a time: "
+                                 f"{len(results['mismatched'])} answered for another image or prompt, "
+                                 f"{len(results['errors'])} errors"))
+    finally:
+        mocks.stop()
+    if not all(checks):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
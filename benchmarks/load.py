@@ -0,0 +1,115 @@
+# load.py
+"""
+Open-loop and closed-loop load generators.
+
+Requests are sent at Poisson arrival times fixed before the run starts,
+whether or not earlier requests have completed, and each latency is measured
+from the time its request was scheduled. A closed loop (send, wait, send)
+slows down with the server and hides queueing delay (coordinated omission);
+here a stalled server shows up as growing latencies instead of a lower
+request rate. closed_loop() is the other model on purpose: a fixed number of
+clients, each sending its next request as soon as the last one completes,
+which measures the throughput a server sustains with that many concurrent
+connections.
+"""
+import asyncio
+import math
+import random
+import time
+
+import httpx
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, min(len(values), math.ceil(q / 100 * len(values))))
+    return values[rank - 1]
+
+def arrival_times(rate: float, duration: float, rng: random.Random) -> list:
+    times = []
+    t = rng.expovariate(rate)
+    while t < duration:
+        times.append(t)
+        t += rng.expovariate(rate)
+    return times
+
+async def _send(client: httpx.AsyncClient, spec: dict, scheduled: float) -> dict:
+    result = {"status": None, "error": None, "latency": None, "ttfb": None}
+    try:
+        async with client.stream(spec.get("method", "POST"), spec["url"], json=spec.get("json"),
+                                 data=spec.get("data"), files=spec.get("files"),
+                                 headers=spec.get("headers")) as response:
+            result["status"] = response.status_code
+            async for _ in response.aiter_raw():
+                if result["ttfb"] is None:
+                    result["ttfb"] = time.perf_counter() - scheduled
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    result["latency"] = time.perf_counter() - scheduled
+    return result
+
+async def open_loop(make_request, rate: float, duration: float, seed: int = 0, timeout: float = 60.0) -> dict:
+    """
+    Sends make_request(i) (a dict of method, url, json/data/files, headers) at
+    `rate` requests per second on average for `duration` seconds, then waits
+    for the stragglers. Returns the per-request results and the wall time.
+    """
+    rng = random.Random(seed)
+    schedule = arrival_times(rate, duration, rng)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        tasks = []
+        for i, offset in enumerate(schedule):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_send(client, make_request(i), scheduled)))
+        results = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return {"results": results, "elapsed": elapsed, "offered": len(schedule)}
+
+async def closed_loop(make_request, clients: int, duration: float, timeout: float = 60.0) -> dict:
+    """
+    Runs `clients` concurrent clients for `duration` seconds, each sending
+    make_request(i) again as soon as its previous request completes. Latency is
+    measured from each send. Returns results in the same shape as open_loop().
+    """
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    counter = iter(range(1 << 62))
+    results = []
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+
+        async def run_client():
+            while time.perf_counter() < deadline:
+                results.append(await _send(client, make_request(next(counter)), time.perf_counter()))
+
+        await asyncio.gather(*[run_client() for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+    return {"results": results, "elapsed": elapsed, "offered": len(results)}
+
+def summarize(run: dict) -> dict:
+    """Throughput, latency/TTFB percentiles (ms) and status counts of an open_loop or closed_loop run."""
+    results = run["results"]
+    ok = [r for r in results if r["status"] is not None and r["status"] < 400]
+    statuses = {}
+    for r in results:
+        key = str(r["status"]) if r["status"] is not None else r["error"]
+        statuses[key] = statuses.get(key, 0) + 1
+    latencies = sorted(r["latency"] * 1000 for r in ok)
+    ttfbs = sorted(r["ttfb"] * 1000 for r in ok if r["ttfb"] is not None)
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "throughput_rps": round(len(ok) / run["elapsed"], 2) if run["elapsed"] else 0.0,
+        "statuses": statuses,
+    }
+    for name, values in (("latency_ms", latencies), ("ttfb_ms", ttfbs)):
+        summary[name] = {f"p{q}": round(percentile(values, q), 1) if values else None for q in (50, 95, 99)}
+        summary[name]["max"] = round(values[-1], 1) if values else None
+    return summary
@@ -0,0 +1,220 @@
+# mock_services.py
+"""
+Local stand-ins for the Azure services the backends call, so they can be load
+tested offline:
+
+  POST /openai/deployments/<deployment>/chat/completions   Azure OpenAI (JSON or SSE streaming)
+  POST /computervision/imageanalysis:analyze               Azure AI Vision image analysis
+  POST /logic-app                                          Logic App HTTP trigger
+
+Every request waits for a latency drawn from a log-normal distribution and
+fails with the configured probability (429 with Retry-After, or 500), so retry
+and tail-latency behaviour can be exercised. Run standalone with
+python -m benchmarks.mock_services [port].
+"""
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class LatencyProfile:
+    """Log-normal latency with the given median and spread (sigma of the underlying normal)."""
+
+    def __init__(self, median: float = 0.2, sigma: float = 0.5, error_rate: float = 0.0,
+                 throttle_share: float = 0.5):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+        # Share of errors that are 429s (the rest are 500s)
+        self.throttle_share = throttle_share
+
+    def sample(self, rng: random.Random) -> float:
+        return self.median * rng.lognormvariate(0, self.sigma) if self.median > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+class MockServices:
+    def __init__(self, openai: LatencyProfile = None, vision: LatencyProfile = None,
+                 logic_app: LatencyProfile = None, stream_chunks: int = 20, chunk_interval: float = 0.01,
+                 completion_words: int = 60, seed: int = 0, port: int = 0, connect_delay: float = 0.0,
+                 echo: bool = False):
+        self.profiles = {
+            "openai": openai or LatencyProfile(),
+            "vision": vision or LatencyProfile(median=0.3),
+            "logic_app": logic_app or LatencyProfile(median=0.1),
+        }
+        self.stream_chunks = stream_chunks
+        self.chunk_interval = chunk_interval
+        self.completion_words = completion_words
+        # Added to every new connection, standing in for DNS, TCP and TLS setup to a remote region
+        self.connect_delay = connect_delay
+        # Append the last user message to completions, so a check can tell which prompt an answer is for
+        self.echo = echo
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.counts = {name: 0 for name in self.profiles}
+        self.errors = {name: 0 for name in self.profiles}
+        # Payloads the Logic App accepted, for delivery checks
+        self.logic_app_payloads = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "MockServices":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-services", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        return {"requests": dict(self.counts), "errors": dict(self.errors),
+                "profiles": {name: profile.to_dict() for name, profile in self.profiles.items()}}
+
+    def _draw(self, service: str):
+        """Returns (latency, error status or None) for one request."""
+        profile = self.profiles[service]
+        with self._rng_lock:
+            self.counts[service] += 1
+            latency = profile.sample(self._rng)
+            failed = self._rng.random() < profile.error_rate
+            throttled = self._rng.random() < profile.throttle_share
+        if not failed:
+            return latency, None
+        with self._rng_lock:
+            self.errors[service] += 1
+        return latency, 429 if throttled else 500
+
+    def _completion(self, messages: list) -> str:
+        text = " ".join(["benchmark"] * self.completion_words)
+        user_messages = [m.get("content", "") for m in messages if m.get("role") == "user"]
+        if self.echo and user_messages:
+            text += " " + str(user_messages[-1])
+        return text
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without this, keep-alive responses stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                time.sleep(services.connect_delay)
+                super().setup()
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict, headers: dict = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_error(self, status: int):
+                headers = {"Retry-After": "0"} if status == 429 else None
+                self._send_json(status, {"error": {"code": str(status), "message": "Mock failure"}}, headers)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                path = self.path.split("?")[0]
+                if "/chat/completions" in path:
+                    self._openai(body)
+                elif path.endswith("/imageanalysis:analyze"):
+                    self._vision(body)
+                elif path == "/logic-app":
+                    self._logic_app(body)
+                else:
+                    self._send_json(404, {"error": "Unknown mock route"})
+
+            def do_GET(self):
+                # What a connection pre-dial gets from the resource root
+                self._send_json(404, {"error": "Unknown mock route"})
+
+            def _openai(self, body: bytes):
+                latency, error = services._draw("openai")
+                time.sleep(latency)
+                if error:
+                    return self._send_error(error)
+                request = json.loads(body or b"{}")
+                text = services._completion(request.get("messages", []))
+                if not request.get("stream"):
+                    return self._send_json(200, {
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                     "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": len(json.dumps(request.get("messages", []))) // 4,
+                                  "completion_tokens": services.completion_words},
+                    })
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = text.split(" ")
+                per_chunk = max(1, len(words) // services.stream_chunks)
+                # Azure's first chunk carries no choices (content filter results)
+                pieces = ['{"choices": []}']
+                for i in range(0, len(words), per_chunk):
+                    content = " ".join(words[i:i + per_chunk]) + " "
+                    pieces.append(json.dumps({"choices": [{"index": 0, "delta": {"content": content}}]}))
+                pieces.append("[DONE]")
+                for piece in pieces:
+                    data = f"data: {piece}\n\n".encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                    time.sleep(services.chunk_interval)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _vision(self, body: bytes):
+                latency, error = services._draw("vision")
+                time.sleep(latency)
+                if error:
+                    return self._send_error(error)
+                self._send_json(200, {
+                    "modelVersion": "2023-10-01",
+                    "metadata": {"width": 640, "height": 480},
+                    # The caption names the image bytes received, so answers can be matched to uploads
+                    "captionResult": {"text": f"a benchmark image {hashlib.sha256(body).hexdigest()[:16]}",
+                                      "confidence": 0.9},
+                    "tagsResult": {"values": [{"name": "benchmark", "confidence": 0.9},
+                                              {"name": "test", "confidence": 0.8}]},
+                    "objectsResult": {"values": [{"boundingBox": {"x": 0, "y": 0, "w": 10, "h": 10},
+                                                  "tags": [{"name": "object", "confidence": 0.7}]}]},
+                })
+
+            def _logic_app(self, body: bytes):
+                latency, error = services._draw("logic_app")
+                time.sleep(latency)
+                if error:
+                    return self._send_error(error)
+                with services._rng_lock:
+                    services.logic_app_payloads.append(json.loads(body))
+                self._send_json(202, {"status": "accepted"})
+
+        return Handler
+
+if __name__ == "__main__":
+    services = MockServices(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8900).start()
+    print(f"Mock Azure services listening on {services.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
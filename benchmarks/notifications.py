@@ -0,0 +1,169 @@
+# notifications.py
+"""
+Checks the escalation notification dispatcher (customer-support/backend/notification.py)
+against the mock Logic App:
+
+  python -m benchmarks.notifications [notifications]
+
+submit() must return without waiting for the Logic App; every notification
+must be delivered exactly once, on its own, despite throttled calls; identical
+pending messages are coalesced and notifications sharing a batch key are
+merged; two dispatchers recovering the same spool (two worker processes
+restarting) must not send anything twice; invalid spool files are moved aside
+and stale claims are sent again; pending notifications keep their status
+however many finished ones push out of the status table. Exits with status 1 if any check fails.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_services import LatencyProfile, MockServices
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def _check(name: str, condition: bool, detail: str) -> bool:
+    print(f"{'ok  ' if condition else 'FAIL'} {name}: {detail}")
+    return condition
+
+def _wait(dispatchers: list, ids: list, timeout: float = 120.0) -> dict:
+    """Waits until every notification has a final status in one of the dispatchers; returns the statuses."""
+    from notification import FINAL_STATUSES
+    deadline = time.monotonic() + timeout
+    while True:
+        statuses = {}
+        for notification_id in ids:
+            found = [d.status(notification_id) for d in dispatchers]
+            found = [s["status"] for s in found if s is not None]
+            # A notification handed off by one dispatcher is settled by the other
+            settled = [s for s in found if s != "handed_off"] or found
+            statuses[notification_id] = settled[0] if settled else None
+        if all(s in FINAL_STATUSES for s in statuses.values()) or time.monotonic() > deadline:
+            return statuses
+        time.sleep(0.05)
+
+def _deliveries(mocks: MockServices, since: int) -> list:
+    return [payload["body"] for payload in mocks.logic_app_payloads[since:]]
+
+def _spool_item(spool_dir: str, notification_id: str, message: str):
+    with open(os.path.join(spool_dir, f"{notification_id}.json"), "w") as f:
+        json.dump({"id": notification_id, "message": message, "created": time.time()}, f)
+
+def check_dispatch(mocks: MockServices, workdir: str, n: int) -> list:
+    from notification import NotificationDispatcher
+    results = []
+    dispatcher = NotificationDispatcher(os.path.join(workdir, "spool"), workers=4)
+
+    since = len(mocks.logic_app_payloads)
+    messages = [f"Escalated Query (URGENT): order {i} never arrived" for i in range(n)]
+    submit_times = []
+    ids = []
+    for message in messages:
+        start = time.perf_counter()
+        ids.append(dispatcher.submit(message))
+        submit_times.append(time.perf_counter() - start)
+    results.append(_check("submit returns at once", max(submit_times) < 0.05,
+                          f"slowest of {n} submits took {max(submit_times) * 1000:.1f} ms"))
+
+    statuses = _wait([dispatcher], ids)
+    delivered = _deliveries(mocks, since)
+    sent = sum(1 for s in statuses.values() if s == "sent")
+    once = all(delivered.count(message) == 1 for message in messages)
+    results.append(_check("delivered exactly once, unmerged", sent == n and once and len(delivered) == n,
+                          f"{sent}/{n} sent in {len(delivered)} Logic App calls, "
+                          f"{mocks.errors['logic_app']} throttled calls retried"))
+
+    # Identical pending messages share one notification
+    since = len(mocks.logic_app_payloads)
+    first = dispatcher.submit("Escalated Query (URGENT): duplicate")
+    second = dispatcher.submit("Escalated Query (URGENT): duplicate")
+    _wait([dispatcher], [first])
+    delivered = _deliveries(mocks, since)
+    results.append(_check("coalescing", first == second and len(delivered) == 1,
+                          f"2 identical submits, {len(delivered)} Logic App call(s)"))
+
+    # One customer's notifications picked up together (by the one worker here) go out as one message
+    single = NotificationDispatcher(os.path.join(workdir, "single-worker-spool"), workers=1)
+    since = len(mocks.logic_app_payloads)
+    grouped = [single.submit(f"Escalated Query: follow-up {i}", batch_key="customer-1") for i in range(3)]
+    _wait([single], grouped)
+    delivered = _deliveries(mocks, since)
+    results.append(_check("batch key", len(delivered) == 1 and all(f"follow-up {i}" in delivered[0] for i in range(3)),
+                          f"3 notifications with one batch key, {len(delivered)} Logic App call(s)"))
+    return results
+
+def check_recovery(mocks: MockServices, workdir: str, n: int) -> list:
+    from notification import NotificationDispatcher
+    results = []
+    spool_dir = os.path.join(workdir, "shared-spool")
+    os.makedirs(os.path.join(spool_dir, "sending"))
+    messages = {f"spooled{i:04d}": f"Escalated Query (URGENT): spooled {i}" for i in range(n)}
+    for notification_id, message in messages.items():
+        _spool_item(spool_dir, notification_id, message)
+    # A claim left behind by a process that died mid-send
+    _spool_item(os.path.join(spool_dir, "sending"), "stale", "Escalated Query (URGENT): stale claim")
+    os.utime(os.path.join(spool_dir, "sending", "stale.json"), (0, 0))
+    messages["stale"] = "Escalated Query (URGENT): stale claim"
+    with open(os.path.join(spool_dir, "no-id.json"), "w") as f:
+        json.dump({"message": "no id"}, f)
+    with open(os.path.join(spool_dir, "garbage.json"), "w") as f:
+        f.write("{not json")
+
+    # Two worker processes restarting on the same spool both re-queue everything in it
+    since = len(mocks.logic_app_payloads)
+    dispatchers = [NotificationDispatcher(spool_dir, workers=2), NotificationDispatcher(spool_dir, workers=2)]
+    statuses = _wait(dispatchers, list(messages))
+    delivered = _deliveries(mocks, since)
+    once = all(delivered.count(message) == 1 for message in messages.values())
+    sent = sum(1 for s in statuses.values() if s == "sent")
+    results.append(_check("shared spool", once and sent == len(messages) and len(delivered) == len(messages),
+                          f"{len(messages)} spooled notifications re-queued by 2 dispatchers, "
+                          f"{len(delivered)} Logic App calls"))
+
+    invalid = sorted(os.listdir(os.path.join(spool_dir, "invalid")))
+    left = [name for name in os.listdir(spool_dir) if name.endswith(".json")]
+    left += os.listdir(os.path.join(spool_dir, "sending"))
+    results.append(_check("invalid spool files", invalid == ["garbage.json", "no-id.json"] and not left,
+                          f"moved aside: {invalid}, left in the spool: {left}"))
+    return results
+
+def check_status_table(workdir: str, n: int) -> list:
+    import notification
+    from notification import NotificationDispatcher
+    limit = notification.MAX_TRACKED_STATUSES
+    notification.MAX_TRACKED_STATUSES = n // 10
+    try:
+        # No workers, so the first submits stay queued while the later ones finish
+        dispatcher = NotificationDispatcher(os.path.join(workdir, "status-spool"), workers=0)
+        pending = [dispatcher.submit(f"Escalated Query (URGENT): pending {i}") for i in range(n // 10)]
+        finished = [dispatcher.submit(f"Escalated Query (URGENT): finished {i}") for i in range(n)]
+        for notification_id in finished:
+            dispatcher._update(notification_id, status="sent")
+    finally:
+        notification.MAX_TRACKED_STATUSES = limit
+    queued = sum(1 for i in pending if (dispatcher.status(i) or {}).get("status") == "queued")
+    kept = sum(1 for i in finished if dispatcher.status(i) is not None)
+    return [_check("status table", queued == len(pending) and kept == n // 10,
+                   f"{queued}/{len(pending)} pending notifications still tracked after {n} finished ones, "
+                   f"{kept} finished statuses kept (limit {n // 10})")]
+
+def main(n: int = 100):
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, os.path.join(REPO_ROOT, "customer-support", "backend"))
+    # About a third of Logic App calls are throttled, so deliveries need retries
+    mocks = MockServices(logic_app=LatencyProfile(median=0.05, error_rate=0.3, throttle_share=1.0)).start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.environ.update(NOTIFICATION_SPOOL_DIR=os.path.join(workdir, "default-spool"),
+                              NOTIFICATION_BATCH_WINDOW="0.2", NOTIFICATION_MAX_ATTEMPTS="10",
+                              LOGIC_APP_TRIGGER_URL=f"{mocks.url}/logic-app")
+            results = (check_dispatch(mocks, workdir, n) + check_recovery(mocks, workdir, n)
+                       + check_status_table(workdir, n))
+    finally:
+        mocks.stop()
+    if not all(results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
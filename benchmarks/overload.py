@@ -0,0 +1,111 @@
+# overload.py
+"""
+Latency of escalation-bound customer-service queries when the backend is
+overloaded, with and without admission control (customer-support/backend/admission.py):
+
+  python -m benchmarks.overload [--overload 5] [--concurrency 8] [--openai-median 0.5] [--duration 10] [--asgi]
+
+Upstream capacity is set by LLM_MAX_CONCURRENCY (--concurrency calls in
+flight, each taking about --openai-median seconds at the mock), and the load
+is --overload times that capacity. One request in ten is urgent (answered with
+the urgent reply without calling the LLM), one is a complaint (high priority,
+answered by the LLM), three are routine questions with a partial FAQ match
+(which can be answered in degraded mode) and five are routine questions only
+the LLM can answer. The baseline run
+sets the admission limits so high that every request queues, first come first
+served, on the LLM client's own concurrency limit, as before admission control.
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.load import open_loop, percentile
+from benchmarks.mock_services import LatencyProfile, MockServices
+from benchmarks.run import start_backend
+
+def query_class(i: int) -> str:
+    if i % 10 == 0:
+        return "urgent"
+    if i % 10 == 1:
+        return "complaint"
+    if i % 10 <= 4:
+        return "degradable"
+    return "routine"
+
+def make_query(i: int) -> dict:
+    kind = query_class(i)
+    if kind == "urgent":
+        query = f"This is urgent, order {i} never arrived"
+    elif kind == "complaint":
+        query = f"I have a complaint, order {i} arrived damaged and nobody answered my emails"
+    elif kind == "degradable":
+        query = f"Can I return order {i} without a receipt?"
+    else:
+        query = f"Can you help me with order number {i} and its delivery options?"
+    return {"json": {"query": query}}
+
+def summarize_classes(results: list) -> dict:
+    classes = {}
+    for i, result in enumerate(results):
+        entry = classes.setdefault(query_class(i), {"latencies": [], "statuses": {}})
+        status = str(result["status"]) if result["status"] is not None else result["error"]
+        entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+        if result["status"] == 200:
+            entry["latencies"].append(result["latency"] * 1000)
+    summary = {}
+    for name, entry in sorted(classes.items()):
+        latencies = sorted(entry["latencies"])
+        summary[name] = {
+            "requests": sum(entry["statuses"].values()),
+            "statuses": entry["statuses"],
+            "p50_ms": round(percentile(latencies, 50), 1) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99), 1) if latencies else None,
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Escalation-bound query latency under overload, with and without admission control")
+    parser.add_argument("--overload", type=float, default=5.0, help="Offered load as a multiple of upstream capacity")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight (the upstream capacity)")
+    parser.add_argument("--openai-median", type=float, default=0.5, help="Median mock Azure OpenAI latency (s)")
+    parser.add_argument("--target-delay", type=float, default=1.0, help="ADMISSION_TARGET_DELAY (s)")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--asgi", action="store_true", help="Serve asgi.py with uvicorn")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    capacity = args.concurrency / args.openai_median
+    rate = args.overload * capacity
+    print(f"capacity ~{capacity:.0f} LLM calls/s, offering {rate:.0f} requests/s for {args.duration:.0f}s")
+    configs = {
+        "no admission control": {"ADMISSION_MAX_CONCURRENCY": "100000", "ADMISSION_MAX_QUEUE": "100000"},
+        "admission control": {"ADMISSION_MAX_CONCURRENCY": str(args.concurrency),
+                              "ADMISSION_TARGET_DELAY": str(args.target_delay)},
+    }
+
+    mocks = MockServices(openai=LatencyProfile(args.openai_median, sigma=0.3)).start()
+    results = {}
+    try:
+        for name, env in configs.items():
+            env = dict(env, LLM_MAX_CONCURRENCY=str(args.concurrency), LLM_MAX_RETRIES="0")
+            with start_backend("customer-support", mocks.url, args.asgi, env=env) as (base_url, _):
+                run = asyncio.run(open_loop(
+                    lambda i: dict(make_query(i), url=f"{base_url}/api/customer-service"),
+                    rate, args.duration, timeout=args.timeout))
+            results[name] = summarize_classes(run["results"])
+    finally:
+        mocks.stop()
+
+    for name, classes in results.items():
+        print(f"\n{name}")
+        for kind, summary in classes.items():
+            print(f"  {kind:<11} {summary['requests']:5d} requests  p50 {summary['p50_ms']} ms  "
+                  f"p99 {summary['p99_ms']} ms  {summary['statuses']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# payload.py
+"""
+Bytes on the wire for the context/knowledge part of multi-agent
+/api/multi-agent responses over a long session, with full snapshots vs deltas:
+
+  python -m benchmarks.payload [turns]
+"""
+import json
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def measure(turns: int = 500, reply_chars: int = 400, image_every: int = 10) -> dict:
+    from agents.knowledge_manager import KnowledgeManager
+    from agents.session_store import SessionStore
+    totals = {}
+    for mode in ("full", "delta"):
+        store = SessionStore(shards=1)
+        knowledge = KnowledgeManager()
+        # An empty version is what a new client sends to get the context as turns
+        versions = {} if mode == "full" else {"context_version": "", "knowledge_version": ""}
+        total = 0
+        for turn in range(turns):
+            store.add_interaction("measure", f"User: question number {turn} about the picture")
+            reply = f"Answer {turn}: " + "lorem ipsum " * (reply_chars // 12)
+            if turn % image_every == 0:
+                knowledge.add_knowledge("latest_image_analysis", reply)
+            store.add_interaction("measure", f"AI: {reply}")
+            # Same fields as finish_turn in agents/turns.py
+            payload = {
+                "message": reply,
+                **store.context_payload("measure", versions.get("context_version")),
+                **knowledge.knowledge_payload(versions.get("knowledge_version")),
+                "session_id": "measure",
+            }
+            total += len(json.dumps(payload).encode("utf-8"))
+            if mode == "delta":
+                versions = {key: payload[key] for key in ("context_version", "knowledge_version")}
+        totals[mode] = total
+    return totals
+
+def main(turns: int = 500):
+    sys.path.insert(0, os.path.join(REPO_ROOT, "multi-agent", "backend"))
+    totals = measure(turns)
+    print(f"{turns} turns: full snapshots {totals['full'] / 1024:.0f} KiB, "
+          f"deltas {totals['delta'] / 1024:.0f} KiB ({totals['full'] / totals['delta']:.1f}x less)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
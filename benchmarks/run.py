@@ -0,0 +1,300 @@
+# run.py
+"""
+Load tests the backends against the local mock Azure services:
+
+  python -m benchmarks.run [--scenario NAME ...] [--rate 20] [--duration 30] [--asgi]
+                           [--clients 50,200,1000]
+                           [--openai-median 0.2] [--error-rate 0.0] [--compare results/old.json]
+
+Each scenario starts its backend in a fresh subprocess pointed at the mocks,
+drives one endpoint with open-loop Poisson load (see load.py), or with
+--clients with that many closed-loop clients per run, samples the
+server's resident memory while it runs and reports throughput, p50/p95/p99
+latency and time to first byte, error counts and memory growth. Results are
+written to benchmarks/results/<timestamp>.json; --compare prints the change
+against an earlier results file so regressions stand out.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.load import closed_loop, open_loop, summarize
+from benchmarks.mock_services import LatencyProfile, MockServices
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow random bytes are uploaded (the backends pass unreadable images through)
+    Image = None
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+MEMORY_SAMPLE_INTERVAL = 0.25
+
+def _query(i: int) -> dict:
+    """Mostly distinct questions (cache misses), some FAQ hits and the occasional urgent escalation."""
+    if i % 20 == 0:
+        query = f"This is urgent, order {i} never arrived"
+    elif i % 5 == 0:
+        query = "What are your business hours?"
+    else:
+        query = f"Can you help me with order number {i} and its delivery options?"
+    return {"json": {"query": query}}
+
+def _feedback(i: int) -> dict:
+    return {"json": {"query": f"Question {i % 50}", "ai_response": "Answer", "feedback": "Helpful" if i % 3 else "Not helpful"}}
+
+def _chat(i: int) -> dict:
+    return {"json": {"message": f"Tell me something interesting about the number {i}"}}
+
+def _chat_stream(i: int) -> dict:
+    return {"json": {"message": f"Tell me something interesting about the number {i}", "stream": True}}
+
+def make_image(i: int) -> bytes:
+    """A distinct 64x64 noise image per request, so the vision cache does not absorb the load."""
+    rng = random.Random(i)
+    if Image is None:
+        return rng.randbytes(64 * 64 * 3)
+    image = Image.frombytes("RGB", (64, 64), rng.randbytes(64 * 64 * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _analyze_image(i: int) -> dict:
+    return {"files": {"image": (f"image{i}.png", make_image(i), "image/png")},
+            "data": {"prompt": "Describe this image in detail."}}
+
+def _analyze_images(i: int) -> dict:
+    # Eight distinct images per request, combined into one answer
+    return {"files": [("images", (f"image{i}_{n}.png", make_image(i * 8 + n), "image/png")) for n in range(8)],
+            "data": {"prompt": "Describe these images."}}
+
+def _multi_agent(i: int) -> dict:
+    # 20 sessions, so context and knowledge grow over the run
+    return {"json": {"message": f"Question {i}: explain the difference between lists and tuples"},
+            "headers": {"X-Session-Id": f"bench{i % 20}"}}
+
+def _multi_agent_image(i: int) -> dict:
+    return {"files": {"image": (f"image{i}.png", make_image(i), "image/png")},
+            "data": {"message": "What is in this picture?", "prompt": "Describe this image in detail."},
+            "headers": {"X-Session-Id": f"bench{i % 20}"}}
+
+def _agent(i: int) -> dict:
+    return {"json": {"message": f"Summarise the number {i} in one sentence"}}
+
+SCENARIOS = {
+    "customer-service": {"backend": "customer-support", "path": "/api/customer-service", "body": _query},
+    "feedback": {"backend": "customer-support", "path": "/api/feedback", "body": _feedback},
+    "chat": {"backend": "multimodal", "path": "/api/chat", "body": _chat},
+    "chat-stream": {"backend": "multimodal", "path": "/api/chat", "body": _chat_stream},
+    "analyze-image": {"backend": "multimodal", "path": "/api/analyze-image", "body": _analyze_image},
+    "analyze-images": {"backend": "multimodal", "path": "/api/analyze-images", "body": _analyze_images},
+    "multi-agent": {"backend": "multi-agent", "path": "/api/multi-agent", "body": _multi_agent},
+    "multi-agent-image": {"backend": "multi-agent", "path": "/api/multi-agent", "body": _multi_agent_image},
+    "agent": {"backend": "agent-api", "path": "/api/agent", "body": _agent, "asgi": False},
+}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode} before it started listening")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Backend did not start listening on port {port} within {timeout} seconds")
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of a process (Linux only; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def backend_env(mock_url: str, workdir: str) -> dict:
+    """Points every backend at the mocks, and their on-disk state at a scratch directory."""
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": mock_url,
+        "AZURE_OPENAI_KEY": "benchmark",
+        "AZURE_OPENAI_DEPLOYMENT": "benchmark",
+        "AZURE_VISION_ENDPOINT": mock_url,
+        "AZURE_VISION_KEY": "benchmark",
+        "OPENAI_API_KEY": "benchmark",
+        "LOGIC_APP_TRIGGER_URL": f"{mock_url}/logic-app",
+        "FEEDBACK_FILE": os.path.join(workdir, "feedbacks.jsonl"),
+        "NOTIFICATION_SPOOL_DIR": os.path.join(workdir, "notification_spool"),
+        "VISION_CACHE_PATH": os.path.join(workdir, "vision_cache.sqlite"),
+        "PYTHONPATH": os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+    })
+    return env
+
+@contextlib.contextmanager
+def start_backend(backend: str, mock_url: str, asgi: bool = False, verbose: bool = False, env: dict = None):
+    """Runs a backend in a subprocess pointed at the mocks (plus any env overrides); yields (base URL, process)."""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        command = [sys.executable, "-m", "benchmarks.serve", backend, str(port)] + (["--asgi"] if asgi else [])
+        process = subprocess.Popen(command, env=dict(backend_env(mock_url, workdir), **(env or {})),
+                                   stdout=subprocess.DEVNULL, stderr=None if verbose else subprocess.DEVNULL)
+        try:
+            wait_for_port(port, process)
+            yield f"http://127.0.0.1:{port}", process
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+async def _run_load(spec: dict, url: str, pid: int, args, clients: int = None) -> tuple:
+    samples = []
+
+    async def sample_memory():
+        while True:
+            samples.append(rss_mb(pid))
+            await asyncio.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    def make_request(i: int) -> dict:
+        return {"method": "POST", "url": url, **spec["body"](i)}
+
+    sampler = asyncio.create_task(sample_memory())
+    try:
+        if clients:
+            run = await closed_loop(make_request, clients, args.duration, timeout=args.timeout)
+        else:
+            run = await open_loop(make_request, args.rate, args.duration, seed=args.seed, timeout=args.timeout)
+    finally:
+        sampler.cancel()
+    return run, [s for s in samples if s is not None]
+
+def run_scenario(name: str, mocks: MockServices, args, clients: int = None) -> dict:
+    spec = SCENARIOS[name]
+    asgi = args.asgi and spec.get("asgi", True)
+    before = mocks.stats()
+    with start_backend(spec["backend"], mocks.url, asgi, args.verbose) as (base_url, process):
+        rss_start = rss_mb(process.pid)
+        run, samples = asyncio.run(_run_load(spec, base_url + spec["path"], process.pid, args, clients))
+        rss_end = rss_mb(process.pid)
+
+    after = mocks.stats()
+    result = summarize(run)
+    result.update({
+        "backend": spec["backend"],
+        "path": spec["path"],
+        "server": "asgi" if asgi else "wsgi",
+        "offered_rps": None if clients else args.rate,
+        "clients": clients,
+        "memory_mb": {
+            "start": round(rss_start, 1) if rss_start else None,
+            "end": round(rss_end, 1) if rss_end else None,
+            "peak": round(max(samples), 1) if samples else None,
+            "growth": round(rss_end - rss_start, 1) if rss_start and rss_end else None,
+        },
+        "upstream_calls": {service: after["requests"][service] - before["requests"][service]
+                           for service in after["requests"]},
+    })
+    return result
+
+def compare(old: dict, new: dict):
+    """Prints the change of the headline numbers for the scenarios in both runs."""
+    metrics = (("throughput_rps", None), ("latency_ms", "p50"), ("latency_ms", "p95"), ("latency_ms", "p99"),
+               ("ttfb_ms", "p50"), ("error_rate", None), ("memory_mb", "growth"))
+    for name, current in new["scenarios"].items():
+        previous = old.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        print(f"{name}:")
+        for metric, key in metrics:
+            before = previous.get(metric) if key is None else (previous.get(metric) or {}).get(key)
+            after = current.get(metric) if key is None else (current.get(metric) or {}).get(key)
+            if before is None or after is None:
+                continue
+            change = f"{(after - before) / before:+.1%}" if before else "n/a"
+            print(f"  {metric + ('.' + key if key else ''):<20} {before:>10} -> {after:<10} ({change})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load tests against mock Azure services")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable; default: all)")
+    parser.add_argument("--rate", type=float, default=20.0, help="Offered load in requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load per scenario")
+    parser.add_argument("--clients", help="Comma-separated closed-loop client counts (e.g. 50,200,1000) "
+                                          "to run each scenario at instead of --rate")
+    parser.add_argument("--asgi", action="store_true", help="Serve the backends' asgi.py with uvicorn")
+    parser.add_argument("--openai-median", type=float, default=0.2, help="Median mock Azure OpenAI latency (s)")
+    parser.add_argument("--vision-median", type=float, default=0.3, help="Median mock Vision latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Log-normal spread of the mock latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock calls that fail (429/500)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the backends' logs")
+    args = parser.parse_args()
+
+    mocks = MockServices(
+        openai=LatencyProfile(args.openai_median, args.sigma, args.error_rate),
+        vision=LatencyProfile(args.vision_median, args.sigma, args.error_rate),
+        logic_app=LatencyProfile(0.1, args.sigma, args.error_rate),
+        seed=args.seed,
+    ).start()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose")},
+        "mocks": mocks.stats()["profiles"],
+        "scenarios": {},
+    }
+    try:
+        client_counts = [int(count) for count in args.clients.split(",")] if args.clients else [None]
+        for scenario in args.scenario or list(SCENARIOS):
+            for clients in client_counts:
+                name = f"{scenario}@{clients}" if clients else scenario
+                load = f"{clients} clients" if clients else f"{args.rate} req/s"
+                print(f"Running {name} at {load} for {args.duration}s...")
+                try:
+                    result = run_scenario(scenario, mocks, args, clients)
+                except Exception as e:
+                    print(f"  failed: {str(e)}")
+                    report["scenarios"][name] = {"error": str(e)}
+                    continue
+                report["scenarios"][name] = result
+                latency = result["latency_ms"]
+                print(f"  {result['throughput_rps']} req/s ok, p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+                      f"p99 {latency['p99']} ms, errors {result['error_rate']:.1%}, "
+                      f"memory +{result['memory_mb']['growth']} MB")
+    finally:
+        mocks.stop()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# serve.py
+"""
+Runs one backend on a local port for the load tests (started as a subprocess
+by run.py, so its memory can be measured on its own):
+
+  python -m benchmarks.serve <backend> <port> [--asgi]
+
+Flask apps are served by a threaded Werkzeug server (what app.run does, minus
+the debugger and reloader); --asgi serves the backend's asgi.py with uvicorn.
+The agent-api function is called through a small WSGI adapter that turns the
+request into an azure.functions.HttpRequest, so no Functions host is needed.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+BACKENDS = {
+    "customer-support": os.path.join(REPO_ROOT, "customer-support", "backend"),
+    "multimodal": os.path.join(REPO_ROOT, "multimodal", "backend"),
+    "multi-agent": os.path.join(REPO_ROOT, "multi-agent", "backend"),
+    "agent-api": os.path.join(REPO_ROOT, "agent-api"),
+}
+
+def function_wsgi_app(function_app):
+    """WSGI app dispatching /api/<route> to the matching synchronous function of a FunctionApp."""
+    import azure.functions as func
+
+    handlers = {}
+    for function in function_app.get_functions():
+        # Timer and warm-up triggers have no route
+        route = getattr(function.get_trigger(), "route", None)
+        if route is None:
+            continue
+        user_function = function.get_user_function()
+        # Async routes need the streams extension's request type; only plain handlers are served
+        if not hasattr(user_function, "__code__") or user_function.__code__.co_flags & 0x80:
+            continue
+        handlers[f"/api/{route}"] = user_function
+
+    def wsgi_app(environ, start_response):
+        from werkzeug.wrappers import Request, Response
+        request = Request(environ)
+        handler = handlers.get(request.path)
+        if handler is None:
+            response = Response("Not found", status=404)
+        else:
+            result = handler(func.HttpRequest(
+                method=request.method,
+                url=request.url,
+                headers=dict(request.headers),
+                params=dict(request.args),
+                body=request.get_data(),
+            ))
+            response = Response(result.get_body(), status=result.status_code,
+                                mimetype=result.mimetype, headers=dict(result.headers))
+        return response(environ, start_response)
+
+    return wsgi_app
+
+def serve(backend: str, port: int, asgi: bool = False):
+    backend_dir = BACKENDS[backend]
+    os.chdir(backend_dir)
+    sys.path.insert(0, backend_dir)
+
+    if asgi:
+        import uvicorn
+        uvicorn.run("asgi:app", host="127.0.0.1", port=port, log_level="warning")
+        return
+
+    from werkzeug.serving import make_server
+    if backend == "agent-api":
+        import function_app
+        wsgi_app = function_wsgi_app(function_app.app)
+    else:
+        import app
+        wsgi_app = app.app
+    make_server("127.0.0.1", port, wsgi_app, threaded=True).serve_forever()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in BACKENDS:
+        print(f"Usage: python -m benchmarks.serve <{'|'.join(BACKENDS)}> <port> [--asgi]")
+        sys.exit(1)
+    serve(sys.argv[1], int(sys.argv[2]), asgi="--asgi" in sys.argv[3:])
@@ -0,0 +1,117 @@
+# sessions.py
+"""
+Load test of the multi-agent backend's session store with thousands of
+concurrent conversations:
+
+  python -m benchmarks.sessions [--sessions 2000] [--turns 5] [--memory-cap 100000] [--no-spill] [--asgi]
+
+Each simulated user sends --turns messages one after another on its own
+X-Session-Id, with a random pause between them, and all users run at once.
+--memory-cap (SESSION_MEMORY_CAP_TOKENS) is set well below what the sessions
+need, so the least recently used ones are evicted across shards and, unless
+--no-spill, spilled to SQLite and loaded back on their next turn. Every
+response's context is checked: it must hold only the session's own turns, in
+order, and with spilling none of them may be lost. Exits with status 1 if any
+check fails.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load import percentile
+from benchmarks.mock_services import LatencyProfile, MockServices
+from benchmarks.run import rss_mb, start_backend
+
+USER_TURN_RE = re.compile(r"^User: \[(\S+)\] turn (\d+)$", re.MULTILINE)
+
+async def converse(client: httpx.AsyncClient, slots: asyncio.Semaphore, url: str, session_id: str, turns: int,
+                   think: float, rng: random.Random, results: dict):
+    for turn in range(turns):
+        await asyncio.sleep(rng.uniform(0, think))
+        start = time.perf_counter()
+        try:
+            # Queue for a connection here: httpx's pool gets slow with thousands of requests waiting in it
+            async with slots:
+                response = await client.post(url, json={"message": f"[{session_id}] turn {turn}"},
+                                             headers={"X-Session-Id": session_id})
+        except httpx.HTTPError as e:
+            results["errors"].append(type(e).__name__)
+            continue
+        results["latencies"].append(time.perf_counter() - start)
+        if response.status_code != 200:
+            results["errors"].append(str(response.status_code))
+            continue
+        seen = USER_TURN_RE.findall(response.json().get("context", ""))
+        if any(owner != session_id for owner, _ in seen):
+            results["foreign"] += 1
+        numbers = [int(n) for owner, n in seen if owner == session_id]
+        if numbers != sorted(numbers) or (numbers and numbers[-1] != turn):
+            results["disordered"] += 1
+        results["lost_turns"] += turn + 1 - len(numbers)
+
+async def run_sessions(base_url: str, args) -> dict:
+    results = {"latencies": [], "errors": [], "foreign": 0, "disordered": 0, "lost_turns": 0}
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    slots = asyncio.Semaphore(args.connections)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            converse(client, slots, f"{base_url}/api/multi-agent", f"load{i:05d}", args.turns, args.think,
+                     random.Random(i), results)
+            for i in range(args.sessions)
+        ])
+        results["elapsed"] = time.perf_counter() - start
+        results["session_stats"] = (await client.get(f"{base_url}/api/session-stats")).json()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-agent session store under thousands of concurrent sessions")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=5, help="Messages per session")
+    parser.add_argument("--think", type=float, default=2.0, help="Longest pause between a session's messages (s)")
+    parser.add_argument("--memory-cap", type=int, default=100000, help="SESSION_MEMORY_CAP_TOKENS")
+    parser.add_argument("--no-spill", action="store_true", help="Drop evicted sessions instead of spilling them")
+    parser.add_argument("--connections", type=int, default=200, help="Client connections shared by the sessions")
+    parser.add_argument("--openai-median", type=float, default=0.05, help="Median mock Azure OpenAI latency (s)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--asgi", action="store_true", help="Serve asgi.py with uvicorn")
+    args = parser.parse_args()
+
+    mocks = MockServices(openai=LatencyProfile(args.openai_median, sigma=0.3)).start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            env = {"SESSION_MEMORY_CAP_TOKENS": str(args.memory_cap)}
+            if not args.no_spill:
+                env["SESSION_SPILL_PATH"] = os.path.join(workdir, "sessions.sqlite")
+            with start_backend("multi-agent", mocks.url, args.asgi, env=env) as (base_url, process):
+                results = asyncio.run(run_sessions(base_url, args))
+                rss = rss_mb(process.pid)
+    finally:
+        mocks.stop()
+
+    latencies = sorted(latency * 1000 for latency in results["latencies"])
+    stats = results["session_stats"]
+    print(f"{args.sessions} sessions x {args.turns} turns in {results['elapsed']:.1f} s "
+          f"({len(latencies) / results['elapsed']:.0f} req/s), p50 {percentile(latencies, 50):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms, {len(results['errors'])} errors")
+    print(f"in memory: {stats['sessions']} sessions, {stats['memory_tokens']} of {stats['memory_cap_tokens']} tokens; "
+          f"{stats['evictions']} evictions, {stats['spilled']} spilled; server RSS {rss} MB")
+
+    ok = not results["errors"] and not results["foreign"] and not results["disordered"]
+    ok = ok and stats["memory_tokens"] <= stats["memory_cap_tokens"]
+    if not args.no_spill:
+        ok = ok and results["lost_turns"] == 0
+    print(f"{'ok  ' if ok else 'FAIL'} contexts: {results['foreign']} with another session's turns, "
+          f"{results['disordered']} out of order, {results['lost_turns']} turns missing")
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
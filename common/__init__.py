@@ -0,0 +1,3 @@
+# __init__.py
+# Helpers shared by the backends in this repository. Each backend's app.py
+# adds the repository root to sys.path so that "common" can be imported.
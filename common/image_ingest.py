@@ -0,0 +1,48 @@
+# image_ingest.py
+import io
+import os
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is optional; without it images are passed through unchanged
+    Image = None
+
+# Azure AI Vision rejects images larger than 20 MB
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+# Images with a longer side than this are downscaled before upload (0 disables)
+MAX_IMAGE_DIMENSION = int(os.getenv("MAX_IMAGE_DIMENSION", "2048"))
+
+class ImageTooLargeError(ValueError):
+    pass
+
+def read_image_bytes(file_storage, max_bytes: int = MAX_IMAGE_BYTES) -> bytes:
+    """
+    Reads an uploaded file straight from its request stream.
+    Werkzeug already spools large uploads to a temporary file, so nothing is
+    written to disk here and concurrent requests never share a file.
+    """
+    data = file_storage.stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ImageTooLargeError(f"Image exceeds the {max_bytes} byte limit")
+    return data
+
+def downscale_image(image_data: bytes, max_dimension: int = MAX_IMAGE_DIMENSION) -> bytes:
+    """Shrinks the image so its longer side is at most max_dimension pixels."""
+    if Image is None or max_dimension <= 0:
+        return image_data
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            if max(image.size) <= max_dimension:
+                return image_data
+            image_format = "PNG" if image.mode in ("RGBA", "LA", "P") else "JPEG"
+            image.thumbnail((max_dimension, max_dimension))
+            output = io.BytesIO()
+            image.save(output, format=image_format, quality=90)
+            return output.getvalue()
+    except (OSError, Image.DecompressionBombError):
+        # Let the Vision service decide what to do with images Pillow can't read
+        return image_data
+
+def load_image(file_storage, max_bytes: int = MAX_IMAGE_BYTES, max_dimension: int = MAX_IMAGE_DIMENSION) -> bytes:
+    return downscale_image(read_image_bytes(file_storage, max_bytes), max_dimension)
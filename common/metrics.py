@@ -0,0 +1,347 @@
+# metrics.py
+import bisect
+import contextlib
+import functools
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to turn spans and request timing into no-ops (and not serve GET /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Start the sampling profiler at boot
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.01"))
+# Serve /api/profiler, which starts and stops the profiler; it has no authentication,
+# so only turn it on where the port is not reachable by clients
+PROFILER_CONTROL = os.getenv("PROFILER_CONTROL", "0") == "1"
+# Shortest sampling interval accepted (seconds); shorter ones would keep a core busy
+PROFILER_MIN_INTERVAL = 0.001
+# Distinct call stacks kept by the profiler; further ones are counted as "[other]"
+PROFILER_MAX_STACKS = 5000
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Spans of the request being handled, for its Server-Timing header
+_request_spans = ContextVar("request_spans", default=None)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per label set: [count per bucket (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+stage_duration = Histogram("stage_duration_seconds", "Time spent in each stage of request handling.", ("stage",))
+request_duration = Histogram("http_request_duration_seconds", "Time until the response headers are sent.",
+                             ("method", "route", "status"))
+upstream_tokens = Counter("upstream_tokens_total", "Tokens reported by Azure OpenAI.", ("deployment", "kind"))
+upstream_bytes = Counter("upstream_bytes_total", "Bytes sent to and received from upstream services.",
+                         ("service", "direction"))
+upstream_requests = Counter("upstream_requests_total", "Upstream calls by outcome.", ("service", "outcome"))
+admission_decisions = Counter("admission_decisions_total", "Admission control decisions by request priority.",
+                              ("priority", "outcome"))
+
+REGISTRY = [stage_duration, request_duration, upstream_tokens, upstream_bytes, upstream_requests, admission_decisions]
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stage_duration.observe(elapsed, self.stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.stage, elapsed))
+        return False
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+def span(stage: str):
+    """
+    Times a block as `stage` (with span("planning"): ...). The duration goes
+    into the stage histogram and the current request's Server-Timing header.
+    When metrics are disabled this returns a shared no-op context manager.
+    """
+    return _Span(stage) if METRICS_ENABLED else _NOOP_SPAN
+
+def timed(stage: str):
+    """Decorator form of span() for plain (non-async) functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_tokens(deployment: str, prompt_tokens: int, completion_tokens: int):
+    if METRICS_ENABLED:
+        upstream_tokens.inc(prompt_tokens, deployment, "prompt")
+        upstream_tokens.inc(completion_tokens, deployment, "completion")
+
+def record_upstream(service: str, outcome: str = None, sent: int = 0, received: int = 0):
+    """
+    Counts an upstream call when outcome ("ok" or "error") is given, and adds
+    sent/received body bytes (which may be reported separately, e.g. once a stream ends).
+    """
+    if METRICS_ENABLED:
+        if outcome:
+            upstream_requests.inc(1, service, outcome)
+        if sent:
+            upstream_bytes.inc(sent, service, "sent")
+        if received:
+            upstream_bytes.inc(received, service, "received")
+
+def record_admission(priority: str, outcome: str):
+    """Counts an admission decision: "admitted", "queued", "shed", "evicted" or "timeout"."""
+    if METRICS_ENABLED:
+        admission_decisions.inc(1, priority, outcome)
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class SamplingProfiler:
+    """
+    Statistical profiler that can be switched on in a running server.
+
+    A background thread snapshots the stacks of all other threads every
+    `interval` seconds and counts identical stacks. Nothing is hooked into the
+    interpreter, so the cost is one stack walk per thread per sample and zero
+    when stopped. The counts are returned in the collapsed format read by
+    flamegraph.pl and speedscope ("a.py:f;b.py:g 42").
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, max_stacks: int = PROFILER_MAX_STACKS):
+        self.interval = self._checked_interval(interval)
+        self.max_stacks = max_stacks
+        self._counts = defaultdict(int)
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._started = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @staticmethod
+    def _checked_interval(interval: float) -> float:
+        if not math.isfinite(interval):
+            raise ValueError("interval must be a finite number")
+        return max(interval, PROFILER_MIN_INTERVAL)
+
+    def start(self, interval: float = None, reset: bool = True):
+        if self.running:
+            return
+        if interval:
+            self.interval = self._checked_interval(interval)
+        if reset:
+            with self._lock:
+                self._counts.clear()
+                self._samples = 0
+        self._stop.clear()
+        self._started = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:g} ms interval)")
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        logger.info(f"Sampling profiler stopped after {self._samples} samples")
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            with self._lock:
+                self._samples += 1
+                for stack in stacks:
+                    if stack not in self._counts and len(self._counts) >= self.max_stacks:
+                        stack = "[other]"
+                    self._counts[stack] += 1
+
+    def snapshot(self, top: int = 200) -> dict:
+        with self._lock:
+            counts = sorted(self._counts.items(), key=lambda item: -item[1])
+            samples = self._samples
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "started": self._started,
+            "samples": samples,
+            "stacks": [f"{stack} {count}" for stack, count in counts[:top]],
+        }
+
+profiler = SamplingProfiler()
+if PROFILER_ENABLED:
+    profiler.start()
+
+def _server_timing(spans: list) -> str:
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in spans)
+
+def instrument_app(app):
+    """
+    Adds request timing (histogram plus a Server-Timing header listing the
+    request's spans) and GET /metrics to a Flask or Quart app when
+    METRICS_ENABLED, and the /api/profiler switch when PROFILER_CONTROL.
+    Streamed responses are timed until their headers are sent.
+    """
+    is_quart = type(app).__module__.split(".")[0] == "quart"
+    if is_quart:
+        from quart import g, jsonify, request
+    else:
+        from flask import g, jsonify, request
+
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        _request_spans.set([])
+
+    def finish_request(response):
+        start = getattr(g, "metrics_start", None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_duration.observe(time.perf_counter() - start, request.method, route, response.status_code)
+        spans = _request_spans.get()
+        if spans:
+            response.headers["Server-Timing"] = _server_timing(spans)
+        return response
+
+    def metrics_response():
+        return app.response_class(render(), content_type=CONTENT_TYPE)
+
+    def profiler_response(data: dict):
+        # POST {"action": "start", "interval": 0.005} or {"action": "stop"}; GET returns the stacks
+        action = (data or {}).get("action")
+        if action == "start":
+            try:
+                profiler.start(float(data.get("interval") or 0) or None)
+            except (TypeError, ValueError):
+                return jsonify({"error": "interval must be a finite number"}), 400
+        elif action == "stop":
+            profiler.stop()
+        elif action is not None:
+            return jsonify({"error": "action must be start or stop"}), 400
+        return jsonify(profiler.snapshot())
+
+    if is_quart:
+        async def before_request():
+            start_request()
+
+        async def after_request(response):
+            return finish_request(response)
+
+        async def metrics():
+            return metrics_response()
+
+        async def profiler_control():
+            data = await request.get_json(silent=True) if request.method == "POST" else None
+            return profiler_response(data)
+    else:
+        def before_request():
+            start_request()
+
+        def after_request(response):
+            return finish_request(response)
+
+        def metrics():
+            return metrics_response()
+
+        def profiler_control():
+            data = request.get_json(silent=True) if request.method == "POST" else None
+            return profiler_response(data)
+
+    if METRICS_ENABLED:
+        app.before_request(before_request)
+        app.after_request(after_request)
+        app.add_url_rule("/metrics", "metrics", metrics, methods=["GET"])
+    if PROFILER_CONTROL:
+        app.add_url_rule("/api/profiler", "profiler", profiler_control, methods=["GET", "POST"])
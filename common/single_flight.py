@@ -0,0 +1,113 @@
+# single_flight.py
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+
+def request_key(*parts) -> str:
+    """Stable key for JSON-serializable call parameters (dict order does not matter)."""
+    data = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and get a copy of its result, or its exception
+    re-raised. A waiter that gives up after its timeout gets TimeoutError
+    without affecting the call or the other waiters. Nothing is cached: once
+    the call finishes, the next caller starts a new one.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, func, timeout: float = None):
+        """Returns (result, shared); shared is True when another caller's call was joined."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.executions += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("Timed out waiting for an identical in-flight call")
+            if call.error is not None:
+                raise call.error
+            # Each caller gets its own copy so none can change another's result
+            return copy.deepcopy(call.result), True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": in_flight}
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop.
+
+    The call runs as its own task, so it completes for the remaining waiters
+    even if the caller that started it is cancelled or times out.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, coroutine_func, timeout: float = None):
+        """Returns (result, shared) like SingleFlight.do."""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = self._tasks[key] = asyncio.ensure_future(coroutine_func())
+            task.add_done_callback(lambda finished: self._finished(key, finished))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out waiting for an identical in-flight call") from None
+        return (copy.deepcopy(result), True) if shared else (result, False)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved even if every waiter has gone
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._tasks)}
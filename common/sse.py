@@ -0,0 +1,12 @@
+# sse.py
+import json
+
+# Headers that stop proxies and browsers from buffering an event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+def sse_event(payload: dict) -> str:
+    """Formats one server-sent event carrying a JSON payload."""
+    return f"data: {json.dumps(payload)}\n\n"
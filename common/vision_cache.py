@@ -0,0 +1,316 @@
+# vision_cache.py
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from azure.ai.vision.imageanalysis.models import VisualFeatures
+
+from common.metrics import record_upstream, span
+from common.single_flight import AsyncSingleFlight, SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow only byte-identical images hit the cache
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Shared by every backend that imports this module unless overridden
+VISION_CACHE_PATH = os.getenv(
+    "VISION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".cache", "vision_cache.sqlite")
+)
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+VISION_CACHE_MEMORY_ENTRIES = int(os.getenv("VISION_CACHE_MEMORY_ENTRIES", "1024"))
+# Maximum Hamming distance between perceptual hashes to count as the same image. Off (-1)
+# by default: near-identical images can still differ in what the caption should say
+VISION_CACHE_PHASH_DISTANCE = int(os.getenv("VISION_CACHE_PHASH_DISTANCE", "-1"))
+# Seconds between re-reading the file's total size, which other processes change too
+TOTAL_RESYNC_INTERVAL = 60.0
+# Least recently used rows read per eviction query
+EVICT_BATCH = 64
+
+VISUAL_FEATURES = [
+    VisualFeatures.CAPTION,
+    VisualFeatures.TAGS,
+    VisualFeatures.OBJECTS
+]
+
+def content_hash(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+def perceptual_hash(image_data: bytes):
+    """64-bit difference hash; stays the same across resizing and re-encoding."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            pixels = list(image.convert("L").resize((9, 8)).getdata())
+    except (OSError, Image.DecompressionBombError):
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+def _bands(phash: int, count: int) -> list:
+    """
+    Splits the 64-bit hash into count bands. Two hashes at most count - 1 bits
+    apart agree on at least one whole band, so only images sharing a band need comparing.
+    """
+    value = phash & 0xFFFFFFFFFFFFFFFF
+    bands = []
+    start = 0
+    for i in range(count):
+        width = 64 // count + (1 if i < 64 % count else 0)
+        bands.append((i, (value >> start) & ((1 << width) - 1)))
+        start += width
+    return bands
+
+class VisionCache:
+    """
+    Caches Vision analysis results (caption, tags, objects) by image content.
+
+    Lookups go to an in-memory LRU first and then to a SQLite file that several
+    processes can share and that survives restarts. The file is kept under
+    max_bytes by evicting the least recently used rows. The total size is kept
+    as a running count rather than summed on every write; other processes'
+    writes are picked up when it is re-read, every TOTAL_RESYNC_INTERVAL
+    seconds. Concurrent misses for the same image wait for a single Vision call.
+
+    With phash_distance >= 0, an image whose exact SHA-256 is unknown is also
+    matched by perceptual hash, so resized or re-encoded copies of the same
+    picture hit. Perceptual hashes are indexed in memory by band; rows other
+    processes added to the file since the last miss are read in before matching.
+    """
+
+    def __init__(self, path: str = VISION_CACHE_PATH, max_bytes: int = VISION_CACHE_MAX_BYTES,
+                 memory_entries: int = VISION_CACHE_MEMORY_ENTRIES,
+                 phash_distance: int = VISION_CACHE_PHASH_DISTANCE):
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.phash_distance = phash_distance
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._phashes = {}
+        self._phash_bands = {}
+        # Highest SQLite rowid whose perceptual hash is in the index
+        self._phash_rowid = 0
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flight = SingleFlight()
+        self.async_flight = AsyncSingleFlight()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vision_cache ("
+            "hash TEXT PRIMARY KEY, phash INTEGER, result TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS vision_cache_access ON vision_cache (last_access)")
+        self._conn.commit()
+        self._resync_total()
+        if self.phash_distance >= 0:
+            self._refresh_phashes()
+
+    def _resync_total(self):
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM vision_cache").fetchone()[0]
+        self._total_synced = time.monotonic()
+
+    def _index_phash(self, key: str, phash: int):
+        self._unindex_phash(key)
+        self._phashes[key] = phash
+        for band in _bands(phash, self.phash_distance + 1):
+            self._phash_bands.setdefault(band, set()).add(key)
+
+    def _unindex_phash(self, key: str):
+        phash = self._phashes.pop(key, None)
+        if phash is None:
+            return
+        for band in _bands(phash, self.phash_distance + 1):
+            keys = self._phash_bands.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._phash_bands[band]
+
+    def _refresh_phashes(self):
+        """Indexes the perceptual hashes of rows written (by any process) since the last refresh."""
+        rows = self._conn.execute(
+            "SELECT rowid, hash, phash FROM vision_cache WHERE rowid > ? AND phash IS NOT NULL",
+            (self._phash_rowid,)).fetchall()
+        for rowid, key, phash in rows:
+            self._index_phash(key, phash)
+            self._phash_rowid = max(self._phash_rowid, rowid)
+
+    def _match_phash(self, key: str, phash: int):
+        self._refresh_phashes()
+        candidates = set()
+        for band in _bands(phash, self.phash_distance + 1):
+            candidates.update(self._phash_bands.get(band, ()))
+        for other_key in candidates:
+            if _hamming(phash, self._phashes[other_key]) > self.phash_distance:
+                continue
+            result = self._memory.get(other_key) or self._load(other_key)
+            if result is not None:
+                return result
+            # Evicted by another process
+            self._unindex_phash(other_key)
+        return None
+
+    def _remember(self, key: str, result: dict):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str):
+        row = self._conn.execute("SELECT result FROM vision_cache WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE vision_cache SET last_access = ? WHERE hash = ?", (time.time(), key))
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def get(self, key: str, phash=None):
+        with self._lock:
+            result = self._memory.get(key)
+            if result is None:
+                result = self._load(key)
+            if result is not None:
+                self._remember(key, result)
+                self.hits += 1
+                return result
+
+            if phash is not None and self.phash_distance >= 0:
+                result = self._match_phash(key, phash)
+                if result is not None:
+                    self._remember(key, result)
+                    self.phash_hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def set(self, key: str, result: dict, phash=None):
+        data = json.dumps(result)
+        with self._lock:
+            self._remember(key, result)
+            if time.monotonic() - self._total_synced > TOTAL_RESYNC_INTERVAL:
+                self._resync_total()
+            # A replaced row no longer counts
+            row = self._conn.execute("SELECT size FROM vision_cache WHERE hash = ?", (key,)).fetchone()
+            self._total_bytes += len(data) - (row[0] if row else 0)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO vision_cache (hash, phash, result, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, phash, data, len(data), time.time()),
+            )
+            if phash is not None and self.phash_distance >= 0:
+                self._index_phash(key, phash)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT hash, size FROM vision_cache ORDER BY last_access LIMIT ?", (EVICT_BATCH,)).fetchall()
+            if not rows:
+                # Another process emptied the file
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    return
+                self._conn.execute("DELETE FROM vision_cache WHERE hash = ?", (key,))
+                self._memory.pop(key, None)
+                self._unindex_phash(key)
+                self._total_bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.phash_hits + self.misses
+            return {
+                "hits": self.hits,
+                "phash_hits": self.phash_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": ((self.hits + self.phash_hits) / lookups) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "coalesced": self.flight.coalesced + self.async_flight.coalesced,
+            }
+
+vision_cache = VisionCache()
+
+def _summarize(analysis) -> dict:
+    return {
+        "caption": analysis.caption.text if analysis.caption else "",
+        "tags": [getattr(tag, "name", str(tag)) for tag in analysis.tags] if analysis.tags else [],
+        "objects": [getattr(obj, "name", str(obj)) for obj in analysis.objects] if analysis.objects else [],
+    }
+
+def _lookup(image_data: bytes, cache: VisionCache):
+    key = content_hash(image_data)
+    # Decoding the image for its perceptual hash is skipped unless near-duplicate matching is on
+    phash = perceptual_hash(image_data) if cache.phash_distance >= 0 else None
+    return key, phash, cache.get(key, phash)
+
+def _analyze(vision_client, image_data: bytes, cache: VisionCache, key: str, phash) -> dict:
+    try:
+        with span("vision.analyze"):
+            analysis = vision_client.analyze(image_data=image_data, visual_features=VISUAL_FEATURES)
+    except Exception:
+        record_upstream("azure_vision", "error", sent=len(image_data))
+        raise
+    record_upstream("azure_vision", "ok", sent=len(image_data))
+    result = _summarize(analysis)
+    cache.set(key, result, phash)
+    return result
+
+def analyze_image(vision_client, image_data: bytes, cache: VisionCache = vision_cache):
+    """Returns (caption, tags, objects) for the image, calling Azure Vision only on a cache miss."""
+    with span("vision.cache_lookup"):
+        key, phash, result = _lookup(image_data, cache)
+    if result is None:
+        result, _ = cache.flight.do(key, lambda: _analyze(vision_client, image_data, cache, key, phash))
+    return result["caption"], result["tags"], result["objects"]
+
+async def _analyze_async(vision_client, image_data: bytes, cache: VisionCache, key: str, phash) -> dict:
+    try:
+        with span("vision.analyze"):
+            analysis = await vision_client.analyze(image_data=image_data, visual_features=VISUAL_FEATURES)
+    except Exception:
+        record_upstream("azure_vision", "error", sent=len(image_data))
+        raise
+    record_upstream("azure_vision", "ok", sent=len(image_data))
+    result = _summarize(analysis)
+    await asyncio.to_thread(cache.set, key, result, phash)
+    return result
+
+async def analyze_image_async(vision_client, image_data: bytes, cache: VisionCache = vision_cache):
+    """
+    Same as analyze_image for an azure.ai.vision.imageanalysis.aio client.
+    Hashing and the SQLite cache run in a worker thread so the event loop stays free.
+    """
+    with span("vision.cache_lookup"):
+        key, phash, result = await asyncio.to_thread(_lookup, image_data, cache)
+    if result is None:
+        result, _ = await cache.async_flight.do(
+            key, lambda: _analyze_async(vision_client, image_data, cache, key, phash))
+    return result["caption"], result["tags"], result["objects"]
@@ -0,0 +1,224 @@
+# admission.py
+
+import asyncio
+import contextlib
+import itertools
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from common.metrics import record_admission, span
+from escalation_rules import PRIORITIES
+
+# Upstream (LLM) calls allowed in flight at once
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16"))
+# Requests allowed to wait for a slot; beyond this, the lowest priority waiter is turned away
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Longest queue delay (seconds) accepted for sheddable requests before they are degraded or rejected
+ADMISSION_TARGET_DELAY = float(os.getenv("ADMISSION_TARGET_DELAY", "2.0"))
+# Longest time a high or urgent priority request waits for a slot
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+# Requests below this priority are shed first
+ADMISSION_SHED_BELOW = os.getenv("ADMISSION_SHED_BELOW", "high")
+
+# Weight of the latest call in the running average of upstream call time
+SERVICE_TIME_ALPHA = 0.2
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; retry_after is a hint in whole seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Overloaded ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class _Waiter:
+    __slots__ = ("level", "seq", "state", "wake")
+
+    def __init__(self, level: int, seq: int, wake):
+        self.level = level
+        self.seq = seq
+        self.state = "waiting"
+        self.wake = wake
+
+class _AdmissionCore:
+    """
+    Concurrency limit with a bounded priority queue in front of it.
+
+    A request is admitted at once while slots are free and nobody is waiting;
+    otherwise it queues. A released slot goes to the highest priority waiter
+    (first come, first served within a priority), so escalation-bound queries
+    overtake routine ones. Routine (sheddable) requests are turned away
+    as soon as their expected queue delay - the number of waiters at or above
+    their priority times the running average upstream call time, divided by the
+    number of slots - exceeds target_delay, or when they have actually waited
+    that long. When the queue is full, a newcomer evicts the newest waiter of a
+    lower priority, or is turned away if there is none.
+    """
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY, max_queue: int = ADMISSION_MAX_QUEUE,
+                 target_delay: float = ADMISSION_TARGET_DELAY, max_wait: float = ADMISSION_MAX_WAIT,
+                 shed_below: str = ADMISSION_SHED_BELOW):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.target_delay = target_delay
+        self.max_wait = max_wait
+        self.shed_below = PRIORITIES[shed_below]
+        self._names = {level: name for name, level in PRIORITIES.items()}
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._service_time = None
+        self._decisions = Counter()
+
+    def _record(self, level: int, outcome: str):
+        name = self._names[level]
+        self._decisions[(name, outcome)] += 1
+        record_admission(name, outcome)
+
+    def _expected_delay(self, level: int) -> float:
+        ahead = sum(1 for waiter in self._queue if waiter.level >= level)
+        service_time = self._service_time if self._service_time is not None else self.target_delay
+        return (ahead + 1) * service_time / self.max_concurrency
+
+    def _retry_after(self) -> int:
+        service_time = self._service_time if self._service_time is not None else self.target_delay
+        return max(1, math.ceil(len(self._queue) * service_time / self.max_concurrency))
+
+    def _reject(self, level: int, outcome: str) -> Overloaded:
+        self._record(level, outcome)
+        return Overloaded(outcome, self._retry_after())
+
+    def _enter(self, priority: str, make_wake):
+        """Returns None when admitted at once, or the queued waiter; raises Overloaded."""
+        level = PRIORITIES.get(priority, PRIORITIES["normal"])
+        with self._lock:
+            if self._active < self.max_concurrency and not self._queue:
+                self._active += 1
+                self._record(level, "admitted")
+                return None
+            if level < self.shed_below and self._expected_delay(level) > self.target_delay:
+                raise self._reject(level, "shed")
+            if len(self._queue) >= self.max_queue:
+                victims = [waiter for waiter in self._queue if waiter.level < level]
+                if not victims:
+                    raise self._reject(level, "shed")
+                victim = min(victims, key=lambda waiter: (waiter.level, -waiter.seq))
+                self._queue.remove(victim)
+                victim.state = "evicted"
+                victim.wake()
+                self._record(victim.level, "evicted")
+            waiter = _Waiter(level, next(self._seq), make_wake())
+            self._queue.append(waiter)
+            self._record(level, "queued")
+            return waiter
+
+    def _timeout(self, waiter: _Waiter) -> float:
+        return self.target_delay if waiter.level < self.shed_below else self.max_wait
+
+    def _after_wait(self, waiter: _Waiter):
+        """Settles a waiter whose wait ended: admitted, or Overloaded."""
+        with self._lock:
+            if waiter.state == "granted":
+                return
+            if waiter.state == "evicted":
+                raise Overloaded("evicted", self._retry_after())
+            self._queue.remove(waiter)
+            raise self._reject(waiter.level, "timeout")
+
+    def _leave(self, service_time: float = None):
+        with self._lock:
+            if service_time is not None:
+                if self._service_time is None:
+                    self._service_time = service_time
+                else:
+                    self._service_time += SERVICE_TIME_ALPHA * (service_time - self._service_time)
+            if not self._queue:
+                self._active -= 1
+                return
+            # Hand the slot straight to the best waiter
+            best = max(self._queue, key=lambda waiter: (waiter.level, -waiter.seq))
+            self._queue.remove(best)
+            best.state = "granted"
+            best.wake()
+
+    def stats(self) -> dict:
+        with self._lock:
+            decisions = {}
+            for (priority, outcome), count in self._decisions.items():
+                decisions.setdefault(priority, {})[outcome] = count
+            return {
+                "active": self._active,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "target_delay": self.target_delay,
+                "service_time": round(self._service_time, 4) if self._service_time is not None else None,
+                "decisions": decisions,
+            }
+
+class AdmissionController(_AdmissionCore):
+    """Admission control for the threaded (WSGI) app."""
+
+    @contextlib.contextmanager
+    def admit(self, priority: str = "normal"):
+        with span("admission.wait"):
+            event = None
+
+            def make_wake():
+                nonlocal event
+                event = threading.Event()
+                return event.set
+
+            waiter = self._enter(priority, make_wake)
+            if waiter is not None:
+                event.wait(self._timeout(waiter))
+                self._after_wait(waiter)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._leave(time.monotonic() - start)
+
+class AsyncAdmissionController(_AdmissionCore):
+    """Admission control for the ASGI app; waiting does not block the event loop."""
+
+    @contextlib.asynccontextmanager
+    async def admit(self, priority: str = "normal"):
+        with span("admission.wait"):
+            loop = asyncio.get_running_loop()
+            future = None
+
+            def make_wake():
+                nonlocal future
+                future = loop.create_future()
+
+                def wake():
+                    if not future.done():
+                        future.set_result(None)
+                return wake
+
+            waiter = self._enter(priority, make_wake)
+            if waiter is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), self._timeout(waiter))
+                except asyncio.TimeoutError:
+                    pass
+                except asyncio.CancelledError:
+                    # The client went away: give up the place in the queue, or the slot if it was just granted
+                    with self._lock:
+                        granted = waiter.state == "granted"
+                        if waiter in self._queue:
+                            self._queue.remove(waiter)
+                    if granted:
+                        self._leave()
+                    raise
+                self._after_wait(waiter)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._leave(time.monotonic() - start)
@@ -1,8 +1,8 @@
 from flask import Flask, request, jsonify, send_from_directory
 import os
+import sys
 import logging
 from dotenv import load_dotenv
-import openai
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -11,33 +11,42 @@ logger = logging.getLogger(__name__)
 # Serve frontend from the static folder
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '../frontend'), static_url_path='')
 
-# Azure OpenAI configuration
-azure_openai_key = os.getenv("AZURE_OPENAI_KEY")
-azure_openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-azure_openai_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-openai.api_type = "azure"
-openai.api_key = azure_openai_key
-openai.api_base = azure_openai_endpoint
-openai.api_version = "2023-05-15"
+# Shared helpers live in <repo>/common
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+# Azure OpenAI is configured from AZURE_OPENAI_KEY/ENDPOINT/DEPLOYMENT by the shared client
+from common.llm_client import get_llm_client
+from common.metrics import instrument_app, span
 
 # Import modules
-from customer_service_agent import customer_service_agent
-from escalation_workflow import escalate_query
-from notification import send_notification_via_logic_app
-from feedback_manager import record_feedback, get_feedback
+from customer_service_agent import customer_service_agent, admission_controller, response_cache
+from admission import Overloaded
+from escalation_workflow import URGENT_CONFIDENCE, URGENT_RESPONSE, escalate_query, evaluate_escalation
+from escalation_rules import escalation_rules
+from notification import notification_dispatcher
+from feedback_manager import record_feedback, get_feedback, get_feedback_stats
 
-# Define escalation keywords
-ESCALATION_KEYWORDS = ["urgent", "immediate", "asap"]
-
-def needs_escalation(query: str) -> bool:
-    """Checks if the query contains any escalation keywords."""
-    query_lower = query.lower()
-    return any(keyword in query_lower for keyword in ESCALATION_KEYWORDS)
+# Request timing, GET /metrics and (with PROFILER_CONTROL=1) the /api/profiler switch
+instrument_app(app)
 
 @app.route('/')
 def index():
     return send_from_directory(app.static_folder, 'index.html')
 
+def urgent_reply(query: str, decision: dict) -> dict:
+    """Queues the escalation notification and returns the standard urgent reply."""
+    escalation_message = escalate_query(query, {}, decision)
+    # Sent in the background; the client can poll /api/notifications/<id>
+    with span("notification.enqueue"):
+        notification_id = notification_dispatcher.submit(escalation_message)
+    return {
+        "response": URGENT_RESPONSE,
+        "confidence": URGENT_CONFIDENCE,
+        "escalated": True,
+        "notification": "Notification queued.",
+        "notification_id": notification_id,
+        "escalation_rules": decision["rules"],
+    }
+
 @app.route('/api/customer-service', methods=['POST'])
 def customer_service():
     try:
@@ -46,25 +55,34 @@ def customer_service():
         if not query:
             return jsonify({"error": "No query provided"}), 400
 
-        # Process the customer query (using FAQ retrieval with GPT fallback)
-        response_data = customer_service_agent(query)
-        
-        # Check for escalation based solely on urgent keywords
-        if needs_escalation(query):
-            escalation_message = escalate_query(query, response_data)
-            notification_status = send_notification_via_logic_app(escalation_message)
-            response_data["escalated"] = True
-            response_data["notification"] = notification_status
-            # Override response with default urgent message
-            response_data["response"] = "Your query has been marked as urgent. A support agent will contact you immediately."
-        else:
-            response_data["escalated"] = False
-
-        return jsonify(response_data)
+        # The rules are matched once per query. Escalate when an urgent-priority rule fires
+        # (see escalation_rules.json): urgent queries get the urgent reply whatever the agent
+        # would say, so they skip admission and the LLM; other escalation-bound queries are
+        # admitted ahead of routine ones
+        decision = evaluate_escalation(query)
+        if decision["urgent"]:
+            with span("serialize"):
+                return jsonify(urgent_reply(query, decision))
+        try:
+            # Process the customer query (using FAQ retrieval with GPT fallback)
+            response_data = customer_service_agent(query, decision["priority"] or "normal")
+        except Overloaded as e:
+            return jsonify({"error": "The service is busy, please try again shortly."}), 503, {"Retry-After": str(e.retry_after)}
+        response_data["escalated"] = False
+
+        with span("serialize"):
+            return jsonify(response_data)
     except Exception as e:
         logger.error(f"Error in customer service endpoint: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/notifications/<notification_id>', methods=['GET'])
+def notification_status(notification_id):
+    status = notification_dispatcher.status(notification_id)
+    if status is None:
+        return jsonify({"error": "Unknown notification ID"}), 404
+    return jsonify(status)
+
 @app.route('/api/feedback', methods=['POST'])
 def feedback():
     try:
@@ -74,11 +92,44 @@ def feedback():
         feedback_text = data.get("feedback")
         if not query or not ai_response or not feedback_text:
             return jsonify({"error": "Missing data"}), 400
-        entry = record_feedback(query, ai_response, feedback_text)
+        with span("feedback.record"):
+            entry = record_feedback(query, ai_response, feedback_text)
         return jsonify({"status": "Feedback recorded", "entry": entry})
     except Exception as e:
         logger.error(f"Error in feedback endpoint: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/feedback', methods=['GET'])
+def list_feedback():
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    if offset < 0 or limit < 0:
+        return jsonify({"error": "offset and limit must not be negative"}), 400
+    entries = get_feedback(offset, limit)
+    return jsonify({"offset": offset, "limit": limit, "entries": entries})
+
+@app.route('/api/feedback-stats', methods=['GET'])
+def feedback_stats():
+    return jsonify(get_feedback_stats(request.args.get("query"), request.args.get("faq_key")))
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/api/escalation-stats', methods=['GET'])
+def escalation_stats():
+    return jsonify(escalation_rules.stats())
+
+@app.route('/api/admission-stats', methods=['GET'])
+def admission_stats():
+    return jsonify(admission_controller.stats())
+
+@app.route('/api/llm-stats', methods=['GET'])
+def llm_stats():
+    return jsonify(get_llm_client().stats())
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
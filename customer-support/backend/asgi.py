@@ -0,0 +1,136 @@
+# asgi.py
+# Async serving mode: same routes and JSON as app.py, served by an ASGI server, e.g.
+#   uvicorn asgi:app --port 5001
+# LLM calls are awaited on the event loop instead of holding a worker thread each; calls
+# that touch files (feedback log, notification spool, faqs.json) run in worker threads.
+from quart import Quart, request, jsonify, send_from_directory
+from quart_cors import cors
+import asyncio
+import os
+import sys
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__, static_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '../frontend'), static_url_path='')
+app = cors(app)
+
+# Shared helpers live in <repo>/common
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.llm_client import get_async_llm_client
+from common.metrics import instrument_app, span
+
+from customer_service_agent import customer_service_agent_async, async_admission_controller, response_cache
+from admission import Overloaded
+from escalation_workflow import URGENT_CONFIDENCE, URGENT_RESPONSE, escalate_query, evaluate_escalation
+from escalation_rules import escalation_rules
+from notification import notification_dispatcher
+from feedback_manager import record_feedback, get_feedback, get_feedback_stats
+
+# Request timing, GET /metrics and (with PROFILER_CONTROL=1) the /api/profiler switch
+instrument_app(app)
+
+@app.route('/')
+async def index():
+    return await send_from_directory(app.static_folder, 'index.html')
+
+async def urgent_reply(query: str, decision: dict) -> dict:
+    """Queues the escalation notification and returns the standard urgent reply."""
+    escalation_message = escalate_query(query, {}, decision)
+    with span("notification.enqueue"):
+        notification_id = await asyncio.to_thread(notification_dispatcher.submit, escalation_message)
+    return {
+        "response": URGENT_RESPONSE,
+        "confidence": URGENT_CONFIDENCE,
+        "escalated": True,
+        "notification": "Notification queued.",
+        "notification_id": notification_id,
+        "escalation_rules": decision["rules"],
+    }
+
+@app.route('/api/customer-service', methods=['POST'])
+async def customer_service():
+    try:
+        data = await request.get_json()
+        query = data.get("query", "")
+        if not query:
+            return jsonify({"error": "No query provided"}), 400
+
+        # Rules matched once; urgent queries skip admission and the LLM (see app.py)
+        decision = evaluate_escalation(query)
+        if decision["urgent"]:
+            with span("serialize"):
+                return jsonify(await urgent_reply(query, decision))
+        try:
+            response_data = await customer_service_agent_async(query, decision["priority"] or "normal")
+        except Overloaded as e:
+            return jsonify({"error": "The service is busy, please try again shortly."}), 503, {"Retry-After": str(e.retry_after)}
+        response_data["escalated"] = False
+
+        with span("serialize"):
+            return jsonify(response_data)
+    except Exception as e:
+        logger.error(f"Error in customer service endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/notifications/<notification_id>', methods=['GET'])
+async def notification_status(notification_id):
+    status = notification_dispatcher.status(notification_id)
+    if status is None:
+        return jsonify({"error": "Unknown notification ID"}), 404
+    return jsonify(status)
+
+@app.route('/api/feedback', methods=['POST'])
+async def feedback():
+    try:
+        data = await request.get_json()
+        query = data.get("query")
+        ai_response = data.get("ai_response")
+        feedback_text = data.get("feedback")
+        if not query or not ai_response or not feedback_text:
+            return jsonify({"error": "Missing data"}), 400
+        with span("feedback.record"):
+            entry = await asyncio.to_thread(record_feedback, query, ai_response, feedback_text)
+        return jsonify({"status": "Feedback recorded", "entry": entry})
+    except Exception as e:
+        logger.error(f"Error in feedback endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/feedback', methods=['GET'])
+async def list_feedback():
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    if offset < 0 or limit < 0:
+        return jsonify({"error": "offset and limit must not be negative"}), 400
+    entries = await asyncio.to_thread(get_feedback, offset, limit)
+    return jsonify({"offset": offset, "limit": limit, "entries": entries})
+
+@app.route('/api/feedback-stats', methods=['GET'])
+async def feedback_stats():
+    stats = await asyncio.to_thread(get_feedback_stats, request.args.get("query"), request.args.get("faq_key"))
+    return jsonify(stats)
+
+@app.route('/api/cache-stats', methods=['GET'])
+async def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/api/escalation-stats', methods=['GET'])
+async def escalation_stats():
+    return jsonify(escalation_rules.stats())
+
+@app.route('/api/admission-stats', methods=['GET'])
+async def admission_stats():
+    return jsonify(async_admission_controller.stats())
+
+@app.route('/api/llm-stats', methods=['GET'])
+async def llm_stats():
+    return jsonify(get_async_llm_client().stats())
+
+if __name__ == '__main__':
+    app.run(debug=True, port=5001)
@@ -1,25 +1,91 @@
 # customer_service_agent.py
 
-import openai
+import asyncio
 import os
-from faq_retriever import retrieve_faq_response
+from admission import AdmissionController, AsyncAdmissionController, Overloaded
+from common.llm_client import get_llm_client, get_async_llm_client
+from common.metrics import span
+from faq_retriever import FAQ_CONFIDENCE_THRESHOLD, retrieve_faq_response
+from response_cache import ResponseCache
 
-def customer_service_agent(query: str) -> dict:
+# Cache of LLM answers in front of the chat completion call.
+# RESPONSE_CACHE_SIMILARITY > 0 enables reuse of answers to near-duplicate queries.
+response_cache = ResponseCache(
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(10 * 1024 * 1024))),
+    similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0")),
+)
 
-    faq_response = retrieve_faq_response(query)
-    if faq_response is not None and faq_response.get("confidence", 0) >= 0.85:
-        return faq_response
+# Bounds the LLM calls in flight; under load, high-priority (escalation-bound) queries are served
+# first. Urgent queries never get here: the routes answer them with the urgent reply at once
+admission_controller = AdmissionController()
+async_admission_controller = AsyncAdmissionController()
+
+# A routine query turned away under load still gets the best FAQ answer at or above this confidence
+DEGRADED_FAQ_CONFIDENCE = float(os.getenv("DEGRADED_FAQ_CONFIDENCE", "0.5"))
+
+def _faq_or_cached(query: str):
+    """Returns (response, deployment, model_params); response is None when the LLM has to be called."""
+    with span("faq_lookup"):
+        faq_response = retrieve_faq_response(query)
+    if faq_response is not None and faq_response.get("confidence", 0) >= FAQ_CONFIDENCE_THRESHOLD:
+        return faq_response, None, None
 
-    messages = [
+    deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+    model_params = {
+        "temperature": 0.5,
+        "max_tokens": 500
+    }
+    with span("response_cache"):
+        cached_response = response_cache.get(query, {"deployment": deployment, **model_params})
+    if cached_response is not None:
+        return {"response": cached_response, "confidence": 0.1, "cached": True}, None, None
+    return None, deployment, model_params
+
+def _messages(query: str) -> list:
+    return [
         {"role": "system", "content": "You are a customer service assistant."},
         {"role": "user", "content": query}
     ]
-    response = openai.ChatCompletion.create(
-        engine=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-        messages=messages,
-        temperature=0.5,
-        max_tokens=500
-    )
-    ai_response = response.choices[0].message.content
+
+def _degraded(query: str, error: Overloaded) -> dict:
+    """FAQ-only answer for a query that was not admitted; re-raises error when no FAQ is close enough."""
+    faq_response = retrieve_faq_response(query)
+    if faq_response is None or faq_response.get("confidence", 0) < DEGRADED_FAQ_CONFIDENCE:
+        raise error
+    return dict(faq_response, degraded=True)
+
+def customer_service_agent(query: str, priority: str = "normal") -> dict:
+    """
+    Answers from the FAQ, the response cache or the LLM. LLM calls wait for
+    admission at the given priority and raise Overloaded when turned away.
+    """
+    response, deployment, model_params = _faq_or_cached(query)
+    if response is not None:
+        return response
+
+    try:
+        with admission_controller.admit(priority):
+            ai_response = get_llm_client().chat_text(_messages(query), deployment, **model_params)
+    except Overloaded as e:
+        return _degraded(query, e)
+    response_cache.set(query, {"deployment": deployment, **model_params}, ai_response)
     # Force a low confidence value (0.1) for demo purposes.
-    return {"response": ai_response, "confidence": 0.1}
\ No newline at end of file
+    return {"response": ai_response, "confidence": 0.1}
+
+async def customer_service_agent_async(query: str, priority: str = "normal") -> dict:
+    """
+    customer_service_agent for the ASGI app. The LLM call is awaited; FAQ lookups,
+    which may reload and re-index faqs.json, run in a worker thread.
+    """
+    response, deployment, model_params = await asyncio.to_thread(_faq_or_cached, query)
+    if response is not None:
+        return response
+
+    try:
+        async with async_admission_controller.admit(priority):
+            ai_response = await get_async_llm_client().chat_text(_messages(query), deployment, **model_params)
+    except Overloaded as e:
+        return await asyncio.to_thread(_degraded, query, e)
+    response_cache.set(query, {"deployment": deployment, **model_params}, ai_response)
+    return {"response": ai_response, "confidence": 0.1}
@@ -0,0 +1,256 @@
+# escalation_rules.py
+
+import json
+import logging
+import os
+import random
+import re
+import string
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# Rules are loaded from this file and recompiled whenever it changes
+ESCALATION_RULES_FILE = os.getenv(
+    "ESCALATION_RULES_FILE", os.path.join(os.path.dirname(__file__), "escalation_rules.json")
+)
+
+# Minimum number of seconds between checks of the rules file's modification time
+RELOAD_CHECK_INTERVAL = 1.0
+
+PRIORITIES = {"low": 1, "normal": 2, "high": 3, "urgent": 4}
+
+class PhraseAutomaton:
+    """
+    Aho-Corasick automaton over lowercase phrases.
+
+    Finds every occurrence of every phrase in one left-to-right pass over the
+    text, so the cost of a match does not grow with the number of phrases.
+    Matching is by substring, like the `keyword in query.lower()` checks it
+    replaces.
+    """
+
+    def __init__(self, phrases):
+        # phrases: iterable of (phrase, value); a phrase can map to several values
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for phrase, value in phrases:
+            node = 0
+            for char in phrase.lower():
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = next_node
+            self._out[node] += (value,)
+
+        # Breadth-first so a node's failure link is final before its children use it
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                # Phrases that end here via a shorter suffix match as well
+                self._out[child] += self._out[self._fail[child]]
+
+    def __len__(self):
+        return len(self._goto)
+
+    def find(self, text: str) -> set:
+        """Returns the values of all phrases that occur in the text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+class EscalationRules:
+    """
+    Decides whether a customer query needs a human, from rules in a JSON file.
+
+    The file looks like {"low_confidence_threshold": 0.7, "rules": [{"name":
+    "urgent", "priority": "urgent", "keywords": ["urgent", "asap"]}, {"name":
+    "order number", "priority": "normal", "regex": ["order #?\\d{6,}"]}]}.
+    All keywords and phrases of all rules are compiled into one automaton, so
+    a query is scanned once for them no matter how many rules there are. Each
+    regex is searched on its own (skipping rules that already fired), so
+    overlapping matches of different rules all count and backreferences keep
+    their numbering. A match is combined with the agent's confidence score: a
+    query escalates when a rule fires or the confidence is below the threshold.
+    """
+
+    def __init__(self, path: str = ESCALATION_RULES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self._rules = []
+        self._automaton = PhraseAutomaton([])
+        self._patterns = []
+        self.low_confidence_threshold = None
+        self._hits = Counter()
+        self.evaluations = 0
+        # path=None means rules are only ever given to load()
+        if path is not None:
+            self.reload()
+
+    def reload(self):
+        """Recompiles the rules from the rules file."""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r") as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to load escalation rules {self.path}: {str(e)}")
+            return
+        try:
+            self.load(config)
+        except (re.error, ValueError) as e:
+            logger.error(f"Invalid escalation rules in {self.path}: {str(e)}")
+            return
+        self._mtime = mtime
+        logger.info(f"Compiled {len(self._rules)} escalation rules from {self.path}")
+
+    def load(self, config: dict):
+        """Compiles rules from an already parsed config."""
+        rules = []
+        phrases = []
+        patterns = []
+        for raw in config.get("rules", []):
+            name = raw.get("name")
+            priority = raw.get("priority", "normal")
+            if not name:
+                continue
+            if priority not in PRIORITIES:
+                raise ValueError(f"Rule {name!r} has unknown priority {priority!r}")
+            rule_id = len(rules)
+            rules.append({"name": name, "priority": priority})
+            for phrase in raw.get("keywords", []):
+                if phrase:
+                    phrases.append((phrase, rule_id))
+            for pattern in raw.get("regex", []):
+                try:
+                    patterns.append((rule_id, re.compile(pattern, re.IGNORECASE)))
+                except re.error as e:
+                    raise ValueError(f"Rule {name!r} has an invalid regex {pattern!r}: {str(e)}")
+
+        automaton = PhraseAutomaton(phrases)
+        with self._lock:
+            self._rules = rules
+            self._automaton = automaton
+            self._patterns = patterns
+            self.low_confidence_threshold = config.get("low_confidence_threshold")
+
+    def _maybe_reload(self):
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def match(self, query: str) -> list:
+        """Returns the rules that fire for the query, highest priority first."""
+        self._maybe_reload()
+        with self._lock:
+            rules, automaton, patterns = self._rules, self._automaton, self._patterns
+
+        fired = automaton.find(query)
+        for rule_id, pattern in patterns:
+            if rule_id not in fired and pattern.search(query):
+                fired.add(rule_id)
+
+        matched = sorted((rules[rule_id] for rule_id in fired),
+                         key=lambda rule: (-PRIORITIES[rule["priority"]], rule["name"]))
+        with self._lock:
+            self.evaluations += 1
+            self._hits.update(rule["name"] for rule in matched)
+        return matched
+
+    def evaluate(self, query: str, confidence: float = None) -> dict:
+        """
+        Returns {"escalate", "urgent", "priority", "rules", "low_confidence"} for the query.
+        priority is that of the highest firing rule ("normal" for low confidence alone).
+        """
+        matched = self.match(query)
+        threshold = self.low_confidence_threshold
+        low_confidence = confidence is not None and threshold is not None and confidence < threshold
+        if matched:
+            priority = matched[0]["priority"]
+        elif low_confidence:
+            priority = "normal"
+        else:
+            priority = None
+        return {
+            "escalate": bool(matched) or low_confidence,
+            "urgent": priority == "urgent",
+            "priority": priority,
+            "rules": [rule["name"] for rule in matched],
+            "low_confidence": low_confidence,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "evaluations": self.evaluations,
+                "rules": len(self._rules),
+                "automaton_states": len(self._automaton),
+                "hits": {rule["name"]: self._hits.get(rule["name"], 0) for rule in self._rules},
+            }
+
+escalation_rules = EscalationRules()
+
+def benchmark(phrase_counts=(10, 100, 1000, 5000), queries: int = 2000, seed: int = 0):
+    """Compares the automaton with a per-keyword substring scan as the rule set grows."""
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+    texts = [" ".join(word() for _ in range(30)) for _ in range(queries)]
+    for count in phrase_counts:
+        phrases = [" ".join(word() for _ in range(rng.randint(1, 3))) for _ in range(count)]
+        rules = EscalationRules(path=None)
+        rules.load({"rules": [{"name": f"rule{i}", "keywords": [p]} for i, p in enumerate(phrases)]})
+
+        start = time.perf_counter()
+        for text in texts:
+            lowered = text.lower()
+            [p for p in phrases if p in lowered]
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for text in texts:
+            rules.match(text)
+        automaton = time.perf_counter() - start
+        print(f"{count:>6} phrases: scan {scan / queries * 1e6:8.1f} us/query, "
+              f"automaton {automaton / queries * 1e6:8.1f} us/query")
+
+if __name__ == "__main__":
+    # python escalation_rules.py benchmark
+    if sys.argv[1:] == ["benchmark"]:
+        benchmark()
+    else:
+        print("Usage: python escalation_rules.py benchmark")
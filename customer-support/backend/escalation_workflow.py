@@ -1,18 +1,31 @@
 # escalation_workflow.py
+from common.metrics import span
+from escalation_rules import escalation_rules
+
+URGENT_RESPONSE = "Your query has been marked as urgent. A support agent will contact you immediately."
+# The urgent reply is fixed by the rules rather than generated, so it carries full confidence
+URGENT_CONFIDENCE = 1.0
+
+def evaluate_escalation(query: str, response_data: dict = None) -> dict:
+    """
+    Matches the query against the escalation rules, combined with the agent's
+    confidence; without response_data (before the agent runs) on the rules alone.
+    """
+    confidence = response_data.get("confidence", 1.0) if response_data is not None else None
+    with span("escalation"):
+        return escalation_rules.evaluate(query, confidence)
+
 def needs_escalation(response_data: dict, query: str) -> bool:
 
-    low_confidence = response_data.get("confidence", 1.0) < 0.7
-    critical_keywords = ["complaint", "urgent", "not satisfied", "escalate", "immediate", "asap"]
-    contains_critical = any(word in query.lower() for word in critical_keywords)
-    return low_confidence or contains_critical
+    return evaluate_escalation(query, response_data)["escalate"]
 
-def escalate_query(query: str, response_data: dict) -> str:
+def escalate_query(query: str, response_data: dict, decision: dict = None) -> str:
 
-    urgent_keywords = ["urgent", "immediate", "asap"]
-    if any(word in query.lower() for word in urgent_keywords):
-        default_message = "Your query has been marked as urgent. A support agent will contact you immediately."
-        escalation_message = f"Escalated Query (URGENT): {query}\nResponse: {default_message}"
+    if decision is None:
+        decision = evaluate_escalation(query, response_data)
+    if decision["urgent"]:
+        escalation_message = f"Escalated Query (URGENT): {query}\nResponse: {URGENT_RESPONSE}"
         return escalation_message
     else:
         escalation_message = f"Escalated Query: {query}\nResponse: {response_data.get('response')}"
-        return escalation_message
\ No newline at end of file
+        return escalation_message
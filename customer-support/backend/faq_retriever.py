@@ -1,15 +1,241 @@
 # faq_retriever.py
 
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# FAQ entries are loaded from this file once and re-indexed whenever it changes
+FAQ_FILE = os.getenv("FAQ_FILE", os.path.join(os.path.dirname(__file__), "faqs.json"))
+
+# Minimum number of seconds between checks of the FAQ file's modification time
+RELOAD_CHECK_INTERVAL = 1.0
+
+# FAQ answers at or above this confidence are returned without calling the LLM
+FAQ_CONFIDENCE_THRESHOLD = 0.85
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+class FAQIndex:
+    """
+    Inverted index over FAQ entries.
+
+    Each entry in the FAQ file looks like {"key": "return policy", "answer": "...",
+    "keywords": ["refund", ...]}. The key and the optional keywords are the phrases
+    a query is matched against. Candidates come from the token postings, are ranked
+    with BM25, and the confidence is the IDF-weighted share of the best matching
+    phrase's terms that appear in the query (1.0 when every term is present).
+
+    Every term also keeps an upper bound: the largest share it has of any phrase.
+    Query terms are scanned from the highest bound down, and the scan stops once
+    the bounds of the terms left add up to less than the best confidence found so
+    far, since no entry seen only through those terms could beat it (MaxScore
+    pruning). Common words with long posting lists are usually the ones skipped,
+    so lookups stay fast as the FAQ grows without changing any result.
+    """
+
+    def __init__(self, path: str = FAQ_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self._entries = []
+        self._postings = {}
+        self._bounds = {}
+        self.reload()
+
+    def reload(self):
+        """Rebuilds the index from the FAQ file."""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r") as f:
+                raw_entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to load FAQ file {self.path}: {str(e)}")
+            return
+
+        entries = []
+        term_freqs = defaultdict(dict)
+        doc_lengths = []
+        for raw in raw_entries:
+            key = raw.get("key")
+            answer = raw.get("answer")
+            if not key or not answer:
+                continue
+            phrases = [tokenize(p) for p in [key] + list(raw.get("keywords", []))]
+            phrases = [p for p in phrases if p]
+            if not phrases:
+                continue
+            doc_id = len(entries)
+            entries.append({"key": key, "answer": answer, "phrases": phrases, "terms": {}, "totals": []})
+            terms = [t for p in phrases for t in p]
+            doc_lengths.append(len(terms))
+            for term in terms:
+                term_freqs[term][doc_id] = term_freqs[term].get(doc_id, 0) + 1
+
+        n = len(entries)
+        idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in term_freqs.items()
+        }
+        avg_doc_length = (sum(doc_lengths) / n) if n else 0.0
+
+        # Per entry and term: its BM25 weight, and the IDF weight it adds to each phrase it occurs in
+        bounds = defaultdict(float)
+        for entry in entries:
+            for phrase_index, phrase in enumerate(entry.pop("phrases")):
+                total = sum(idf[t] for t in phrase)
+                entry["totals"].append(total)
+                for term in set(phrase):
+                    matched = idf[term] * phrase.count(term)
+                    entry["terms"].setdefault(term, [0.0, []])[1].append((phrase_index, matched))
+                    # Upper bound per term: its largest share of any phrase
+                    bounds[term] = max(bounds[term], matched / total)
+        for term, docs in term_freqs.items():
+            for doc_id, tf in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[doc_id] / avg_doc_length)
+                entries[doc_id]["terms"][term][0] = idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+        postings = {term: list(docs) for term, docs in term_freqs.items()}
+
+        # Swap the new index in as a whole so readers never see a partial build
+        with self._lock:
+            self._entries = entries
+            self._postings = postings
+            self._bounds = dict(bounds)
+            self._mtime = mtime
+        logger.info(f"Indexed {n} FAQ entries from {self.path}")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def _rank(self, entry: dict, query_terms: set) -> tuple:
+        """Returns (confidence, BM25 score) of one entry."""
+        matched = [0.0] * len(entry["totals"])
+        score = 0.0
+        for term, (weight, parts) in entry["terms"].items():
+            if term in query_terms:
+                score += weight
+                for phrase_index, value in parts:
+                    matched[phrase_index] += value
+        # Rounded so that summing in a different order cannot break a tie between full matches
+        confidence = max(m / total for m, total in zip(matched, entry["totals"]))
+        return round(confidence, 12), score
+
+    def search(self, query: str):
+        """Returns the best matching entry with its confidence, or None."""
+        self._maybe_reload()
+        with self._lock:
+            entries = self._entries
+            postings = self._postings
+            bounds = self._bounds
+
+        query_terms = set(tokenize(query))
+        terms = sorted((t for t in query_terms if t in postings), key=lambda t: bounds[t], reverse=True)
+        remaining = [0.0] * (len(terms) + 1)
+        for i in range(len(terms) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + bounds[terms[i]]
+
+        best = None
+        seen = set()
+        for i, term in enumerate(terms):
+            # Entries that contain none of the terms scanned so far cannot reach the best confidence found
+            if best is not None and remaining[i] + 1e-9 < best[0]:
+                break
+            for doc_id in postings[term]:
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                candidate = self._rank(entries[doc_id], query_terms) + (doc_id,)
+                if best is None or candidate > best:
+                    best = candidate
+
+        if best is None:
+            return None
+        confidence, score, doc_id = best
+        return {
+            "key": entries[doc_id]["key"],
+            "response": entries[doc_id]["answer"],
+            "confidence": round(confidence, 3),
+            "score": score,
+        }
+
+faq_index = FAQIndex()
+
 def retrieve_faq_response(query: str) -> dict:
 
-    faq_db = {
-        "hours": "Our business hours are from 9 AM to 5 PM, Monday through Friday.",
-        "return policy": "You can return any item within 30 days of purchase with a receipt.",
-        "shipping": "We offer free shipping on orders over $50."
-    }
-    
-    query_lower = query.lower()
-    for key, answer in faq_db.items():
-        if key in query_lower:
-            return {"response": answer, "confidence": 0.9}
-    return None
\ No newline at end of file
+    match = faq_index.search(query)
+    if match is None:
+        return None
+    return {"response": match["response"], "confidence": match["confidence"]}
+
+def benchmark(sizes=(10, 100, 1000, 10000, 100000), queries: int = 2000):
+    """Lookup latency as the FAQ grows, against the substring scan the index replaced."""
+    import random
+    import tempfile
+
+    rng = random.Random(0)
+    topics = ["return policy", "shipping time", "warranty claim", "order status", "reset password",
+              "cancel subscription", "change address", "gift card balance", "price match", "store hours",
+              "damaged item", "missing package", "payment declined", "invoice copy", "track refund"]
+    for n in sizes:
+        # One entry per topic and product, with a product name only that entry uses
+        entries = [{"key": f"{topics[i % len(topics)]} model{i // len(topics)}",
+                    "answer": f"Answer {i}.", "keywords": [f"sku{i}"]} for i in range(n)]
+        picks = [rng.randrange(n) for _ in range(queries)]
+        questions = [f"what is the {topics[i % len(topics)]} for my model{i // len(topics)} please" for i in picks]
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "faqs.json")
+            with open(path, "w") as f:
+                json.dump(entries, f)
+            start = time.perf_counter()
+            index = FAQIndex(path)
+            build = time.perf_counter() - start
+            latencies = []
+            for question, i in zip(questions, picks):
+                start = time.perf_counter()
+                match = index.search(question)
+                latencies.append(time.perf_counter() - start)
+                assert match["key"] == entries[i]["key"]
+        latencies.sort()
+
+        # What every query used to cost: a substring check of each key
+        keys = {entry["key"]: entry["answer"] for entry in entries}
+        start = time.perf_counter()
+        for question in questions[:100]:
+            next((answer for key, answer in keys.items() if key in question), None)
+        scan = (time.perf_counter() - start) / 100
+
+        print(f"{n:7d} entries  build {build * 1000:8.1f} ms  "
+              f"p50 {latencies[len(latencies) // 2] * 1e6:7.1f} us  p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} us  "
+              f"substring scan {scan * 1e6:9.1f} us")
+
+if __name__ == "__main__":
+    # python faq_retriever.py benchmark [largest size]
+    if sys.argv[1:2] == ["benchmark"]:
+        largest = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+        benchmark([n for n in (10, 100, 1000, 10000, 100000, 1000000) if n <= largest])
+    else:
+        print("Usage: python faq_retriever.py benchmark [largest size]")
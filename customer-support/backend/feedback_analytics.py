@@ -0,0 +1,354 @@
+# feedback_analytics.py
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from faq_retriever import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Aggregates are saved here so a restart only replays the log written since
+CHECKPOINT_FILE = os.getenv("FEEDBACK_ANALYTICS_CHECKPOINT", "")
+
+# Minimum number of seconds between two checkpoints
+CHECKPOINT_INTERVAL = float(os.getenv("FEEDBACK_ANALYTICS_CHECKPOINT_INTERVAL", "30"))
+
+# Distinct normalized queries tallied individually; votes on further queries only count in the totals
+MAX_QUERIES = int(os.getenv("FEEDBACK_ANALYTICS_MAX_QUERIES", "100000"))
+
+# Distinct feedback values tallied individually; anything beyond is counted as "other"
+MAX_VALUES = 16
+
+# Rolling windows, in minutes
+WINDOWS = {"1h": 60, "24h": 24 * 60, "7d": 7 * 24 * 60}
+
+CHECKPOINT_VERSION = 1
+
+# The log is replayed in reads of this many bytes
+READ_SIZE = 4 * 1024 * 1024
+
+def normalize_query(query: str) -> str:
+    """Lower-cased query terms separated by single spaces, so trivially different phrasings share a tally."""
+    return " ".join(tokenize(query or ""))
+
+def _increment(counts: dict, value: str, n: int = 1):
+    counts[value] = counts.get(value, 0) + n
+
+class _Window:
+    """Vote counts of the last `minutes` minutes, kept as per-minute buckets plus their running sum."""
+
+    def __init__(self, minutes: int):
+        self.minutes = minutes
+        self.buckets = deque()
+        self.counts = {}
+
+    def expire(self, now_minute: int):
+        while self.buckets and self.buckets[0][0] <= now_minute - self.minutes:
+            _, bucket = self.buckets.popleft()
+            for value, n in bucket.items():
+                self.counts[value] -= n
+                if not self.counts[value]:
+                    del self.counts[value]
+
+    def summary(self) -> dict:
+        return {"total": sum(self.counts.values()), "by_value": dict(self.counts)}
+
+class FeedbackAnalytics:
+    """
+    Running aggregates over the feedback log.
+
+    catch_up() parses only the bytes appended to the log since the last call,
+    so keeping the aggregates current costs the same per vote however long the
+    log is. It runs after this process flushes its own votes and at the start
+    of every summary(), so votes other worker processes appended to the log
+    are counted by the time stats are read. The aggregates and the log offset
+    they cover are checkpointed to disk from the flush path (never from
+    summary(), which only reads); on startup the checkpoint is loaded
+    and only the rest of the log is replayed. A missing or stale checkpoint
+    (the log was replaced, e.g. by compaction) means a full rebuild from the log.
+    """
+
+    def __init__(self, log_path: str, checkpoint_path: str = CHECKPOINT_FILE,
+                 checkpoint_interval: float = CHECKPOINT_INTERVAL, max_queries: int = MAX_QUERIES):
+        self.log_path = log_path
+        self.checkpoint_path = checkpoint_path or os.path.splitext(log_path)[0] + ".analytics.json"
+        self.checkpoint_interval = checkpoint_interval
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+        self._last_checkpoint = time.monotonic()
+        self._reset()
+        self._load_checkpoint()
+        self.catch_up()
+
+    def _reset(self, inode: int = None):
+        self._inode = inode
+        self._offset = 0
+        self._total = 0
+        self._by_value = {}
+        self._by_faq = {}
+        self._by_query = {}
+        self._untracked_queries = 0
+        self._windows = {name: _Window(minutes) for name, minutes in WINDOWS.items()}
+        self._latest_minute = None
+        self._latest_bucket = None
+
+    def _value(self, entry: dict) -> str:
+        value = str(entry.get("feedback", "")).strip().lower()
+        if value not in self._by_value and len(self._by_value) >= MAX_VALUES:
+            return "other"
+        return value
+
+    def _apply(self, entry: dict, now_minute: int):
+        value = self._value(entry)
+        self._total += 1
+        _increment(self._by_value, value)
+
+        faq_key = entry.get("faq_key")
+        if faq_key:
+            _increment(self._by_faq.setdefault(faq_key, {}), value)
+
+        query = normalize_query(entry.get("query"))
+        tallies = self._by_query.get(query)
+        if tallies is None:
+            if len(self._by_query) >= self.max_queries:
+                self._untracked_queries += 1
+                tallies = None
+            else:
+                tallies = self._by_query[query] = {}
+        if tallies is not None:
+            _increment(tallies, value)
+
+        timestamp = entry.get("timestamp")
+        if isinstance(timestamp, (int, float)):
+            self._add_to_windows(int(timestamp // 60), {value: 1}, now_minute)
+
+    def _add_to_windows(self, minute: int, counts: dict, now_minute: int):
+        # Several processes append to the log, so entries can be a few seconds out of order:
+        # those are counted in the newest minute rather than searching for an older bucket
+        if self._latest_minute is not None and minute < self._latest_minute:
+            minute = self._latest_minute
+        if minute != self._latest_minute:
+            self._latest_minute = minute
+            self._latest_bucket = {}
+            for window in self._windows.values():
+                if minute > now_minute - window.minutes:
+                    window.buckets.append((minute, self._latest_bucket))
+        for value, n in counts.items():
+            _increment(self._latest_bucket, value, n)
+            for window in self._windows.values():
+                if minute > now_minute - window.minutes:
+                    _increment(window.counts, value, n)
+
+    def _expire(self, now_minute: int):
+        for window in self._windows.values():
+            window.expire(now_minute)
+
+    def catch_up(self, checkpoint: bool = True):
+        """
+        Applies the entries appended to the log since the last call, then saves a
+        checkpoint if checkpoint_interval has passed (unless checkpoint is False).
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.log_path)
+            except FileNotFoundError:
+                return
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                if self._inode is not None:
+                    logger.info(f"Feedback log {self.log_path} was replaced, rebuilding analytics")
+                self._reset(stat.st_ino)
+            if stat.st_size > self._offset:
+                self._replay(stat.st_size)
+            if checkpoint and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                self._save_checkpoint()
+
+    def _replay(self, size: int):
+        now_minute = int(time.time() // 60)
+        self._expire(now_minute)
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offset)
+            remaining = size - self._offset
+            pending = b""
+            while remaining > 0:
+                chunk = f.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                data = pending + chunk
+                end = data.rfind(b"\n")
+                if end < 0:
+                    pending = data
+                    continue
+                for line in data[:end].split(b"\n"):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, dict):
+                        self._apply(entry, now_minute)
+                # Only whole lines are consumed; a line still being written is read next time
+                self._offset += end + 1
+                pending = data[end + 1:]
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                state = json.load(f)
+            if state.get("version") != CHECKPOINT_VERSION:
+                return
+            stat = os.stat(self.log_path)
+            if state["inode"] != stat.st_ino or state["offset"] > stat.st_size:
+                logger.info(f"Ignoring stale feedback analytics checkpoint {self.checkpoint_path}")
+                return
+            self._reset(state["inode"])
+            self._offset = state["offset"]
+            self._total = state["total"]
+            self._by_value = state["by_value"]
+            self._by_faq = state["by_faq"]
+            self._by_query = state["by_query"]
+            self._untracked_queries = state["untracked_queries"]
+            now_minute = int(time.time() // 60)
+            for minute, counts in state["buckets"]:
+                self._add_to_windows(minute, counts, now_minute)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Failed to load feedback analytics checkpoint {self.checkpoint_path}: {str(e)}")
+            self._reset()
+
+    def _save_checkpoint(self):
+        # The longest window holds every bucket the others do
+        longest = max(self._windows.values(), key=lambda w: w.minutes)
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "inode": self._inode,
+            "offset": self._offset,
+            "total": self._total,
+            "by_value": self._by_value,
+            "by_faq": self._by_faq,
+            "by_query": self._by_query,
+            "untracked_queries": self._untracked_queries,
+            "buckets": list(longest.buckets),
+        }
+        # Every worker process keeps complete aggregates, so whichever writes last is as good as any
+        temp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.checkpoint_path)
+        except OSError as e:
+            logger.error(f"Failed to write feedback analytics checkpoint: {str(e)}")
+        self._last_checkpoint = time.monotonic()
+
+    def checkpoint(self):
+        with self._lock:
+            self._save_checkpoint()
+
+    def close(self):
+        self.catch_up()
+        self.checkpoint()
+
+    def summary(self) -> dict:
+        """Totals, rolling windows and per-FAQ tallies, after catching up on the log."""
+        # Stats requests only fold in new lines; checkpoints are written after flushes
+        self.catch_up(checkpoint=False)
+        with self._lock:
+            self._expire(int(time.time() // 60))
+            positive = self._by_value.get("positive", 0)
+            return {
+                "total": self._total,
+                "by_value": dict(self._by_value),
+                "positive_rate": round(positive / self._total, 4) if self._total else None,
+                "windows": {name: window.summary() for name, window in self._windows.items()},
+                "by_faq": {key: dict(counts) for key, counts in self._by_faq.items()},
+                "tracked_queries": len(self._by_query),
+                "untracked_queries": self._untracked_queries,
+            }
+
+    def query_tallies(self, query: str) -> dict:
+        with self._lock:
+            return dict(self._by_query.get(normalize_query(query), {}))
+
+    def faq_tallies(self, faq_key: str) -> dict:
+        with self._lock:
+            return dict(self._by_faq.get(faq_key, {}))
+
+def naive_summary(log_path: str) -> dict:
+    """What a dashboard had to do before: parse the whole log on every request."""
+    total, by_value = 0, {}
+    with open(log_path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            total += 1
+            _increment(by_value, str(entry.get("feedback", "")).strip().lower())
+    return {"total": total, "by_value": by_value}
+
+def benchmark(n: int = 1_000_000):
+    """Full rebuild, checkpoint restore, incremental catch-up and summary latency over n synthetic votes."""
+    import random
+    import tempfile
+
+    rng = random.Random(0)
+    questions = [f"where is my order number {i}" for i in range(5000)] + ["what is the return policy"] * 500
+    faq_keys = ["return policy", "shipping time", "business hours", None, None]
+    now = time.time()
+
+    def entries(count: int, start: float):
+        for i in range(count):
+            yield {"query": rng.choice(questions), "response": "An answer.",
+                   "feedback": "positive" if rng.random() < 0.7 else "negative",
+                   "faq_key": rng.choice(faq_keys), "timestamp": start + i * (7 * 86400 / n)}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        log_path = os.path.join(workdir, "feedbacks.jsonl")
+        with open(log_path, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries(n, now - 7 * 86400))
+        print(f"{n} entries, {os.path.getsize(log_path) / 1e6:.0f} MB")
+
+        start = time.perf_counter()
+        analytics = FeedbackAnalytics(log_path, checkpoint_interval=float("inf"))
+        print(f"full rebuild:        {time.perf_counter() - start:8.3f} s")
+
+        start = time.perf_counter()
+        analytics.checkpoint()
+        print(f"checkpoint write:    {time.perf_counter() - start:8.3f} s")
+
+        with open(log_path, "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries(1000, now))
+        start = time.perf_counter()
+        restored = FeedbackAnalytics(log_path, checkpoint_interval=float("inf"))
+        print(f"restore + 1000 new:  {time.perf_counter() - start:8.3f} s")
+
+        with open(log_path, "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries(100, now))
+        start = time.perf_counter()
+        restored.catch_up()
+        print(f"catch-up of 100:     {(time.perf_counter() - start) * 1000:8.3f} ms")
+
+        rounds = 1000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            summary = restored.summary()
+        print(f"summary:             {(time.perf_counter() - start) / rounds * 1000:8.3f} ms")
+
+        start = time.perf_counter()
+        naive = naive_summary(log_path)
+        print(f"full-log rescan:     {(time.perf_counter() - start) * 1000:8.3f} ms")
+
+        assert summary["total"] == naive["total"] == n + 1100
+        assert summary["by_value"] == naive["by_value"]
+
+if __name__ == "__main__":
+    # python feedback_analytics.py benchmark [entries]
+    if sys.argv[1:2] == ["benchmark"]:
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+    else:
+        print("Usage: python feedback_analytics.py benchmark [entries]")
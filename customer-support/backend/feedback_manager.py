@@ -1,34 +1,282 @@
 # feedback_manager.py
 
+import atexit
+import itertools
 import json
+import logging
 import os
+import sys
+import threading
+import time
 
-feedback_db = []
+from faq_retriever import FAQ_CONFIDENCE_THRESHOLD, faq_index
+from feedback_analytics import FeedbackAnalytics
 
-# Define the file path for storing feedback
-FEEDBACK_FILE = os.path.join(os.path.dirname(__file__), "feedbacks.json")
+logger = logging.getLogger(__name__)
 
-def load_feedbacks():
-    global feedback_db
-    if os.path.exists(FEEDBACK_FILE):
-        with open(FEEDBACK_FILE, "r") as f:
+# Feedback is stored as JSON Lines: one entry per line, only ever appended to
+FEEDBACK_FILE = os.getenv("FEEDBACK_FILE", os.path.join(os.path.dirname(__file__), "feedbacks.jsonl"))
+
+# Older versions rewrote a single JSON array on every vote
+LEGACY_FEEDBACK_FILE = os.path.join(os.path.dirname(__file__), "feedbacks.json")
+
+# Buffered entries are written at least this often (seconds)
+FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "0.5"))
+
+# Writers block once this many entries are waiting to be flushed
+MAX_BUFFERED_ENTRIES = int(os.getenv("FEEDBACK_MAX_BUFFERED", "1000"))
+
+# fsync after every group commit (slower, but survives power loss)
+FSYNC = os.getenv("FEEDBACK_FSYNC", "false").lower() == "true"
+
+# Reads remember where every this many entries start, so a page deep in the log is found without a rescan
+PAGE_SIZE = 1000
+
+class FeedbackStore:
+    """
+    Append-only JSON Lines feedback log with group commit.
+
+    record() only puts the entry in an in-memory buffer. A background thread
+    writes everything buffered so far with a single append, so the cost per
+    vote does not depend on how many entries the file already holds. Each batch
+    is one write() on a file opened in append mode, so several worker processes
+    can share the same log.
+    """
+
+    def __init__(self, path: str = FEEDBACK_FILE, flush_interval: float = FLUSH_INTERVAL,
+                 max_buffered: int = MAX_BUFFERED_ENTRIES, fsync: bool = FSYNC):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.fsync = fsync
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._listeners = []
+        # Byte offset of every PAGE_SIZE-th entry, learned while reading; the log is
+        # only appended to, so they stay valid until it is replaced by compaction
+        self._page_lock = threading.Lock()
+        self._page_inode = None
+        self._page_offsets = [0]
+        self._migrate_legacy_file()
+        self._thread = threading.Thread(target=self._run, name="feedback-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _migrate_legacy_file(self):
+        if os.path.exists(self.path) or not os.path.exists(LEGACY_FEEDBACK_FILE):
+            return
+        try:
+            with open(LEGACY_FEEDBACK_FILE, "r") as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            entries = []
+        self._append(entries)
+        os.replace(LEGACY_FEEDBACK_FILE, LEGACY_FEEDBACK_FILE + ".migrated")
+        logger.info(f"Migrated {len(entries)} feedback entries to {self.path}")
+
+    def _append(self, batch: list):
+        data = "".join(json.dumps(entry) + "\n" for entry in batch)
+        with open(self.path, "a") as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def add_listener(self, callback):
+        """Calls callback() after every batch is appended to the log."""
+        self._listeners.append(callback)
+
+    def _take_batch(self) -> list:
+        batch = self._buffer
+        self._buffer = []
+        self._cond.notify_all()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._buffer and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
             try:
-                feedback_db = json.load(f)
-            except json.JSONDecodeError:
-                feedback_db = []
-    else:
-        feedback_db = []
+                self.flush()
+            except OSError as e:
+                logger.error(f"Failed to write feedback batch: {str(e)}")
+            if closed:
+                return
+
+    def record(self, entry: dict):
+        with self._cond:
+            while len(self._buffer) >= self.max_buffered and not self._closed:
+                self._cond.notify_all()
+                self._cond.wait()
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.max_buffered:
+                self._cond.notify_all()
 
-def save_feedbacks():
-    with open(FEEDBACK_FILE, "w") as f:
-        json.dump(feedback_db, f, indent=2)
+    def flush(self):
+        """Writes everything buffered so far before returning."""
+        # The write lock is held from taking the batch until it is on disk, so a batch
+        # taken earlier (e.g. by the flusher thread) is always appended first
+        with self._write_lock:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._append(batch)
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Feedback write listener failed: {str(e)}")
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def iter_entries(self, offset: int = 0):
+        """Streams entries from the log, skipping lines left partial by a crash."""
+        self.flush()
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            with self._page_lock:
+                if inode != self._page_inode:
+                    self._page_inode = inode
+                    self._page_offsets = [0]
+                # Start from the nearest remembered entry at or before offset
+                page = min(offset // PAGE_SIZE, len(self._page_offsets) - 1)
+                position = self._page_offsets[page]
+            f.seek(position)
+            index = page * PAGE_SIZE
+            for line in f:
+                # A line without its newline is still being written by another process
+                if not line.endswith(b"\n"):
+                    return
+                position += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if index >= offset:
+                    yield entry
+                index += 1
+                if index % PAGE_SIZE == 0:
+                    self._remember_page(inode, index // PAGE_SIZE, position)
+
+    def _remember_page(self, inode: int, page: int, position: int):
+        with self._page_lock:
+            if inode == self._page_inode and page == len(self._page_offsets):
+                self._page_offsets.append(position)
+
+    def read(self, offset: int = 0, limit: int = None) -> list:
+        entries = self.iter_entries(offset)
+        if limit is not None:
+            entries = itertools.islice(entries, limit)
+        return list(entries)
+
+    def compact(self) -> int:
+        """
+        Rewrites the log without malformed lines and swaps it in atomically.
+        Run it while no other process is appending to the same file.
+        """
+        self.flush()
+        with self._write_lock:
+            temp_path = self.path + ".compact"
+            kept = 0
+            with open(self.path, "r") as src, open(temp_path, "w") as dst:
+                for line in src:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    dst.write(json.dumps(entry) + "\n")
+                    kept += 1
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(temp_path, self.path)
+        with self._page_lock:
+            self._page_inode = None
+            self._page_offsets = [0]
+        return kept
+
+feedback_store = FeedbackStore()
+
+# Kept up to date by tailing the log after every group commit
+feedback_analytics = FeedbackAnalytics(feedback_store.path)
+feedback_store.add_listener(feedback_analytics.catch_up)
+atexit.register(feedback_analytics.close)
 
 def record_feedback(query: str, ai_response: str, feedback: str):
-    entry = {"query": query, "response": ai_response, "feedback": feedback}
-    feedback_db.append(entry)
-    save_feedbacks()  # Save the updated feedback to file
+    match = faq_index.search(query)
+    faq_key = match["key"] if match is not None and match["confidence"] >= FAQ_CONFIDENCE_THRESHOLD else None
+    entry = {"query": query, "response": ai_response, "feedback": feedback,
+             "faq_key": faq_key, "timestamp": time.time()}
+    feedback_store.record(entry)
     return entry
 
-def get_feedback():
-    load_feedbacks()  # Reload from file to ensure the latest data is returned
-    return feedback_db
\ No newline at end of file
+def get_feedback(offset: int = 0, limit: int = None):
+    return feedback_store.read(offset, limit)
+
+def get_feedback_stats(query: str = None, faq_key: str = None) -> dict:
+    stats = feedback_analytics.summary()
+    if query is not None:
+        stats["query"] = {"query": query, "by_value": feedback_analytics.query_tallies(query)}
+    if faq_key is not None:
+        stats["faq"] = {"faq_key": faq_key, "by_value": feedback_analytics.faq_tallies(faq_key)}
+    return stats
+
+def benchmark(n: int = 1_000_000):
+    """Per-write cost as the log grows to n entries, paginated reads, and the old rewrite-everything store."""
+    import tempfile
+
+    windows = 10
+    with tempfile.TemporaryDirectory() as workdir:
+        store = FeedbackStore(os.path.join(workdir, "feedbacks.jsonl"))
+        entry = {"query": "where is my order", "response": "It shipped yesterday.", "feedback": "positive",
+                 "faq_key": None, "timestamp": time.time()}
+        print(f"writing {n} entries through record() (flushed by the background thread)")
+        for window in range(windows):
+            start = time.perf_counter()
+            for _ in range(n // windows):
+                store.record(dict(entry))
+            store.flush()
+            elapsed = time.perf_counter() - start
+            print(f"  entries {window * n // windows:8d}-{(window + 1) * n // windows:8d}: "
+                  f"{elapsed / (n // windows) * 1e6:6.2f} us per write")
+        print(f"log size: {os.path.getsize(store.path) / 1e6:.0f} MB")
+
+        for label in ("first read", "second read"):
+            for offset in (0, n // 2, n - 100):
+                start = time.perf_counter()
+                page = store.read(offset, 100)
+                print(f"  {label:<11} offset {offset:8d}: {(time.perf_counter() - start) * 1000:8.2f} ms")
+                assert len(page) == 100
+        store.close()
+
+        # Before: the whole list was rewritten with indent=2 on every vote
+        legacy_path = os.path.join(workdir, "feedbacks.json")
+        for size in (1000, 10000, 100000):
+            entries = [entry] * size
+            start = time.perf_counter()
+            with open(legacy_path, "w") as f:
+                json.dump(entries, f, indent=2)
+            print(f"legacy store, one write at {size:6d} entries: {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    # python feedback_manager.py compact | benchmark [entries]
+    if sys.argv[1:] == ["compact"]:
+        print(f"Compacted feedback log: {feedback_store.compact()} entries kept.")
+    elif sys.argv[1:2] == ["benchmark"]:
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+    else:
+        print("Usage: python feedback_manager.py compact | benchmark [entries]")
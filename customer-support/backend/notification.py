@@ -1,7 +1,66 @@
 # notification.py
 
+import hashlib
+import json
+import logging
 import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from common.metrics import record_upstream, span
+
+logger = logging.getLogger(__name__)
+
+# Pending notifications are kept here until the Logic App accepts them
+SPOOL_DIR = os.getenv("NOTIFICATION_SPOOL_DIR", os.path.join(os.path.dirname(__file__), "notification_spool"))
+
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+# (connect, read) timeout for the Logic App call
+REQUEST_TIMEOUT = (3.05, 15)
+# A worker waits this long (seconds) for more notifications to send in the same batch
+BATCH_WINDOW = float(os.getenv("NOTIFICATION_BATCH_WINDOW", "1.0"))
+MAX_BATCH_SIZE = 20
+# Number of finished notifications whose status is kept for lookups
+MAX_TRACKED_STATUSES = 10000
+# A claimed spool file older than this (seconds) is returned to the spool on the next start;
+# it must be longer than a notification can spend retrying
+CLAIM_TIMEOUT = float(os.getenv("NOTIFICATION_CLAIM_TIMEOUT", "600"))
+
+FINAL_STATUSES = ("sent", "failed", "not_configured", "handed_off")
+
+SUBJECT = "Customer Service Query Escalation"
+
+# Shared keep-alive connection pool for all Logic App calls
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(NOTIFICATION_WORKERS, 1))
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+def _post_to_logic_app(logic_app_url: str, subject: str, body: str) -> int:
+    payload = {
+        "subject": subject,
+        "body": body,
+        "to": os.getenv("SUPPORT_EMAIL")
+    }
+    try:
+        with span("notification.send"):
+            response = _session.post(logic_app_url, json=payload, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        record_upstream("logic_app", "error")
+        raise
+    outcome = "ok" if response.status_code in (200, 202) else "error"
+    record_upstream("logic_app", outcome, sent=len(response.request.body or b""), received=len(response.content))
+    return response.status_code
 
 def send_notification_via_logic_app(escalation_message: str):
     """
@@ -11,14 +70,251 @@ def send_notification_via_logic_app(escalation_message: str):
     if not logic_app_url:
         return "Logic App trigger URL not configured."
 
-    payload = {
-        "subject": "Customer Service Query Escalation",
-        "body": escalation_message,
-        "to": os.getenv("SUPPORT_EMAIL")
-    }
-
-    response = requests.post(logic_app_url, json=payload)
-    if response.status_code in [200, 202]:
+    status_code = _post_to_logic_app(logic_app_url, SUBJECT, escalation_message)
+    if status_code in [200, 202]:
         return "Notification sent successfully."
     else:
-        return f"Failed to send notification. Status code: {response.status_code}"
\ No newline at end of file
+        return f"Failed to send notification. Status code: {status_code}"
+
+class NotificationDispatcher:
+    """
+    Sends escalation notifications from background worker threads.
+
+    submit() writes the notification to the spool directory, queues it and
+    returns its ID straight away. Workers drain the queue in batches:
+    notifications that share a batch_key and are picked up within BATCH_WINDOW
+    are sent as one Logic App call, and the rest (including every notification
+    without a batch_key) are sent on their own. Submitting a message identical
+    to one still pending returns the existing ID instead of sending it twice.
+    Failed calls are retried with jittered exponential backoff.
+
+    Several worker processes can share a spool directory. Before sending, a
+    worker claims the spool file by renaming it into sending/, so a
+    notification re-queued by more than one process is still sent once. The
+    claimed file is removed once the Logic App accepts it. On startup, files
+    left in the spool are re-queued, and claims older than CLAIM_TIMEOUT (their
+    process died mid-send) are returned to it.
+    """
+
+    def __init__(self, spool_dir: str = SPOOL_DIR, workers: int = NOTIFICATION_WORKERS):
+        self.spool_dir = spool_dir
+        self.sending_dir = os.path.join(spool_dir, "sending")
+        os.makedirs(self.sending_dir, exist_ok=True)
+        self._queue = queue.Queue()
+        self._lock = threading.RLock()
+        # Notifications still queued or being sent; never trimmed, or they would not be sent
+        self._statuses = {}
+        # Finished notifications, oldest first, kept for status lookups up to MAX_TRACKED_STATUSES
+        self._finished = OrderedDict()
+        self._pending_by_hash = {}
+        self._recover_spool()
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"notification-worker-{i}", daemon=True).start()
+
+    def _spool_path(self, notification_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{notification_id}.json")
+
+    def _claimed_path(self, notification_id: str) -> str:
+        return os.path.join(self.sending_dir, f"{notification_id}.json")
+
+    def _move_aside(self, path: str, subdir: str):
+        target_dir = os.path.join(self.spool_dir, subdir)
+        os.makedirs(target_dir, exist_ok=True)
+        try:
+            os.replace(path, os.path.join(target_dir, os.path.basename(path)))
+        except FileNotFoundError:
+            pass
+
+    def _recover_spool(self):
+        now = time.time()
+        for name in os.listdir(self.sending_dir):
+            path = os.path.join(self.sending_dir, name)
+            try:
+                if now - os.path.getmtime(path) > CLAIM_TIMEOUT:
+                    os.rename(path, os.path.join(self.spool_dir, name))
+                    logger.info(f"Returned stale claim {name} to the notification spool")
+            except FileNotFoundError:
+                pass
+
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if not name.endswith(".json") or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, "r") as f:
+                    item = json.load(f)
+            except FileNotFoundError:
+                # Claimed by another process since the listing
+                continue
+            except (OSError, ValueError):
+                item = None
+            if (not isinstance(item, dict) or not isinstance(item.get("id"), str)
+                    or not isinstance(item.get("message"), str) or name != f"{item['id']}.json"):
+                logger.error(f"Moving invalid spool file {name} to {os.path.join(self.spool_dir, 'invalid')}")
+                self._move_aside(path, "invalid")
+                continue
+            self._track(item["id"], item["message"], "queued", item.get("batch_key"))
+            self._queue.put(item["id"])
+        if not self._queue.empty():
+            logger.info(f"Re-queued {self._queue.qsize()} spooled notifications")
+
+    def _track(self, notification_id: str, message: str, status: str, batch_key: str = None):
+        message_hash = hashlib.sha1(message.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._statuses[notification_id] = {
+                "id": notification_id,
+                "status": status,
+                "attempts": 0,
+                "message": message,
+                "hash": message_hash,
+                "batch_key": batch_key,
+                "updated": time.time(),
+            }
+            self._pending_by_hash[message_hash] = notification_id
+
+    def _record(self, notification_id: str):
+        return self._statuses.get(notification_id) or self._finished.get(notification_id)
+
+    def _update(self, notification_id: str, **fields):
+        with self._lock:
+            record = self._record(notification_id)
+            if record is None:
+                return
+            record.update(fields, updated=time.time())
+            if record["status"] in FINAL_STATUSES:
+                if self._pending_by_hash.get(record["hash"]) == notification_id:
+                    del self._pending_by_hash[record["hash"]]
+                self._statuses.pop(notification_id, None)
+                self._finished[notification_id] = record
+                self._finished.move_to_end(notification_id)
+                while len(self._finished) > MAX_TRACKED_STATUSES:
+                    self._finished.popitem(last=False)
+
+    def submit(self, message: str, batch_key: str = None) -> str:
+        """
+        Queues a notification and returns its ID. Notifications with the same
+        batch_key (e.g. one customer's) may be merged into one message.
+        """
+        message_hash = hashlib.sha1(message.encode("utf-8")).hexdigest()
+        with self._lock:
+            existing = self._pending_by_hash.get(message_hash)
+            if existing is not None:
+                return existing
+
+            notification_id = uuid.uuid4().hex
+            item = {"id": notification_id, "message": message, "batch_key": batch_key, "created": time.time()}
+            with open(self._spool_path(notification_id), "w") as f:
+                json.dump(item, f)
+            self._track(notification_id, message, "queued", batch_key)
+        self._queue.put(notification_id)
+        return notification_id
+
+    def status(self, notification_id: str):
+        with self._lock:
+            record = self._record(notification_id)
+            if record is None:
+                return None
+            return {k: v for k, v in record.items() if k not in ("message", "hash", "batch_key")}
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + BATCH_WINDOW
+        while len(batch) < MAX_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _group(self, batch: list) -> list:
+        """Splits a batch into the groups sent as one call each."""
+        groups = {}
+        with self._lock:
+            for notification_id in batch:
+                record = self._statuses.get(notification_id)
+                batch_key = record["batch_key"] if record is not None else None
+                key = ("key", batch_key) if batch_key is not None else ("id", notification_id)
+                groups.setdefault(key, []).append(notification_id)
+        return list(groups.values())
+
+    def _claim(self, notification_id: str) -> bool:
+        try:
+            os.rename(self._spool_path(notification_id), self._claimed_path(notification_id))
+        except FileNotFoundError:
+            return False
+        # The claim's age is measured from now, not from when the notification was spooled
+        os.utime(self._claimed_path(notification_id))
+        return True
+
+    def _run(self):
+        while True:
+            for group in self._group(self._next_batch()):
+                try:
+                    self._send_batch(group)
+                except Exception as e:
+                    logger.error(f"Notification worker error: {str(e)}")
+                    for notification_id in group:
+                        self._update(notification_id, status="failed", error=str(e))
+                        self._move_aside(self._claimed_path(notification_id), "failed")
+
+    def _send_batch(self, batch: list):
+        claimed = []
+        for notification_id in batch:
+            if self._claim(notification_id):
+                claimed.append(notification_id)
+            else:
+                # Another worker process re-queued the same spool file and got to it first
+                self._update(notification_id, status="handed_off")
+        batch = claimed
+        with self._lock:
+            messages = [self._statuses[n]["message"] for n in batch if n in self._statuses]
+        if not messages:
+            return
+
+        logic_app_url = os.getenv("LOGIC_APP_TRIGGER_URL")
+        if not logic_app_url:
+            for notification_id in batch:
+                self._update(notification_id, status="not_configured")
+                self._remove_claim(notification_id)
+            return
+
+        subject = SUBJECT if len(messages) == 1 else f"{SUBJECT} ({len(messages)} queries)"
+        body = "\n\n---\n\n".join(messages)
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            for notification_id in batch:
+                self._update(notification_id, status="sending", attempts=attempt)
+            try:
+                status_code = _post_to_logic_app(logic_app_url, subject, body)
+                error = f"Status code: {status_code}"
+            except requests.RequestException as e:
+                status_code = None
+                error = str(e)
+
+            if status_code in (200, 202):
+                for notification_id in batch:
+                    self._update(notification_id, status="sent")
+                    self._remove_claim(notification_id)
+                return
+            # Client errors other than throttling will not succeed on retry
+            if status_code is not None and 400 <= status_code < 500 and status_code != 429:
+                break
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+
+        logger.error(f"Failed to send {len(batch)} notification(s): {error}")
+        for notification_id in batch:
+            self._update(notification_id, status="failed", error=error)
+            # Keep the message around for manual follow-up, but out of the retry queue
+            self._move_aside(self._claimed_path(notification_id), "failed")
+
+    def _remove_claim(self, notification_id: str):
+        try:
+            os.remove(self._claimed_path(notification_id))
+        except FileNotFoundError:
+            pass
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,191 @@
+# response_cache.py
+
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+# Rough per-entry bookkeeping overhead counted against the byte budget
+ENTRY_OVERHEAD_BYTES = 200
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+def normalize_query(query: str) -> str:
+    """Lowercases the query and strips punctuation and repeated whitespace."""
+    query = _PUNCT_RE.sub(" ", query.lower())
+    return _SPACE_RE.sub(" ", query).strip()
+
+def _shingles(text: str, size: int = 3) -> set:
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+class ResponseCache:
+    """
+    LRU cache of LLM answers with a TTL and a total size bound in bytes.
+
+    Exact hits are keyed on the normalized query plus the model parameters. When
+    similarity_threshold is set, a miss falls back to a near-duplicate lookup:
+    queries are reduced to MinHash signatures over character 3-grams, bucketed
+    with LSH bands, and a cached answer is reused if the estimated Jaccard
+    similarity of the best candidate with the same model parameters reaches the
+    threshold.
+    """
+
+    def __init__(self, ttl: float = 3600, max_bytes: int = 10 * 1024 * 1024,
+                 similarity_threshold: float = 0.0, num_perm: int = 32, bands: int = 8):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.similarity_threshold = similarity_threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self._rows = num_perm // bands
+        rng = random.Random(42)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                       for _ in range(num_perm)]
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _params_key(params: dict) -> str:
+        return repr(sorted((params or {}).items()))
+
+    def _signature(self, text: str) -> tuple:
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in _shingles(text)]
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, params_key: str, signature: tuple) -> list:
+        return [
+            (params_key, i, signature[i * self._rows:(i + 1) * self._rows])
+            for i in range(self.bands)
+        ]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry["size"]
+        if entry["signature"] is not None:
+            for band_key in self._band_keys(entry["params_key"], entry["signature"]):
+                bucket = self._buckets.get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band_key]
+
+    def _live_entry(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= now:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, query: str, params: dict = None):
+        normalized = normalize_query(query)
+        params_key = self._params_key(params)
+        key = f"{params_key}\x00{normalized}"
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["value"]
+
+        if self.similarity_threshold <= 0:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        signature = self._signature(normalized)
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(params_key, signature):
+                candidates.update(self._buckets.get(band_key, ()))
+
+            best_key, best_similarity = None, 0.0
+            for candidate in candidates:
+                entry = self._live_entry(candidate, now)
+                if entry is None:
+                    continue
+                matches = sum(1 for x, y in zip(signature, entry["signature"]) if x == y)
+                similarity = matches / self.num_perm
+                if similarity > best_similarity:
+                    best_key, best_similarity = candidate, similarity
+
+            if best_key is not None and best_similarity >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.near_hits += 1
+                return self._entries[best_key]["value"]
+            self.misses += 1
+            return None
+
+    def set(self, query: str, params: dict, value: str):
+        normalized = normalize_query(query)
+        params_key = self._params_key(params)
+        key = f"{params_key}\x00{normalized}"
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        signature = self._signature(normalized) if self.similarity_threshold > 0 else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "value": value,
+                "expires_at": time.monotonic() + self.ttl,
+                "size": size,
+                "params_key": params_key,
+                "signature": signature,
+            }
+            self.current_bytes += size
+            if signature is not None:
+                for band_key in self._band_keys(params_key, signature):
+                    self._buckets.setdefault(band_key, set()).add(key)
+
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": ((self.hits + self.near_hits) / lookups) if lookups else 0.0,
+            }
@@ -1,12 +1,119 @@
 # TODO 3: Implement the ContextManager class
+import os
+import threading
+import uuid
+from collections import deque
+
+# Budget for the conversation history included in prompts, in estimated tokens
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "3000"))
+# Hard cap on the number of turns kept, whatever their size
+MAX_CONTEXT_TURNS = int(os.getenv("MAX_CONTEXT_TURNS", "200"))
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+def format_version(epoch: str, seq: int) -> str:
+    return f"{epoch}.{seq}"
+
+def parse_version(version, epoch: str):
+    """Returns the sequence number of a version sent by a client, or None if it is not from this epoch."""
+    if not isinstance(version, str):
+        return None
+    client_epoch, _, seq = version.partition(".")
+    if client_epoch != epoch or not seq.isdigit():
+        return None
+    return int(seq)
+
 class ContextManager:
-    def __init__(self):
-        self.history = []
+    """
+    Conversation history bounded by a token budget.
+
+    Turns are kept in a ring buffer; once the budget or the turn cap is exceeded
+    the oldest turns are dropped. The joined context string is cached and kept
+    up to date as turns are added and evicted, so get_context() does not re-join
+    the whole history. An optional summarizer(previous_summary, evicted_turns)
+    callable can fold evicted turns into a summary line kept at the top.
+
+    Every turn gets a sequence number, and version ("<epoch>.<seq>") names the
+    state after the latest turn. Given the version a client last saw,
+    context_payload() returns only the turns added since (plus which turns were
+    evicted and the summary if it changed) instead of the whole context. The
+    epoch is random per instance, so versions from before a restart or a
+    reload from the spill store are not mistaken for current ones.
+    """
+
+    def __init__(self, max_tokens: int = MAX_CONTEXT_TOKENS, max_turns: int = MAX_CONTEXT_TURNS,
+                 summarizer=None):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.summarizer = summarizer
+        self.history = deque()
+        self._token_counts = deque()
+        self.total_tokens = 0
+        self.evicted_turns = 0
+        self.summary = ""
+        self._joined = ""
+        self.epoch = uuid.uuid4().hex[:8]
+        # Number of turns ever added; the sequence number of the latest turn
+        self.seq = 0
+        self._summary_seq = 0
+        self._lock = threading.Lock()
 
     def add_interaction(self, interaction: str):
-        self.history.append(interaction)
+        with self._lock:
+            tokens = estimate_tokens(interaction)
+            self.history.append(interaction)
+            self._token_counts.append(tokens)
+            self.total_tokens += tokens
+            self.seq += 1
+            self._joined = f"{self._joined}\n{interaction}" if len(self.history) > 1 else interaction
 
-    def get_context(self) -> str:
-         return "\n".join(self.history)
+            evicted = []
+            while len(self.history) > 1 and (self.total_tokens > self.max_tokens or len(self.history) > self.max_turns):
+                evicted.append(self.history.popleft())
+                self.total_tokens -= self._token_counts.popleft()
+            if evicted:
+                self.evicted_turns += len(evicted)
+                # Drop the evicted turns and their trailing newlines from the cached string
+                self._joined = self._joined[sum(len(turn) + 1 for turn in evicted):]
+                if self.summarizer is not None:
+                    self.summary = self.summarizer(self.summary, evicted)
+                    self._summary_seq = self.seq
 
+    def _context(self) -> str:
+        if self.summary:
+            return f"Summary of earlier conversation: {self.summary}\n{self._joined}"
+        return self._joined
+
+    def get_context(self) -> str:
+        with self._lock:
+            return self._context()
 
+    def context_payload(self, client_version: str = None) -> dict:
+        """
+        Returns {"context_delta": ..., "context_version": ...} with the turns added since
+        client_version. If that version is unknown (say, "" from a new client) the delta
+        starts over from all turns held, marked "reset". Without a client_version the
+        whole context is returned as one string under "context", as before.
+        """
+        with self._lock:
+            version = format_version(self.epoch, self.seq)
+            if client_version is None:
+                return {"context": self._context(), "context_version": version}
+            since = parse_version(client_version, self.epoch)
+            reset = since is None or since > self.seq
+            if reset:
+                since = 0
+            first_turn = self.seq - len(self.history) + 1
+            start = max(since + 1, first_turn)
+            delta = {
+                "start": start,
+                "turns": [self.history[i] for i in range(start - first_turn, len(self.history))],
+                "first_turn": first_turn,
+            }
+            if reset:
+                delta["reset"] = True
+            if reset or self._summary_seq > since:
+                delta["summary"] = self.summary
+            return {"context_delta": delta, "context_version": version}
@@ -0,0 +1,509 @@
+# document_index.py
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the research index (written by the indexer CLI below)
+RESEARCH_INDEX_DIR = os.getenv("RESEARCH_INDEX_DIR", os.path.join(os.path.dirname(__file__), "..", "research_index"))
+# Files indexed when a directory of documents is scanned
+DOCUMENT_EXTENSIONS = (".txt", ".md")
+# Documents are split into passages of about this many words; passages are what is ranked
+PASSAGE_WORDS = 200
+# Minimum number of seconds between checks for a newer index generation
+RELOAD_CHECK_INTERVAL = 1.0
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+INDEX_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Left out of the postings: they match nearly every passage and only cost time
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in is it its of on or that the this to was "
+    "were what when where which who why will with you your".split()
+)
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> list:
+    """Groups paragraphs into passages of at most max_words words; longer paragraphs are cut."""
+    passages = []
+    current = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        while len(words) > max_words:
+            if current:
+                passages.append(" ".join(current))
+                current = []
+            passages.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if current and len(current) + len(words) > max_words:
+            passages.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+def scan_documents(docs_dir: str) -> dict:
+    """{relative path: (mtime_ns, size)} of the indexable files under docs_dir."""
+    found = {}
+    for root, _, names in os.walk(docs_dir):
+        for name in names:
+            if not name.lower().endswith(DOCUMENT_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            found[os.path.relpath(path, docs_dir)] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+class _Postings:
+    """
+    Postings being built, as flat (term id, passage id, term frequency) arrays,
+    plus the passages' lengths, owning files and text.
+    """
+
+    def __init__(self, terms: list = None):
+        self.terms = list(terms or [])
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.post_terms = array("I")
+        self.post_docs = array("I")
+        self.post_tfs = array("I")
+        self.doc_lengths = array("I")
+        self.passage_files = array("I")
+        self.texts = []
+
+    def add_passage(self, text: str, file_id: int, doc_id: int):
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                term_id = self.term_ids[token] = len(self.terms)
+                self.terms.append(token)
+            self.post_terms.append(term_id)
+            self.post_docs.append(doc_id)
+            self.post_tfs.append(tf)
+        self.doc_lengths.append(sum(counts.values()))
+        self.passage_files.append(file_id)
+        self.texts.append(text.encode("utf-8"))
+
+def _write_generation(path: str, terms: list, post_terms, post_docs, post_tfs, doc_lengths,
+                      passage_offsets, passages_blob: bytes, passage_files, files: list):
+    """
+    Writes one immutable index generation: the sorted lexicon, postings sorted
+    by (term, passage) as flat arrays, passage lengths and passage text.
+    """
+    os.makedirs(path)
+    n_docs = len(doc_lengths)
+    counts = np.bincount(post_terms, minlength=len(terms)) if len(post_terms) else np.zeros(len(terms), np.int64)
+    order = sorted(np.nonzero(counts)[0].tolist(), key=terms.__getitem__)
+    rank = np.full(len(terms), -1, dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    permutation = np.argsort(rank[post_terms] * max(n_docs, 1) + post_docs, kind="stable")
+
+    postings_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    postings_offsets[1:] = np.cumsum(counts[order])
+    lexicon = [terms[i].encode("utf-8") for i in order]
+    term_offsets = np.zeros(len(lexicon) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum([len(t) for t in lexicon])
+
+    np.save(os.path.join(path, "postings_docs.npy"), post_docs[permutation].astype(np.uint32))
+    np.save(os.path.join(path, "postings_tfs.npy"), np.minimum(post_tfs[permutation], 65535).astype(np.uint16))
+    np.save(os.path.join(path, "postings_offsets.npy"), postings_offsets)
+    np.save(os.path.join(path, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(path, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.uint32))
+    np.save(os.path.join(path, "passage_offsets.npy"), np.asarray(passage_offsets, dtype=np.int64))
+    np.save(os.path.join(path, "passage_files.npy"), np.asarray(passage_files, dtype=np.uint32))
+    with open(os.path.join(path, "lexicon.bin"), "wb") as f:
+        f.write(b"".join(lexicon))
+    with open(os.path.join(path, "passages.bin"), "wb") as f:
+        f.write(passages_blob)
+    meta = {
+        "version": INDEX_VERSION,
+        "passages": n_docs,
+        "terms": len(order),
+        "postings": int(postings_offsets[-1]),
+        "avg_passage_length": float(np.mean(doc_lengths)) if n_docs else 0.0,
+        "files": files,
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+def _current_generation(index_dir: str):
+    try:
+        with open(os.path.join(index_dir, "CURRENT"), "r") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(index_dir, name) if name else None
+
+def _publish_generation(index_dir: str, name: str):
+    """Points CURRENT at the new generation atomically, then removes the older ones."""
+    temp_path = os.path.join(index_dir, "CURRENT.tmp")
+    with open(temp_path, "w") as f:
+        f.write(name)
+    os.replace(temp_path, os.path.join(index_dir, "CURRENT"))
+    # Readers that still map an old generation keep their (unlinked) files until they reopen
+    for entry in os.listdir(index_dir):
+        if entry.startswith("gen-") and entry != name:
+            shutil.rmtree(os.path.join(index_dir, entry), ignore_errors=True)
+
+def build_index(docs_dir: str, index_dir: str = RESEARCH_INDEX_DIR, full: bool = False) -> dict:
+    """
+    Indexes the documents under docs_dir into a new generation of index_dir.
+
+    Unless full is set, only new and changed files (by size and modification
+    time) are read and tokenized: the passages and postings of unchanged files
+    are copied from the current generation, and those of changed or deleted
+    files dropped. Run one indexer at a time per index directory.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    found = scan_documents(docs_dir)
+    current = None if full else _current_generation(index_dir)
+    old = None
+    if current is not None:
+        try:
+            old = _Generation(current)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Cannot reuse research index generation {current}, rebuilding: {str(e)}")
+
+    kept_files = []
+    if old is not None:
+        kept_files = [f for f in old.files if tuple(found.get(f["path"], ())) == (f["mtime"], f["size"])]
+        if len(kept_files) == len(old.files) == len(found):
+            return {"files": len(found), "indexed": 0, "removed": 0, "passages": old.n_passages, "unchanged": True}
+
+    # Carry over the unchanged files' passages, renumbered to stay contiguous
+    old_terms = old.all_terms() if old is not None and kept_files else []
+    postings = _Postings(old_terms)
+    files = []
+    passage_offsets = [0]
+    blob_parts = []
+    kept_docs = np.zeros(old.n_passages if old is not None else 0, dtype=bool)
+    for f in kept_files:
+        first, count = f["first"], f["count"]
+        kept_docs[first:first + count] = True
+        start, end = int(old.passage_offsets[first]), int(old.passage_offsets[first + count])
+        blob_parts.append(old.passages[start:end])
+        base = passage_offsets[-1] - start
+        passage_offsets.extend(int(o) + base for o in old.passage_offsets[first + 1:first + count + 1])
+        files.append(dict(f, first=len(passage_offsets) - 1 - count))
+
+    n_kept = int(kept_docs.sum())
+    if n_kept:
+        new_ids = np.cumsum(kept_docs) - 1
+        old_post_terms = np.repeat(np.arange(len(old_terms), dtype=np.int64), np.diff(old.postings_offsets))
+        mask = kept_docs[old.postings_docs]
+        kept_post_terms = old_post_terms[mask]
+        kept_post_docs = new_ids[old.postings_docs[mask]]
+        kept_post_tfs = np.asarray(old.postings_tfs[mask], dtype=np.int64)
+        kept_lengths = np.asarray(old.doc_lengths)[kept_docs]
+        kept_passage_files = np.repeat(np.arange(len(files)), [f["count"] for f in files])
+    else:
+        kept_post_terms = kept_post_docs = kept_post_tfs = np.zeros(0, dtype=np.int64)
+        kept_lengths = kept_passage_files = np.zeros(0, dtype=np.int64)
+
+    kept_paths = {f["path"] for f in kept_files}
+    indexed = 0
+    for path in sorted(found):
+        if path in kept_paths:
+            continue
+        try:
+            with open(os.path.join(docs_dir, path), "r", encoding="utf-8", errors="replace") as fh:
+                text = fh.read()
+        except OSError as e:
+            logger.error(f"Skipping {path}: {str(e)}")
+            continue
+        passages = split_passages(text)
+        file_id = len(files)
+        files.append({"path": path, "mtime": found[path][0], "size": found[path][1],
+                      "first": len(passage_offsets) - 1, "count": len(passages)})
+        for passage in passages:
+            doc_id = len(passage_offsets) - 1
+            postings.add_passage(passage, file_id, doc_id)
+            passage_offsets.append(passage_offsets[-1] + len(postings.texts[-1]))
+        indexed += 1
+    blob_parts.extend(postings.texts)
+
+    name = f"gen-{time.time_ns()}"
+    _write_generation(
+        os.path.join(index_dir, name), postings.terms,
+        np.concatenate([kept_post_terms, np.frombuffer(postings.post_terms, dtype=np.uint32).astype(np.int64)]),
+        np.concatenate([kept_post_docs, np.frombuffer(postings.post_docs, dtype=np.uint32).astype(np.int64)]),
+        np.concatenate([kept_post_tfs, np.frombuffer(postings.post_tfs, dtype=np.uint32).astype(np.int64)]),
+        np.concatenate([kept_lengths, np.frombuffer(postings.doc_lengths, dtype=np.uint32)]),
+        passage_offsets, b"".join(blob_parts),
+        np.concatenate([kept_passage_files, np.frombuffer(postings.passage_files, dtype=np.uint32)]),
+        files,
+    )
+    if old is not None:
+        old.close()
+    _publish_generation(index_dir, name)
+    removed = sum(f["path"] not in found for f in old.files) if old is not None else 0
+    return {"files": len(files), "indexed": indexed, "removed": removed,
+            "passages": len(passage_offsets) - 1, "unchanged": False}
+
+class _Generation:
+    """One index generation, memory-mapped: nothing but the metadata is read up front."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != INDEX_VERSION:
+            raise ValueError(f"unsupported index version {meta['version']}")
+        self.files = meta["files"]
+        self.n_passages = meta["passages"]
+        self.n_terms = meta["terms"]
+        self.avg_passage_length = meta["avg_passage_length"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.postings_docs = load("postings_docs.npy")
+        self.postings_tfs = load("postings_tfs.npy")
+        self.postings_offsets = load("postings_offsets.npy")
+        self.term_offsets = load("term_offsets.npy")
+        self.doc_lengths = load("doc_lengths.npy")
+        self.passage_offsets = load("passage_offsets.npy")
+        self.passage_files = load("passage_files.npy")
+        self._maps = []
+        self.lexicon = self._map("lexicon.bin")
+        self.passages = self._map("passages.bin")
+        # Per-passage part of the BM25 denominator, computed once per generation
+        avg = self.avg_passage_length or 1.0
+        self.length_norm = (BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(self.doc_lengths, dtype=np.float32) / avg))
+
+    def _map(self, name: str):
+        with open(os.path.join(self.path, name), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def close(self):
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def all_terms(self) -> list:
+        offsets = np.asarray(self.term_offsets).tolist()
+        blob = bytes(self.lexicon)
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(self.n_terms)]
+
+    def term_id(self, term: str):
+        """Binary search of the sorted lexicon."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        offsets = self.term_offsets
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = self.lexicon[offsets[mid]:offsets[mid + 1]]
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def search(self, query: str, k: int) -> list:
+        docs, weights = [], []
+        for term in set(tokenize(query)):
+            term_id = self.term_id(term)
+            if term_id is None:
+                continue
+            start, end = int(self.postings_offsets[term_id]), int(self.postings_offsets[term_id + 1])
+            postings = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (self.n_passages - df + 0.5) / (df + 0.5))
+            docs.append(postings)
+            weights.append(idf * tfs * (BM25_K1 + 1) / (tfs + self.length_norm[postings]))
+        if not docs:
+            return []
+        docs = np.concatenate(docs)
+        scores = np.bincount(docs, weights=np.concatenate(weights), minlength=self.n_passages)
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = []
+        for doc_id in top.tolist():
+            start, end = int(self.passage_offsets[doc_id]), int(self.passage_offsets[doc_id + 1])
+            results.append({
+                "file": self.files[int(self.passage_files[doc_id])]["path"],
+                "passage": doc_id,
+                "score": round(float(scores[doc_id]), 4),
+                "text": self.passages[start:end].decode("utf-8"),
+            })
+        return results
+
+class DocumentIndex:
+    """
+    BM25 search over the passages of a local document corpus.
+
+    The index directory holds immutable generations written by build_index()
+    and a CURRENT file naming the live one. Postings are flat uint32/uint16
+    arrays sorted by term, and the lexicon is a sorted byte string searched in
+    place, so opening an index reads its file list and maps everything else:
+    postings and passage text are paged in on demand and the page cache is
+    shared by every worker process. A newer generation published by the
+    indexer is picked up on the next search.
+    """
+
+    def __init__(self, index_dir: str = RESEARCH_INDEX_DIR):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._generation = None
+        self._last_check = 0.0
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        path = _current_generation(self.index_dir)
+        if path is None or (self._generation is not None and self._generation.path == path):
+            return
+        try:
+            generation = _Generation(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to open research index {path}: {str(e)}")
+            return
+        logger.info(f"Opened research index {path}: {generation.n_passages} passages, {len(generation.files)} files")
+        # The previous generation's maps are left to the garbage collector: a search may still use them
+        self._generation = generation
+
+    def _current(self):
+        with self._lock:
+            self._maybe_reload()
+            return self._generation
+
+    def available(self) -> bool:
+        generation = self._current()
+        return generation is not None and generation.n_passages > 0
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Top-k passages as {"file", "passage", "score", "text"}, best first."""
+        generation = self._current()
+        if generation is None:
+            return []
+        return generation.search(query, k)
+
+document_index = DocumentIndex()
+
+def benchmark(n_docs: int = 100_000, queries: int = 1000):
+    """Build, query and incremental re-index times on a synthetic corpus with a Zipfian vocabulary."""
+    import random
+    import tempfile
+
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(50_000)]
+    cum_weights = np.cumsum(1.0 / np.arange(1, len(vocabulary) + 1)).tolist()
+
+    def document() -> str:
+        paragraphs = [" ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(40, 120)))
+                      for _ in range(rng.randint(1, 3))]
+        return "\n\n".join(paragraphs)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        docs_dir = os.path.join(workdir, "docs")
+        index_dir = os.path.join(workdir, "index")
+        start = time.perf_counter()
+        for i in range(n_docs):
+            shard = os.path.join(docs_dir, f"{i // 1000:03d}")
+            if i % 1000 == 0:
+                os.makedirs(shard)
+            with open(os.path.join(shard, f"doc{i}.txt"), "w") as f:
+                f.write(document())
+        print(f"corpus: {n_docs} documents written in {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        stats = build_index(docs_dir, index_dir, full=True)
+        generation = _current_generation(index_dir)
+        size = sum(os.path.getsize(os.path.join(generation, name)) for name in os.listdir(generation))
+        print(f"full build: {time.perf_counter() - start:.1f} s, {stats['passages']} passages, "
+              f"{size / 1e6:.0f} MB on disk")
+
+        index = DocumentIndex(index_dir)
+        start = time.perf_counter()
+        index.available()
+        print(f"open: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        latencies = []
+        for _ in range(queries):
+            query = " ".join(rng.choices(vocabulary[:5000], k=rng.randint(2, 5)))
+            start = time.perf_counter()
+            index.search(query, 5)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"search: p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms over {queries} queries")
+
+        # Touch 1% of the files, add 100 and delete 100
+        changed = max(1, n_docs // 100)
+        for i in rng.sample(range(n_docs), changed):
+            with open(os.path.join(docs_dir, f"{i // 1000:03d}", f"doc{i}.txt"), "w") as f:
+                f.write(document())
+        os.makedirs(os.path.join(docs_dir, "new"))
+        for i in range(100):
+            with open(os.path.join(docs_dir, "new", f"doc{i}.txt"), "w") as f:
+                f.write(document())
+        removed = 0
+        for name in sorted(os.listdir(os.path.join(docs_dir, "000")))[:100]:
+            os.remove(os.path.join(docs_dir, "000", name))
+            removed += 1
+        start = time.perf_counter()
+        stats = build_index(docs_dir, index_dir)
+        print(f"incremental update: {time.perf_counter() - start:.1f} s ({stats['indexed']} files re-indexed, "
+              f"{stats['removed']} removed)")
+
+        start = time.perf_counter()
+        full_stats = build_index(docs_dir, index_dir, full=True)
+        print(f"full rebuild of the same corpus: {time.perf_counter() - start:.1f} s")
+        assert full_stats["passages"] == stats["passages"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local research index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index (or re-index) a directory of .txt and .md documents")
+    build.add_argument("docs_dir")
+    build.add_argument("--index-dir", default=RESEARCH_INDEX_DIR)
+    build.add_argument("--full", action="store_true", help="Re-read every file instead of only changed ones")
+    search = commands.add_parser("search", help="Print the top passages for a query")
+    search.add_argument("query")
+    search.add_argument("--index-dir", default=RESEARCH_INDEX_DIR)
+    search.add_argument("-k", type=int, default=5)
+    bench = commands.add_parser("benchmark", help="Synthetic corpus benchmark")
+    bench.add_argument("documents", type=int, nargs="?", default=100_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "build":
+        print(build_index(args.docs_dir, args.index_dir, full=args.full))
+    elif args.command == "search":
+        for result in DocumentIndex(args.index_dir).search(args.query, args.k):
+            print(f"{result['score']:8.3f}  {result['file']}: {result['text'][:160]}")
+    else:
+        benchmark(args.documents)
@@ -1,10 +1,15 @@
 # execution_agent.py
+import asyncio
 import os
+import re
 import logging
-from azure.ai.vision.imageanalysis.models import VisualFeatures
-import openai
 from azure.ai.vision.imageanalysis import ImageAnalysisClient
 from azure.core.credentials import AzureKeyCredential
+from common.image_ingest import load_image
+from common.vision_cache import analyze_image, analyze_image_async
+from common.llm_client import get_llm_client, get_async_llm_client
+from agents.intent_router import intent_router
+from agents.research_agent import research_agent
 
 # Initialize Azure Vision client using environment variables
 vision_key = os.getenv("AZURE_VISION_KEY")
@@ -16,75 +21,125 @@ vision_client = ImageAnalysisClient(
     credential=AzureKeyCredential(vision_key)
 )
 
-research_agent = None
+# Created on first use by the ASGI app (needs aiohttp)
+async_vision_client = None
 
 logger = logging.getLogger(__name__)
 
+def _chat_messages(user_input: str, context: str) -> list:
+    # Build the messages including conversation history (if available)
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."}
+    ]
+    if context:
+        messages.append({"role": "system", "content": f"Conversation history:\n{context}"})
+    messages.append({"role": "user", "content": user_input})
+    return messages
+
+def _image_messages(caption: str, tags: list, objects: list, prompt: str) -> list:
+    analysis_prompt = (
+        f"Image Analysis:\n- Caption: {caption}\n"
+        f"- Tags: {', '.join(tags)}\n"
+        f"- Objects: {', '.join(objects)}\n\n"
+        f"User prompt: {prompt}\n\nBased on the image analysis above, please respond to the user's prompt."
+    )
+    return [
+        {"role": "system", "content": "You are a helpful assistant that analyzes images."},
+        {"role": "user", "content": analysis_prompt}
+    ]
+
+def _research_query(user_input: str) -> str:
+    # Drop an explicit "research" prefix, if any
+    return re.sub(r"^research\b:?", "", user_input.strip(), flags=re.IGNORECASE).strip()
+
+def _get_async_vision_client():
+    global async_vision_client
+    if async_vision_client is None:
+        from azure.ai.vision.imageanalysis.aio import ImageAnalysisClient as AsyncImageAnalysisClient
+        async_vision_client = AsyncImageAnalysisClient(
+            endpoint=vision_endpoint,
+            credential=AzureKeyCredential(vision_key)
+        )
+    return async_vision_client
+
 # TODO 2: Implement execution_agent
 def execution_agent(plan: str, user_input: str, context: str = "", image_file=None, prompt: str = "") -> str:
     if plan == "chat":
-         # Build the messages including conversation history (if available)
-         messages = [
-             {"role": "system", "content": "You are a helpful assistant."}
-         ]
-         if context:
-             messages.append({"role": "system", "content": f"Conversation history:\n{context}"})
-         messages.append({"role": "user", "content": user_input})
-         response = openai.ChatCompletion.create(
-             engine=azure_openai_deployment,
-             messages=messages,
-             temperature=0.7,
-             max_tokens=800
-         )
-         ai_message = response.choices[0].message.content
+         messages = _chat_messages(user_input, context)
+         ai_message = get_llm_client().chat_text(messages, azure_openai_deployment, temperature=0.7, max_tokens=800)
          return ai_message
 
     elif plan == "image_analysis" and image_file is not None:
-         temp_image_path = "temp_image.jpg"
-         image_file.save(temp_image_path)
-         with open(temp_image_path, "rb") as f:
-             image_data = f.read()
+         # Read the upload in memory (no temp file shared between requests)
+         image_data = load_image(image_file)
          try:
-             result = vision_client.analyze(
-                 image_data=image_data,
-                 visual_features=[
-                     VisualFeatures.CAPTION,
-                     VisualFeatures.TAGS,
-                     VisualFeatures.OBJECTS
-                 ]
-             )
-             caption = result.caption.text if result.caption else ""
-             tags = [getattr(tag, "name", str(tag)) for tag in result.tags] if result.tags else []
-             objects = [getattr(obj, "name", str(obj)) for obj in result.objects] if result.objects else []
+             # Repeat uploads of the same image are served from the shared cache
+             caption, tags, objects = analyze_image(vision_client, image_data)
          except Exception as analysis_error:
              logger.error(f"Image analysis error: {str(analysis_error)}")
              return "Failed to analyze image"
-         os.remove(temp_image_path)
-         analysis_prompt = (
-             f"Image Analysis:\n- Caption: {caption}\n"
-             f"- Tags: {', '.join(tags)}\n"
-             f"- Objects: {', '.join(objects)}\n\n"
-             f"User prompt: {prompt}\n\nBased on the image analysis above, please respond to the user's prompt."
-         )
-         response = openai.ChatCompletion.create(
-             engine=azure_openai_deployment,
-             messages=[
-                 {"role": "system", "content": "You are a helpful assistant that analyzes images."},
-                 {"role": "user", "content": analysis_prompt}
-             ],
+         ai_message = get_llm_client().chat_text(
+             _image_messages(caption, tags, objects, prompt),
+             azure_openai_deployment,
              temperature=0.7,
              max_tokens=800
          )
-         ai_message = response.choices[0].message.content
          return ai_message
 
     elif plan == "research":
-         query = user_input.strip()[7:].strip()
+         # Answered from the local document index (agents/document_index.py)
          if research_agent:
-             return research_agent(query)
+             return research_agent(_research_query(user_input))
          else:
              return "Research functionality is not available."
 
+    elif intent_router.answer(plan) is not None:
+         # faq:* and canned_reply:* plans are answered without calling the LLM
+         return intent_router.answer(plan)
+
     else:
          return "Invalid plan or missing required input."
 
+def execution_agent_stream(plan: str, user_input: str, context: str = "", image_file=None, prompt: str = ""):
+    """Like execution_agent, but yields the reply in pieces as the LLM generates them (chat plan only)."""
+    if plan == "chat":
+         yield from get_llm_client().chat_stream(_chat_messages(user_input, context), azure_openai_deployment,
+                                                 temperature=0.7, max_tokens=800)
+    else:
+         yield execution_agent(plan, user_input, context=context, image_file=image_file, prompt=prompt)
+
+async def execution_agent_async(plan: str, user_input: str, context: str = "", image_file=None, prompt: str = "") -> str:
+    """execution_agent for the ASGI app: Vision and LLM calls are awaited instead of blocking a thread."""
+    if plan == "chat":
+         messages = _chat_messages(user_input, context)
+         return await get_async_llm_client().chat_text(messages, azure_openai_deployment, temperature=0.7, max_tokens=800)
+
+    elif plan == "image_analysis" and image_file is not None:
+         # Reading and downscaling the upload would otherwise block the event loop
+         image_data = await asyncio.to_thread(load_image, image_file)
+         try:
+             caption, tags, objects = await analyze_image_async(_get_async_vision_client(), image_data)
+         except Exception as analysis_error:
+             logger.error(f"Image analysis error: {str(analysis_error)}")
+             return "Failed to analyze image"
+         return await get_async_llm_client().chat_text(
+             _image_messages(caption, tags, objects, prompt),
+             azure_openai_deployment,
+             temperature=0.7,
+             max_tokens=800
+         )
+
+    elif plan == "research" and research_agent:
+         return await research_agent.answer_async(_research_query(user_input))
+
+    else:
+         return execution_agent(plan, user_input, context=context, image_file=image_file, prompt=prompt)
+
+async def execution_agent_stream_async(plan: str, user_input: str, context: str = "", image_file=None, prompt: str = ""):
+    """Async version of execution_agent_stream."""
+    if plan == "chat":
+         async for delta in get_async_llm_client().chat_stream(_chat_messages(user_input, context), azure_openai_deployment,
+                                                               temperature=0.7, max_tokens=800):
+             yield delta
+    else:
+         yield await execution_agent_async(plan, user_input, context=context, image_file=image_file, prompt=prompt)
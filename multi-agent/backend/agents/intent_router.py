@@ -0,0 +1,290 @@
+# intent_router.py
+import json
+import logging
+import os
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Labeled examples ({"text", "label"}) and the answers served for faq:* and canned_reply:* labels
+INTENTS_FILE = os.getenv("INTENTS_FILE", os.path.join(os.path.dirname(__file__), "intents.json"))
+# Below this calibrated confidence the LLM is asked to pick the intent instead
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.5"))
+# Stricter threshold for faq and canned_reply, whose stored answers are sent without any LLM call
+INTENT_ANSWER_THRESHOLD = float(os.getenv("INTENT_ANSWER_THRESHOLD", "0.7"))
+# Set to 0 to route low-confidence requests to "chat" without asking the LLM
+INTENT_LLM_FALLBACK = os.getenv("INTENT_LLM_FALLBACK", "1") == "1"
+
+INTENTS = ("chat", "research", "image_analysis", "faq", "canned_reply")
+# Intents answered from the stored answers in the intents file
+ANSWER_INTENTS = ("faq", "canned_reply")
+
+N_FEATURES = 2 ** 14
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+def _features(text: str) -> list:
+    """
+    Hashed word unigrams, word bigrams and character trigrams (so "thx" and
+    "thanks!" share something with "thanks"); crc32 so buckets are the same in
+    every process.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"<{token}>"
+        grams.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    # Bias feature so empty input still gets a score
+    return [0] + [1 + zlib.crc32(gram.encode("utf-8")) % (N_FEATURES - 1) for gram in grams]
+
+def vectorize(texts: list):
+    """Returns (indices, offsets) of a sparse binary matrix in CSR-like form."""
+    indices = []
+    offsets = [0]
+    for text in texts:
+        indices.extend(sorted(set(_features(text))))
+        offsets.append(len(indices))
+    return np.asarray(indices, dtype=np.int64), np.asarray(offsets, dtype=np.int64)
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+class IntentRouter:
+    """
+    Multinomial logistic regression over hashed n-grams, trained at start-up.
+
+    Training only touches the hash buckets that occur in the labeled file, so
+    it takes milliseconds; classifying a request is a sum of a few weight
+    columns. Probabilities are calibrated with a temperature fitted on
+    cross-validated scores, so "confidence" is meaningful when compared with
+    the threshold below which the LLM is consulted.
+    """
+
+    def __init__(self, path: str = INTENTS_FILE, config: dict = None, epochs: int = 300,
+                 learning_rate: float = 0.5, l2: float = 1e-3, folds: int = 5):
+        if config is None:
+            with open(path, "r") as f:
+                config = json.load(f)
+        self.answers = config.get("answers", {})
+        examples = config["examples"]
+        self.labels = sorted({example["label"] for example in examples})
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        texts = [example["text"] for example in examples]
+        targets = np.array([self.labels.index(example["label"]) for example in examples])
+
+        self.temperature = self._calibrate(texts, targets, folds)
+        self.weights = self._fit(texts, targets)
+        logger.info(f"Trained intent router on {len(texts)} examples, {len(self.labels)} labels "
+                    f"(temperature {self.temperature:.2f})")
+
+    def _fit(self, texts: list, targets):
+        """Gradient descent on the dense sub-matrix of buckets that occur in texts."""
+        indices, offsets = vectorize(texts)
+        columns, compact = np.unique(indices, return_inverse=True)
+        x = np.zeros((len(texts), len(columns)))
+        rows = np.repeat(np.arange(len(texts)), np.diff(offsets))
+        x[rows, compact] = 1.0
+        y = np.eye(len(self.labels))[targets]
+
+        w = np.zeros((len(columns), len(self.labels)))
+        for _ in range(self.epochs):
+            gradient = x.T @ (_softmax(x @ w) - y) / len(texts) + self.l2 * w
+            w -= self.learning_rate * gradient
+
+        weights = np.zeros((N_FEATURES, len(self.labels)))
+        weights[columns] = w
+        return weights
+
+    def _calibrate(self, texts: list, targets, folds: int) -> float:
+        """Temperature that minimises the log loss of out-of-fold predictions."""
+        order = np.random.default_rng(0).permutation(len(texts))
+        logits = np.zeros((len(texts), len(self.labels)))
+        for fold in range(folds):
+            held_out = order[fold::folds]
+            train = np.setdiff1d(order, held_out)
+            weights = self._fit([texts[i] for i in train], targets[train])
+            logits[held_out] = self._logits([texts[i] for i in held_out], weights)
+
+        best_temperature, best_loss = 1.0, np.inf
+        for temperature in np.linspace(0.1, 5.0, 50):
+            probabilities = _softmax(logits / temperature)
+            loss = -np.log(probabilities[np.arange(len(texts)), targets] + 1e-12).mean()
+            if loss < best_loss:
+                best_temperature, best_loss = float(temperature), loss
+        return best_temperature
+
+    def _logits(self, texts: list, weights=None):
+        weights = self.weights if weights is None else weights
+        indices, offsets = vectorize(texts)
+        # Sum the weight rows of each text's buckets (every text has at least the bias)
+        return np.add.reduceat(weights[indices], offsets[:-1], axis=0)
+
+    def classify_batch(self, texts: list) -> list:
+        """Returns {"label", "intent", "confidence"} for each text."""
+        if not texts:
+            return []
+        probabilities = _softmax(self._logits(texts) / self.temperature)
+        best = probabilities.argmax(axis=1)
+        results = []
+        for row, label_id in enumerate(best):
+            label = self.labels[label_id]
+            results.append({
+                "label": label,
+                "intent": label.split(":")[0],
+                "confidence": float(probabilities[row, label_id]),
+            })
+        return results
+
+    def classify(self, text: str) -> dict:
+        return self.classify_batch([text])[0]
+
+    def best_label_for(self, text: str, intent: str) -> tuple:
+        """
+        The highest scoring label of an intent (e.g. which FAQ the LLM fallback
+        meant) and its calibrated probability; (intent, 0.0) if it has no labels.
+        """
+        probabilities = _softmax(self._logits([text]) / self.temperature)[0]
+        candidates = [i for i, label in enumerate(self.labels) if label.split(":")[0] == intent]
+        if not candidates:
+            return intent, 0.0
+        best = max(candidates, key=lambda i: probabilities[i])
+        return self.labels[best], float(probabilities[best])
+
+    def answer(self, label: str) -> str:
+        return self.answers.get(label)
+
+def _classification_messages(text: str) -> list:
+    return [
+        {"role": "system", "content": (
+            "Classify the user's message into exactly one of these intents and reply with the intent only: "
+            "chat (general questions and tasks), research (finding sources or information to look up), "
+            "image_analysis (questions about an image), faq (questions about what this assistant can do, "
+            "uploading images, voice input, data privacy or languages), canned_reply (greetings, thanks, goodbyes)."
+        )},
+        {"role": "user", "content": text}
+    ]
+
+def _parse_intent(reply: str) -> str:
+    intent = reply.strip().lower().replace("-", "_")
+    return intent if intent in INTENTS else "chat"
+
+def llm_classify(text: str) -> str:
+    """Asks the LLM for one of INTENTS; "chat" when it fails or answers something else."""
+    from common.llm_client import get_llm_client
+    try:
+        reply = get_llm_client().chat_text(_classification_messages(text), os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+                                           temperature=0, max_tokens=5)
+    except Exception as e:
+        logger.error(f"LLM intent classification failed: {str(e)}")
+        return "chat"
+    return _parse_intent(reply)
+
+async def llm_classify_async(text: str) -> str:
+    from common.llm_client import get_async_llm_client
+    try:
+        reply = await get_async_llm_client().chat_text(_classification_messages(text), os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+                                                       temperature=0, max_tokens=5)
+    except Exception as e:
+        logger.error(f"LLM intent classification failed: {str(e)}")
+        return "chat"
+    return _parse_intent(reply)
+
+intent_router = IntentRouter()
+
+def needs_fallback(result: dict, threshold: float = INTENT_CONFIDENCE_THRESHOLD,
+                   answer_threshold: float = INTENT_ANSWER_THRESHOLD) -> bool:
+    limit = answer_threshold if result["intent"] in ANSWER_INTENTS else threshold
+    return result["confidence"] < limit
+
+def _fallback_result(text: str, intent: str, result: dict, source: str) -> dict:
+    label, label_confidence = intent_router.best_label_for(text, intent)
+    if intent in ANSWER_INTENTS and label_confidence < INTENT_ANSWER_THRESHOLD:
+        # The LLM only names the intent; a stored answer is sent without any LLM call, so
+        # it needs the local model to be as sure of the exact label as it would be on its own
+        label, intent = "chat", "chat"
+    return {
+        "label": label,
+        "intent": intent,
+        "confidence": result["confidence"],
+        "source": source,
+    }
+
+def route(text: str, llm_fallback: bool = INTENT_LLM_FALLBACK) -> dict:
+    """Classifies a request, asking the LLM only when the local model is not confident enough."""
+    result = intent_router.classify(text)
+    result["source"] = "local"
+    if needs_fallback(result):
+        if llm_fallback:
+            return _fallback_result(text, llm_classify(text), result, "llm")
+        return _fallback_result(text, "chat", result, "default")
+    return result
+
+async def route_async(text: str, llm_fallback: bool = INTENT_LLM_FALLBACK) -> dict:
+    """route() for the ASGI app."""
+    result = intent_router.classify(text)
+    result["source"] = "local"
+    if needs_fallback(result):
+        if llm_fallback:
+            return _fallback_result(text, await llm_classify_async(text), result, "llm")
+        return _fallback_result(text, "chat", result, "default")
+    return result
+
+def benchmark(path: str = INTENTS_FILE, folds: int = 5):
+    """
+    Routing latency, and how many LLM calls the router saves on held-out examples
+    compared with sending every text request to a chat completion.
+    """
+    with open(path, "r") as f:
+        config = json.load(f)
+    examples = config["examples"]
+    texts = [example["text"] for example in examples] * 20
+    start = time.perf_counter()
+    for text in texts:
+        intent_router.classify(text)
+    single = (time.perf_counter() - start) / len(texts)
+    start = time.perf_counter()
+    intent_router.classify_batch(texts)
+    batch = (time.perf_counter() - start) / len(texts)
+    print(f"latency: {single * 1e6:.1f} us/request one at a time, {batch * 1e6:.1f} us/request in a batch")
+
+    # Cross-validated: each example is routed by a model that did not see it.
+    # A fallback costs one extra call; the LLM is assumed to pick the right intent.
+    order = np.random.default_rng(1).permutation(len(examples))
+    correct = local_answers = wrong_answers = fallbacks = router_calls = 0
+    for fold in range(folds):
+        held_out = order[fold::folds].tolist()
+        train = [e for i, e in enumerate(examples) if i not in set(held_out)]
+        fold_router = IntentRouter(config=dict(config, examples=train))
+        for i in held_out:
+            label = examples[i]["label"]
+            result = fold_router.classify(examples[i]["text"])
+            if needs_fallback(result):
+                fallbacks += 1
+                router_calls += 1 + (label.split(":")[0] not in ANSWER_INTENTS)
+                continue
+            correct += result["label"] == label
+            if result["intent"] in ANSWER_INTENTS:
+                local_answers += 1
+                wrong_answers += result["label"] != label
+            else:
+                router_calls += 1
+
+    n = len(examples)
+    print(f"held-out: {correct / n:.0%} routed correctly without the LLM, {fallbacks / n:.0%} sent to the LLM fallback, "
+          f"{local_answers} answered locally ({wrong_answers} with the wrong answer)")
+    print(f"LLM calls: {router_calls} with the router vs {n} without ({1 - router_calls / n:.0%} avoided)")
+
+if __name__ == "__main__":
+    # python -m agents.intent_router benchmark
+    if sys.argv[1:] == ["benchmark"]:
+        benchmark()
+    else:
+        print("Usage: python -m agents.intent_router benchmark")
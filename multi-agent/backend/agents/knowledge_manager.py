@@ -1,10 +1,25 @@
 # TODO 4: Implement the KnowledgeManager class
+import threading
+import uuid
+
+from agents.context_manager import format_version, parse_version
+
 class KnowledgeManager:
     def __init__(self):
         self.knowledge_base = {}
+        # Sequence number of the latest change, and of the latest change to each key
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self._changed = {}
+        self._lock = threading.Lock()
 
     def add_knowledge(self, key: str, value: str):
-        self.knowledge_base[key] = value
+        with self._lock:
+            if key in self.knowledge_base and self.knowledge_base[key] == value:
+                return
+            self.knowledge_base[key] = value
+            self.seq += 1
+            self._changed[key] = self.seq
 
     def get_knowledge(self, key: str) -> str:
         return self.knowledge_base.get(key, "")
@@ -12,4 +27,14 @@ class KnowledgeManager:
     def get_all_knowledge(self):
          return self.knowledge_base
 
+    def knowledge_payload(self, client_version: str = None) -> dict:
+        """Like ContextManager.context_payload: the full knowledge dict, or only the keys changed since client_version."""
+        with self._lock:
+            since = parse_version(client_version, self.epoch)
+            version = format_version(self.epoch, self.seq)
+            if since is None or since > self.seq:
+                return {"knowledge": dict(self.knowledge_base), "knowledge_version": version}
+            changed = {key: self.knowledge_base[key] for key, seq in self._changed.items() if seq > since}
+            return {"knowledge_delta": changed, "knowledge_version": version}
+
 knowledge_manager = KnowledgeManager()
@@ -1,8 +1,27 @@
 # TODO 1: Impement planning_agent
+from agents.intent_router import route, route_async
+
+def _plan(result: dict) -> str:
+  if result["intent"] in ("faq", "canned_reply"):
+      return result["label"]
+  if result["intent"] == "research":
+      # Imported here to avoid a cycle (the execution agent holds the research agent)
+      from agents import execution_agent
+      if execution_agent.research_agent:
+          return "research"
+  # Questions about an earlier image are answered from the conversation context
+  return "chat"
 
 def planning_agent(user_input: str, has_image: bool) -> str:
+  """
+  Returns the plan for the execution agent: "image_analysis", "chat", "research",
+  or the "faq:<key>" / "canned_reply:<key>" label of a stored answer.
+  """
+  if has_image:
+      return "image_analysis"
+  return _plan(route(user_input))
 
+async def planning_agent_async(user_input: str, has_image: bool) -> str:
   if has_image:
       return "image_analysis"
-  else:
-      return "chat"
\ No newline at end of file
+  return _plan(await route_async(user_input))
@@ -0,0 +1,64 @@
+# research_agent.py
+import logging
+import os
+
+from common.llm_client import get_llm_client, get_async_llm_client
+from common.metrics import span
+from agents.document_index import document_index
+
+logger = logging.getLogger(__name__)
+
+# Passages retrieved from the local index and given to the LLM per question
+RESEARCH_TOP_K = int(os.getenv("RESEARCH_TOP_K", "5"))
+
+NO_RESULTS = "I could not find anything about that in the document library."
+
+def research_messages(query: str, passages: list) -> list:
+    sources = "\n\n".join(f"[{i + 1}] ({p['file']})\n{p['text']}" for i, p in enumerate(passages))
+    return [
+        {"role": "system", "content": (
+            "You are a research assistant. Answer the question using only the numbered excerpts "
+            "from the internal document library below, and cite the excerpts you use as [1], [2], ... "
+            "If they do not contain the answer, say so."
+        )},
+        {"role": "system", "content": f"Excerpts:\n\n{sources}"},
+        {"role": "user", "content": query}
+    ]
+
+class ResearchAgent:
+    """
+    Answers questions from the local document library: the top passages of a
+    BM25 search over the memory-mapped index (see document_index.py) are sent
+    to the LLM with the question. It is truthy only while an index with at
+    least one passage is available, so the planner sends research requests to
+    plain chat until the indexer has been run.
+    """
+
+    def __init__(self, index=document_index, top_k: int = RESEARCH_TOP_K):
+        self.index = index
+        self.top_k = top_k
+
+    def __bool__(self) -> bool:
+        return self.index.available()
+
+    def _retrieve(self, query: str) -> list:
+        with span("research.retrieve"):
+            return self.index.search(query, self.top_k)
+
+    def __call__(self, query: str) -> str:
+        passages = self._retrieve(query)
+        if not passages:
+            return NO_RESULTS
+        return get_llm_client().chat_text(research_messages(query, passages), os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+                                          temperature=0.3, max_tokens=800)
+
+    async def answer_async(self, query: str) -> str:
+        # Retrieval takes milliseconds and only reads mapped memory, so it runs on the event loop
+        passages = self._retrieve(query)
+        if not passages:
+            return NO_RESULTS
+        return await get_async_llm_client().chat_text(research_messages(query, passages),
+                                                      os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+                                                      temperature=0.3, max_tokens=800)
+
+research_agent = ResearchAgent()
@@ -0,0 +1,223 @@
+# session_store.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from agents.context_manager import ContextManager
+
+logger = logging.getLogger(__name__)
+
+SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "16"))
+# Sessions untouched for this many seconds are moved out of memory
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+# Total estimated tokens of history held in memory across all sessions
+SESSION_MEMORY_CAP_TOKENS = int(os.getenv("SESSION_MEMORY_CAP_TOKENS", "2000000"))
+# Optional SQLite file that evicted sessions are spilled to instead of being dropped
+SESSION_SPILL_PATH = os.getenv("SESSION_SPILL_PATH", "")
+# Spilled sessions older than this many seconds are deleted
+SESSION_SPILL_TTL = float(os.getenv("SESSION_SPILL_TTL", str(7 * 24 * 3600)))
+SWEEP_INTERVAL = 60
+
+class SQLiteSpillBackend:
+    """Keeps the turns and summary of sessions evicted from memory in a SQLite table."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, turns TEXT NOT NULL, updated REAL NOT NULL, "
+            "summary TEXT NOT NULL DEFAULT '')"
+        )
+        # Spill files written before summaries were kept
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "summary" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def save(self, session_id: str, turns: list, summary: str = ""):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, turns, updated, summary) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(turns), time.time(), summary),
+            )
+            self._conn.commit()
+
+    def pop(self, session_id: str):
+        """Returns (turns, summary) of a spilled session and forgets it, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT turns, summary FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def expire(self, max_age: float):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - max_age,))
+            self._conn.commit()
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.last_access = {}
+        self.tokens = 0
+
+class SessionStore:
+    """
+    Per-session ContextManagers spread over lock-sharded dicts.
+
+    A session lives in the shard picked by hashing its ID, so requests for
+    different sessions rarely contend on the same lock. Each shard keeps its
+    sessions in LRU order, and sessions idle for longer than idle_ttl are
+    evicted. The token cap is global: once the history held across all shards
+    exceeds it, the least recently used sessions of the whole store are
+    evicted, whichever shard they are in. With a spill backend evicted sessions
+    (turns and summary) are written to disk and transparently loaded back on
+    their next request.
+    """
+
+    def __init__(self, shards: int = SESSION_SHARDS, idle_ttl: float = SESSION_IDLE_TTL,
+                 memory_cap_tokens: int = SESSION_MEMORY_CAP_TOKENS, spill_backend=None):
+        self.idle_ttl = idle_ttl
+        self.memory_cap_tokens = memory_cap_tokens
+        self.spill_backend = spill_backend
+        self._shards = [_Shard() for _ in range(shards)]
+        self._cap_lock = threading.Lock()
+        self.evictions = 0
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[zlib.crc32(session_id.encode("utf-8")) % len(self._shards)]
+
+    def _evict(self, shard: _Shard, session_id: str):
+        context_manager = shard.sessions.pop(session_id)
+        shard.last_access.pop(session_id, None)
+        shard.tokens -= context_manager.total_tokens
+        self.evictions += 1
+        if self.spill_backend is not None:
+            self.spill_backend.save(session_id, list(context_manager.history), context_manager.summary)
+
+    def _expire_idle(self, shard: _Shard, now: float):
+        while shard.sessions:
+            oldest = next(iter(shard.sessions))
+            if now - shard.last_access[oldest] < self.idle_ttl:
+                break
+            self._evict(shard, oldest)
+
+    def _get_or_create(self, shard: _Shard, session_id: str) -> ContextManager:
+        context_manager = shard.sessions.get(session_id)
+        if context_manager is None:
+            context_manager = ContextManager()
+            spilled = self.spill_backend.pop(session_id) if self.spill_backend is not None else None
+            if spilled is not None:
+                turns, summary = spilled
+                for turn in turns:
+                    context_manager.add_interaction(turn)
+                context_manager.summary = summary
+            shard.sessions[session_id] = context_manager
+            shard.tokens += context_manager.total_tokens
+        else:
+            shard.sessions.move_to_end(session_id)
+        shard.last_access[session_id] = time.monotonic()
+        return context_manager
+
+    def memory_tokens(self) -> int:
+        return sum(shard.tokens for shard in self._shards)
+
+    def _enforce_cap(self, keep: str):
+        """Evicts the least recently used sessions across all shards until the global cap holds again."""
+        if self.memory_tokens() <= self.memory_cap_tokens:
+            return
+        # One thread evicts at a time; the others go on serving, since it evicts on their behalf too
+        if not self._cap_lock.acquire(blocking=False):
+            return
+        try:
+            while self.memory_tokens() > self.memory_cap_tokens:
+                # Shard locks are taken one at a time, never nested, so this cannot deadlock with requests
+                victim = None
+                for shard in self._shards:
+                    with shard.lock:
+                        # Keep at least the session that was just used
+                        oldest = next((s for s in shard.sessions if s != keep), None)
+                        if oldest is not None and (victim is None or shard.last_access[oldest] < victim[0]):
+                            victim = (shard.last_access[oldest], shard, oldest)
+                if victim is None:
+                    return
+                last_access, shard, session_id = victim
+                with shard.lock:
+                    # Skip it if it was used while the other shards were looked at
+                    if shard.last_access.get(session_id) == last_access:
+                        self._evict(shard, session_id)
+        finally:
+            self._cap_lock.release()
+
+    def add_interaction(self, session_id: str, interaction: str):
+        shard = self._shard(session_id)
+        with shard.lock:
+            now = time.monotonic()
+            self._expire_idle(shard, now)
+            context_manager = self._get_or_create(shard, session_id)
+            before = context_manager.total_tokens
+            context_manager.add_interaction(interaction)
+            shard.tokens += context_manager.total_tokens - before
+        self._enforce_cap(session_id)
+
+    def get_context(self, session_id: str) -> str:
+        shard = self._shard(session_id)
+        with shard.lock:
+            context = self._get_or_create(shard, session_id).get_context()
+        self._enforce_cap(session_id)
+        return context
+
+    def context_payload(self, session_id: str, client_version: str = None) -> dict:
+        """The session's context, or only what changed since client_version (see ContextManager)."""
+        shard = self._shard(session_id)
+        with shard.lock:
+            payload = self._get_or_create(shard, session_id).context_payload(client_version)
+        self._enforce_cap(session_id)
+        return payload
+
+    def session_count(self) -> int:
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self.session_count(),
+            "memory_tokens": self.memory_tokens(),
+            "memory_cap_tokens": self.memory_cap_tokens,
+            "evictions": self.evictions,
+            "spilled": self.spill_backend.count() if self.spill_backend is not None else None,
+        }
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            for shard in self._shards:
+                with shard.lock:
+                    self._expire_idle(shard, time.monotonic())
+            if self.spill_backend is not None:
+                try:
+                    self.spill_backend.expire(SESSION_SPILL_TTL)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to expire spilled sessions: {str(e)}")
+
+session_store = SessionStore(
+    spill_backend=SQLiteSpillBackend(SESSION_SPILL_PATH) if SESSION_SPILL_PATH else None
+)
@@ -0,0 +1,53 @@
+# turns.py
+# Session handling shared by the WSGI (app.py) and ASGI (asgi.py) entry points
+import re
+import uuid
+
+from common.metrics import span
+
+from agents.session_store import session_store
+from agents.knowledge_manager import knowledge_manager
+
+# Each client keeps its own conversation history, identified by this header or cookie
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "session_id"
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Sent back by the client so responses only carry what changed since its last one
+VERSION_FIELDS = ("context_version", "knowledge_version")
+
+def session_id_from(headers, cookies) -> str:
+    """Returns the caller's session ID, or a new one if none (or an invalid one) was sent."""
+    session_id = headers.get(SESSION_HEADER) or cookies.get(SESSION_COOKIE)
+    if session_id and SESSION_ID_RE.match(session_id):
+        return session_id
+    return uuid.uuid4().hex
+
+def start_turn(session_id: str, user_input: str) -> str:
+    """Records the user's message and returns the conversation context for the agents."""
+    with span("context"):
+        session_store.add_interaction(session_id, f"User: {user_input}")
+        return session_store.get_context(session_id)
+
+def finish_turn(session_id: str, plan: str, ai_message: str, versions: dict = None) -> dict:
+    """
+    Records the AI's reply and returns the response payload.
+    versions holds the context_version/knowledge_version the client last saw; for
+    each one that is still valid only the changes since are sent (context_delta,
+    knowledge_delta) instead of the full context and knowledge.
+    """
+    versions = versions or {}
+    with span("context.update"):
+        # If image analysis was performed, store the result in the knowledge manager
+        if plan == "image_analysis":
+            knowledge_manager.add_knowledge("latest_image_analysis", ai_message)
+
+        # Update context with the AI's response
+        session_store.add_interaction(session_id, f"AI: {ai_message}")
+
+        return {
+            "message": ai_message,
+            **session_store.context_payload(session_id, versions.get("context_version")),
+            **knowledge_manager.knowledge_payload(versions.get("knowledge_version")),
+            "session_id": session_id,
+        }
@@ -1,10 +1,10 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import sys
 import logging
 from dotenv import load_dotenv
-import openai
 
 # Load environment variables
 load_dotenv()
@@ -15,24 +15,41 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Azure OpenAI Configuration
-azure_openai_key = os.getenv("AZURE_OPENAI_KEY")
-azure_openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-azure_openai_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+# Shared helpers live in <repo>/common
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.image_ingest import ImageTooLargeError, MAX_IMAGE_BYTES
+from common.vision_cache import vision_cache
+from common.sse import sse_event, SSE_HEADERS
+# Azure OpenAI is configured from AZURE_OPENAI_KEY/ENDPOINT/DEPLOYMENT by the shared client
+from common.llm_client import get_llm_client
+from common.metrics import instrument_app, span
 
-openai.api_type = "azure"
-openai.api_key = azure_openai_key
-openai.api_base = azure_openai_endpoint
-openai.api_version = "2023-05-15"
+# Reject oversized uploads before they are read (1 MB allowance for the other form fields)
+app.config["MAX_CONTENT_LENGTH"] = MAX_IMAGE_BYTES + 1024 * 1024
+# Request timing, GET /metrics and (with PROFILER_CONTROL=1) the /api/profiler switch
+instrument_app(app)
 
 # Import multi-agent components
 from agents.planning_agent import planning_agent
-from agents.execution_agent import execution_agent
-from agents.context_manager import ContextManager
-from agents.knowledge_manager import knowledge_manager
+from agents.execution_agent import execution_agent, execution_agent_stream
+from agents.session_store import session_store
+from agents.turns import SESSION_COOKIE, VERSION_FIELDS, finish_turn, session_id_from, start_turn
 
-# Initialize a context manager instance
-context_manager = ContextManager()
+def get_session_id() -> str:
+    return session_id_from(request.headers, request.cookies)
+
+def stream_turn(session_id: str, plan: str, user_input: str, current_context: str, image_file, prompt: str,
+                versions: dict):
+    """Yields the reply as SSE "delta" events, then a "done" event with the usual response fields."""
+    parts = []
+    try:
+        for delta in execution_agent_stream(plan, user_input, context=current_context, image_file=image_file, prompt=prompt):
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+        yield sse_event({"done": True, **finish_turn(session_id, plan, "".join(parts), versions)})
+    except Exception as e:
+        logger.error(f"Error in multi-agent stream: {str(e)}")
+        yield sse_event({"error": str(e)})
 
 @app.route('/api/multi-agent', methods=['POST'])
 def multi_agent():
@@ -43,46 +60,63 @@ def multi_agent():
             image_file = request.files['image']
             user_input = request.form.get('message', '')
             prompt = request.form.get('prompt', 'Describe this image in detail.')
+            wants_stream = request.form.get('stream') == 'true'
+            versions = {key: request.form.get(key) for key in VERSION_FIELDS}
         else:
             has_image = False
             image_file = None
             data = request.json
             user_input = data.get('message', '')
             prompt = data.get('prompt', '')
+            wants_stream = bool(data.get('stream'))
+            versions = {key: data.get(key) for key in VERSION_FIELDS}
 
         if not user_input and not has_image:
             return jsonify({"error": "No input provided"}), 400
 
-        # Update context with the user input
-        context_manager.add_interaction(f"User: {user_input}")
+        session_id = get_session_id()
 
-        # Retrieve current conversation context
-        current_context = context_manager.get_context()
+        # Update context with the user input and retrieve the conversation so far
+        current_context = start_turn(session_id, user_input)
 
         # Use the planning agent to determine the task type
-        plan = planning_agent(user_input, has_image)
-
-        # Execute the task using the execution agent, passing the conversation context
-        ai_message = execution_agent(plan, user_input, context=current_context, image_file=image_file, prompt=prompt)
-
-        # If image analysis was performed, store the result in the knowledge manager
-        if plan == "image_analysis":
-            knowledge_manager.add_knowledge("latest_image_analysis", ai_message)
-
-        # Retrieve shared knowledge for optional display
-        shared_knowledge = knowledge_manager.get_all_knowledge()
-
-        # Update context with the AI's response
-        context_manager.add_interaction(f"AI: {ai_message}")
-
-        # Retrieve updated context
-        context = context_manager.get_context()
-        return jsonify({"message": ai_message, "context": context, "knowledge": shared_knowledge})
-
+        with span("planning"):
+            plan = planning_agent(user_input, has_image)
+
+        if wants_stream:
+            # Relay the reply as server-sent events as soon as it is generated
+            response = Response(
+                stream_with_context(stream_turn(session_id, plan, user_input, current_context, image_file, prompt, versions)),
+                mimetype='text/event-stream', headers=SSE_HEADERS
+            )
+        else:
+            # Execute the task using the execution agent, passing the conversation context
+            with span("execution"):
+                ai_message = execution_agent(plan, user_input, context=current_context, image_file=image_file, prompt=prompt)
+            payload = finish_turn(session_id, plan, ai_message, versions)
+            with span("serialize"):
+                response = jsonify(payload)
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+        return response
+
+    except ImageTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         logger.error(f"Error in multi-agent endpoint: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/session-stats', methods=['GET'])
+def session_stats():
+    return jsonify(session_store.stats())
+
+@app.route('/api/vision-cache-stats', methods=['GET'])
+def vision_cache_stats():
+    return jsonify(vision_cache.stats())
+
+@app.route('/api/llm-stats', methods=['GET'])
+def llm_stats():
+    return jsonify(get_llm_client().stats())
+
 if __name__ == '__main__':
     # Warn if required Azure credentials are missing
     required_vars = ["AZURE_OPENAI_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_DEPLOYMENT", "AZURE_VISION_KEY", "AZURE_VISION_ENDPOINT"]
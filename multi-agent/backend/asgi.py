@@ -0,0 +1,120 @@
+# asgi.py
+# Async serving mode: same routes and JSON as app.py, served by an ASGI server, e.g.
+#   uvicorn asgi:app --port 5000
+# Vision and LLM calls are awaited on the event loop instead of holding a worker thread each;
+# session store calls, which may read or write the spill file, run in worker threads.
+from quart import Quart, request, jsonify
+from quart_cors import cors
+import asyncio
+import os
+import sys
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+app = cors(app)
+
+# Shared helpers live in <repo>/common
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.image_ingest import ImageTooLargeError, MAX_IMAGE_BYTES
+from common.vision_cache import vision_cache
+from common.sse import sse_event, SSE_HEADERS
+from common.llm_client import get_async_llm_client
+from common.metrics import instrument_app, span
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_IMAGE_BYTES + 1024 * 1024
+# Request timing, GET /metrics and (with PROFILER_CONTROL=1) the /api/profiler switch
+instrument_app(app)
+
+from agents.planning_agent import planning_agent_async
+from agents.execution_agent import execution_agent_async, execution_agent_stream_async
+from agents.session_store import session_store
+from agents.turns import SESSION_COOKIE, VERSION_FIELDS, finish_turn, session_id_from, start_turn
+
+def get_session_id() -> str:
+    return session_id_from(request.headers, request.cookies)
+
+async def stream_turn(session_id: str, plan: str, user_input: str, current_context: str, image_file, prompt: str,
+                      versions: dict):
+    """Yields the reply as SSE "delta" events, then a "done" event with the usual response fields."""
+    parts = []
+    try:
+        async for delta in execution_agent_stream_async(plan, user_input, context=current_context, image_file=image_file, prompt=prompt):
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+        payload = await asyncio.to_thread(finish_turn, session_id, plan, "".join(parts), versions)
+        yield sse_event({"done": True, **payload})
+    except Exception as e:
+        logger.error(f"Error in multi-agent stream: {str(e)}")
+        yield sse_event({"error": str(e)})
+
+@app.route('/api/multi-agent', methods=['POST'])
+async def multi_agent():
+    try:
+        files = await request.files
+        if 'image' in files:
+            has_image = True
+            image_file = files['image']
+            form = await request.form
+            user_input = form.get('message', '')
+            prompt = form.get('prompt', 'Describe this image in detail.')
+            wants_stream = form.get('stream') == 'true'
+            versions = {key: form.get(key) for key in VERSION_FIELDS}
+        else:
+            has_image = False
+            image_file = None
+            data = await request.get_json()
+            user_input = data.get('message', '')
+            prompt = data.get('prompt', '')
+            wants_stream = bool(data.get('stream'))
+            versions = {key: data.get(key) for key in VERSION_FIELDS}
+
+        if not user_input and not has_image:
+            return jsonify({"error": "No input provided"}), 400
+
+        session_id = get_session_id()
+        current_context = await asyncio.to_thread(start_turn, session_id, user_input)
+        with span("planning"):
+            plan = await planning_agent_async(user_input, has_image)
+
+        if wants_stream:
+            response = app.response_class(
+                stream_turn(session_id, plan, user_input, current_context, image_file, prompt, versions),
+                mimetype='text/event-stream', headers=SSE_HEADERS
+            )
+            # Streams are not subject to the body timeout (they end when the LLM finishes)
+            response.timeout = None
+        else:
+            with span("execution"):
+                ai_message = await execution_agent_async(plan, user_input, context=current_context, image_file=image_file, prompt=prompt)
+            payload = await asyncio.to_thread(finish_turn, session_id, plan, ai_message, versions)
+            with span("serialize"):
+                response = jsonify(payload)
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+        return response
+
+    except ImageTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        logger.error(f"Error in multi-agent endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/session-stats', methods=['GET'])
+async def session_stats():
+    return jsonify(await asyncio.to_thread(session_store.stats))
+
+@app.route('/api/vision-cache-stats', methods=['GET'])
+async def vision_cache_stats():
+    return jsonify(vision_cache.stats())
+
+@app.route('/api/llm-stats', methods=['GET'])
+async def llm_stats():
+    return jsonify(get_async_llm_client().stats())
+
+if __name__ == '__main__':
+    app.run(debug=True, port=5000)
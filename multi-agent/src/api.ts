@@ -1,33 +1,167 @@
 import axios from 'axios';
+import { ContextDelta, StreamEvent } from './types';
 
 const API_URL = 'http://localhost:5000/api';
 
-export const sendMessage = async (message: string): Promise<{ message: string }> => {
+// Identifies this browser's conversation so the backend keeps its history separate
+const SESSION_STORAGE_KEY = 'multiAgentSessionId';
+
+const getSessionId = (): string => {
+  let sessionId = localStorage.getItem(SESSION_STORAGE_KEY);
+  if (!sessionId) {
+    sessionId = crypto.randomUUID().replace(/-/g, '');
+    localStorage.setItem(SESSION_STORAGE_KEY, sessionId);
+  }
+  return sessionId;
+};
+
+// Context and knowledge as last sent by the server. Requests carry their versions
+// so responses only include what changed; an unknown version gets a reset delta.
+interface ConversationState {
+  contextVersion?: string;
+  knowledgeVersion?: string;
+  // Context turns, numbered from firstTurn; summary is an optional first line
+  firstTurn: number;
+  turns: string[];
+  summary: string;
+  knowledge: Record<string, string>;
+}
+
+const conversation: ConversationState = { firstTurn: 1, turns: [], summary: '', knowledge: {} };
+
+// An empty context version asks for the context as turns (a reset delta) rather than one string
+const versionFields = () => ({
+  context_version: conversation.contextVersion ?? '',
+  knowledge_version: conversation.knowledgeVersion ?? '',
+});
+
+const applyContextDelta = (delta: ContextDelta) => {
+  if (delta.reset || delta.start !== conversation.firstTurn + conversation.turns.length) {
+    // Start over from the turns sent (a gap means some were missed)
+    conversation.turns = [];
+    conversation.firstTurn = delta.start;
+  }
+  conversation.turns.push(...delta.turns);
+  if (delta.first_turn > conversation.firstTurn) {
+    // Turns the server has evicted from the context
+    conversation.turns.splice(0, delta.first_turn - conversation.firstTurn);
+    conversation.firstTurn = delta.first_turn;
+  }
+  if (delta.summary !== undefined) {
+    conversation.summary = delta.summary;
+  }
+};
+
+const currentContext = (): string => {
+  const joined = conversation.turns.join('\n');
+  return conversation.summary ? `Summary of earlier conversation: ${conversation.summary}\n${joined}` : joined;
+};
+
+// Folds a response's context/knowledge delta into the local state and returns
+// the response with the complete context and knowledge filled in
+const applyConversationState = <T extends StreamEvent>(data: T): T => {
+  if (data.context_delta) {
+    applyContextDelta(data.context_delta);
+  }
+  if (data.knowledge !== undefined) {
+    conversation.knowledge = { ...data.knowledge };
+  } else if (data.knowledge_delta) {
+    conversation.knowledge = { ...conversation.knowledge, ...data.knowledge_delta };
+  }
+  conversation.contextVersion = data.context_version ?? conversation.contextVersion;
+  conversation.knowledgeVersion = data.knowledge_version ?? conversation.knowledgeVersion;
+  return { ...data, context: data.context ?? currentContext(), knowledge: conversation.knowledge };
+};
+
+// Reads a server-sent event stream, calling onEvent with each JSON payload
+const readEventStream = async (response: Response, onEvent: (event: StreamEvent) => void): Promise<void> => {
+  if (!response.ok || !response.body) {
+    throw new Error(`Request failed with status ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('data: ')) {
+          const event: StreamEvent = JSON.parse(line.slice(6));
+          if (event.error) throw new Error(event.error);
+          onEvent(event);
+        }
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+};
+
+export const sendMessage = async (message: string): Promise<StreamEvent & { message: string }> => {
   try {
-    const response = await axios.post(`${API_URL}/multi-agent`, { message });
-    return response.data;
+    const response = await axios.post(`${API_URL}/multi-agent`, { message, ...versionFields() }, {
+      headers: {
+        'X-Session-Id': getSessionId(),
+      },
+    });
+    return applyConversationState(response.data);
   } catch (error) {
     console.error('Error sending message:', error);
     throw error;
   }
 };
 
-export const analyzeImage = async (image: File, prompt?: string): Promise<{ message: string }> => {
+// Streams the reply, calling onDelta with each piece as it arrives; resolves with the final event
+export const streamMessage = async (message: string, onDelta: (delta: string) => void): Promise<StreamEvent> => {
+  try {
+    const response = await fetch(`${API_URL}/multi-agent`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-Session-Id': getSessionId(),
+      },
+      body: JSON.stringify({ message, stream: true, ...versionFields() }),
+    });
+    let finalEvent: StreamEvent = {};
+    await readEventStream(response, (event) => {
+      if (event.delta) {
+        onDelta(event.delta);
+      }
+      if (event.done) {
+        finalEvent = applyConversationState(event);
+      }
+    });
+    return finalEvent;
+  } catch (error) {
+    console.error('Error streaming message:', error);
+    throw error;
+  }
+};
+
+export const analyzeImage = async (image: File, prompt?: string): Promise<StreamEvent & { message: string }> => {
   try {
     const formData = new FormData();
     formData.append('image', image);
     if (prompt) {
       formData.append('prompt', prompt);
     }
+    for (const [key, version] of Object.entries(versionFields())) {
+      formData.append(key, version);
+    }
     
     const response = await axios.post(`${API_URL}/multi-agent`, formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
+        'X-Session-Id': getSessionId(),
       },
       timeout: 30000, // Increase timeout to 30 seconds for image analysis
     });
     
-    return response.data;
+    return applyConversationState(response.data);
   } catch (error) {
     console.error('Error analyzing image:', error);
     throw error;
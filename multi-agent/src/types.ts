@@ -10,4 +10,29 @@ export interface Message {
 export interface ApiResponse {
   message: string;
   error?: string;
-}
\ No newline at end of file
+}
+
+// Turns added to the conversation context since the version the client sent
+export interface ContextDelta {
+  start: number;
+  turns: string[];
+  first_turn: number;
+  summary?: string;
+  // Set when the server did not recognise the version sent: replace all local turns
+  reset?: boolean;
+}
+
+// One server-sent event from a streaming chat endpoint
+export interface StreamEvent {
+  delta?: string;
+  done?: boolean;
+  error?: string;
+  message?: string;
+  context?: string;
+  context_delta?: ContextDelta;
+  context_version?: string;
+  knowledge?: Record<string, string>;
+  knowledge_delta?: Record<string, string>;
+  knowledge_version?: string;
+  session_id?: string;
+}
@@ -1,22 +1,36 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import sys
 import logging
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.vision.imageanalysis import ImageAnalysisClient
-from azure.ai.vision.imageanalysis.models import VisualFeatures
-import openai
 
-# Load environment variables
+# Load environment variables before the shared modules below read their settings
 load_dotenv()
 
+# Shared helpers live in <repo>/common
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.image_ingest import load_image, read_image_bytes, ImageTooLargeError, MAX_IMAGE_BYTES
+from common.vision_cache import analyze_image as analyze_image_cached, vision_cache
+from common.sse import sse_event, SSE_HEADERS
+from common.llm_client import get_llm_client
+from common.metrics import instrument_app, span
+from batch_analysis import (analysis_prompt, analyze_batch, chat_messages, combined_prompt,
+                            BATCH_MAX_BYTES, BATCH_MAX_IMAGES, MODEL_PARAMS)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# Reject oversized uploads before they are read (1 MB allowance for the other form fields).
+# Batches may be larger in total; each image is still held to MAX_IMAGE_BYTES when read.
+app.config["MAX_CONTENT_LENGTH"] = max(MAX_IMAGE_BYTES, BATCH_MAX_BYTES) + 1024 * 1024
+# Request timing, GET /metrics and (with PROFILER_CONTROL=1) the /api/profiler switch
+instrument_app(app)
 
 # Azure OpenAI Configuration
 azure_openai_key = os.getenv("AZURE_OPENAI_KEY")
@@ -27,11 +41,8 @@ azure_openai_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 vision_key = os.getenv("AZURE_VISION_KEY")
 vision_endpoint = os.getenv("AZURE_VISION_ENDPOINT")
 
-# Configure OpenAI with Azure settings
-openai.api_type = "azure"
-openai.api_key = azure_openai_key
-openai.api_base = azure_openai_endpoint
-openai.api_version = "2023-05-15"
+# Azure OpenAI calls go through the shared, pooled client (configured from the same variables)
+llm_client = get_llm_client()
 
 # TODO 2: Initialize Azure Vision API Client
 vision_client = ImageAnalysisClient(
@@ -39,6 +50,17 @@ vision_client = ImageAnalysisClient(
  credential=AzureKeyCredential(vision_key)
 )
 
+def stream_chat(messages):
+    """Yields the completion as SSE "delta" events followed by a "done" event."""
+    try:
+        response = llm_client.chat_stream(messages, azure_openai_deployment, temperature=0.7, max_tokens=800)
+        for delta in response:
+            yield sse_event({"delta": delta})
+        yield sse_event({"done": True})
+    except Exception as e:
+        logger.error(f"Error in chat stream: {str(e)}")
+        yield sse_event({"error": str(e)})
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
@@ -47,19 +69,19 @@ def chat():
         
         if not user_message:
             return jsonify({"error": "No message provided"}), 400
+
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": user_message}
+        ]
+
+        # Relay tokens as server-sent events as soon as they are generated
+        if data.get('stream'):
+            return Response(stream_with_context(stream_chat(messages)),
+                            mimetype='text/event-stream', headers=SSE_HEADERS)
         
         # Call Azure OpenAI
-        response = openai.ChatCompletion.create(
-            engine=azure_openai_deployment,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.7,
-            max_tokens=800
-        )
-        
-        ai_message = response.choices[0].message.content
+        ai_message = llm_client.chat_text(messages, azure_openai_deployment, temperature=0.7, max_tokens=800)
         
         return jsonify({"message": ai_message})
     
@@ -77,61 +99,102 @@ def analyze_image():
         image_file = request.files['image']
         prompt = request.form.get('prompt', 'Describe this image in detail.')
         
-        # Save image temporarily
-        temp_image_path = "temp_image.jpg"
-        image_file.save(temp_image_path)
-        
-        with open(temp_image_path, "rb") as f:
-                image_data = f.read()
+        # Read the upload in memory (no temp file shared between requests)
+        try:
+            with span("image.load"):
+                image_data = load_image(image_file)
+        except ImageTooLargeError as size_error:
+            return jsonify({"error": str(size_error)}), 413
       
         try:
-            result = vision_client.analyze(
-               image_data=image_data,
-               visual_features=[
-                  VisualFeatures.CAPTION,
-                  VisualFeatures.TAGS,
-                  VisualFeatures.OBJECTS
-               ]
-            )
-         
-            caption = result.caption.text if result.caption else ""
-            tags = [getattr(tag, "name", str(tag)) for tag in result.tags] if result.tags else []
-            objects = [getattr(obj, "name", str(obj)) for obj in result.objects] if result.objects else []
+            # Repeat uploads of the same image are served from the shared cache
+            caption, tags, objects = analyze_image_cached(vision_client, image_data)
          
         except Exception as analysis_error:
             logger.error(f"Image analysis error: {str(analysis_error)}")
             return jsonify({"error": "Failed to analyze image"}), 500
 
-        analysis_prompt = f"""
-            Image Analysis:
-            - Caption: {caption}
-            - Tags: {', '.join(tags)}
-            - Objects: {', '.join(objects)}
-            """
-        analysis_prompt += f"\n\nUser prompt: {prompt}\n\nBased on the image analysis above, please respond to the user's prompt."
-        
-        response = openai.ChatCompletion.create(
-            engine=azure_openai_deployment,
-            messages=[
-               {"role": "system", "content": "You are a helpful assistant that analyzes images."},
-               {"role": "user", "content": analysis_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=800
+        ai_message = llm_client.chat_text(
+            chat_messages(analysis_prompt(caption, tags, objects, prompt)),
+            azure_openai_deployment,
+            **MODEL_PARAMS
             )
       
-        ai_message = response.choices[0].message.content
-      
-        os.remove(temp_image_path)
-      
         return jsonify({"message": ai_message})
    
     except Exception as e:
       logger.error(f"Error in analyze-image endpoint: {str(e)}")
-      if os.path.exists("temp_image.jpg"):
-        os.remove("temp_image.jpg")
       return jsonify({"error": str(e)}), 500
 
+def stream_batch(images, prompt, per_image):
+    """
+    Yields an "image" event per image as its analysis completes, then (unless
+    each image got its own answer) the combined answer as "delta" events, then "done".
+    """
+    try:
+        results = []
+        for result in analyze_batch(vision_client, llm_client, azure_openai_deployment, images, prompt, per_image):
+            results.append(result)
+            yield sse_event({"image": result})
+        if not per_image and any("error" not in result for result in results):
+            stream = llm_client.chat_stream(chat_messages(combined_prompt(results, prompt)),
+                                            azure_openai_deployment, **MODEL_PARAMS)
+            for delta in stream:
+                yield sse_event({"delta": delta})
+        yield sse_event({"done": True})
+    except Exception as e:
+        logger.error(f"Error in analyze-images stream: {str(e)}")
+        yield sse_event({"error": str(e)})
+
+@app.route('/api/analyze-images', methods=['POST'])
+def analyze_images():
+    """
+    Analyzes many images (form field "images", repeated) concurrently.
+    mode=combined (default) answers the prompt once for all images; mode=per_image
+    answers it for each image. With stream=true results are sent as each image finishes.
+    """
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({"error": "No images provided"}), 400
+        if len(files) > BATCH_MAX_IMAGES:
+            return jsonify({"error": f"At most {BATCH_MAX_IMAGES} images per request"}), 400
+
+        prompt = request.form.get('prompt', 'Describe these images in detail.')
+        per_image = request.form.get('mode', 'combined') == 'per_image'
+
+        try:
+            with span("image.load"):
+                images = [(image_file.filename, read_image_bytes(image_file)) for image_file in files]
+        except ImageTooLargeError as size_error:
+            return jsonify({"error": str(size_error)}), 413
+
+        if request.form.get('stream') == 'true':
+            return Response(stream_with_context(stream_batch(images, prompt, per_image)),
+                            mimetype='text/event-stream', headers=SSE_HEADERS)
+
+        results = sorted(analyze_batch(vision_client, llm_client, azure_openai_deployment, images, prompt, per_image),
+                         key=lambda result: result["index"])
+        response_data = {"results": results}
+        if not per_image:
+            if all("error" in result for result in results):
+                return jsonify({"error": "Failed to analyze images", "results": results}), 500
+            response_data["message"] = llm_client.chat_text(chat_messages(combined_prompt(results, prompt)),
+                                                            azure_openai_deployment, **MODEL_PARAMS)
+        return jsonify(response_data)
+
+    except Exception as e:
+        logger.error(f"Error in analyze-images endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/vision-cache-stats', methods=['GET'])
+def vision_cache_stats():
+    return jsonify(vision_cache.stats())
+
+@app.route('/api/llm-stats', methods=['GET'])
+def llm_stats():
+    return jsonify(llm_client.stats())
+
 if __name__ == '__main__':
     if not all([azure_openai_key, azure_openai_endpoint, azure_openai_deployment, 
                 vision_key, vision_endpoint]):
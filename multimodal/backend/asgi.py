@@ -0,0 +1,188 @@
+# asgi.py
+# Async serving mode: same routes and JSON as app.py, served by an ASGI server, e.g.
+#   uvicorn asgi:app --port 5000
+# Vision and LLM calls are awaited on the event loop instead of holding a worker thread each;
+# image decoding and downscaling run in worker threads.
+from quart import Quart, request, jsonify
+from quart_cors import cors
+import asyncio
+import os
+import sys
+import logging
+from dotenv import load_dotenv
+from azure.core.credentials import AzureKeyCredential
+from azure.ai.vision.imageanalysis.aio import ImageAnalysisClient
+
+# Load environment variables before the shared modules below read their settings
+load_dotenv()
+
+# Shared helpers live in <repo>/common
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.image_ingest import load_image, read_image_bytes, ImageTooLargeError, MAX_IMAGE_BYTES
+from common.vision_cache import analyze_image_async, vision_cache
+from common.sse import sse_event, SSE_HEADERS
+from common.llm_client import get_async_llm_client
+from common.metrics import instrument_app, span
+from batch_analysis import (analysis_prompt, analyze_batch_async, chat_messages, combined_prompt,
+                            BATCH_MAX_BYTES, BATCH_MAX_IMAGES, MODEL_PARAMS)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+app = cors(app)
+app.config["MAX_CONTENT_LENGTH"] = max(MAX_IMAGE_BYTES, BATCH_MAX_BYTES) + 1024 * 1024
+# Request timing, GET /metrics and (with PROFILER_CONTROL=1) the /api/profiler switch
+instrument_app(app)
+
+azure_openai_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+vision_key = os.getenv("AZURE_VISION_KEY")
+vision_endpoint = os.getenv("AZURE_VISION_ENDPOINT")
+
+llm_client = get_async_llm_client()
+
+vision_client = ImageAnalysisClient(
+    endpoint=vision_endpoint,
+    credential=AzureKeyCredential(vision_key)
+)
+
+async def stream_chat(messages):
+    """Yields the completion as SSE "delta" events followed by a "done" event."""
+    try:
+        async for delta in llm_client.chat_stream(messages, azure_openai_deployment, temperature=0.7, max_tokens=800):
+            yield sse_event({"delta": delta})
+        yield sse_event({"done": True})
+    except Exception as e:
+        logger.error(f"Error in chat stream: {str(e)}")
+        yield sse_event({"error": str(e)})
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    try:
+        data = await request.get_json()
+        user_message = data.get('message', '')
+
+        if not user_message:
+            return jsonify({"error": "No message provided"}), 400
+
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": user_message}
+        ]
+
+        if data.get('stream'):
+            response = app.response_class(stream_chat(messages), mimetype='text/event-stream', headers=SSE_HEADERS)
+            # Streams are not subject to the body timeout (they end when the LLM finishes)
+            response.timeout = None
+            return response
+
+        ai_message = await llm_client.chat_text(messages, azure_openai_deployment, temperature=0.7, max_tokens=800)
+
+        return jsonify({"message": ai_message})
+
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/analyze-image', methods=['POST'])
+async def analyze_image():
+    try:
+        files = await request.files
+        if 'image' not in files:
+            return jsonify({"error": "No image provided"}), 400
+
+        image_file = files['image']
+        form = await request.form
+        prompt = form.get('prompt', 'Describe this image in detail.')
+
+        try:
+            with span("image.load"):
+                # Pillow decodes and downscales in a worker thread so other requests keep running
+                image_data = await asyncio.to_thread(load_image, image_file)
+        except ImageTooLargeError as size_error:
+            return jsonify({"error": str(size_error)}), 413
+
+        try:
+            caption, tags, objects = await analyze_image_async(vision_client, image_data)
+        except Exception as analysis_error:
+            logger.error(f"Image analysis error: {str(analysis_error)}")
+            return jsonify({"error": "Failed to analyze image"}), 500
+
+        ai_message = await llm_client.chat_text(
+            chat_messages(analysis_prompt(caption, tags, objects, prompt)),
+            azure_openai_deployment,
+            **MODEL_PARAMS
+        )
+
+        return jsonify({"message": ai_message})
+
+    except Exception as e:
+        logger.error(f"Error in analyze-image endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+async def stream_batch(images, prompt, per_image):
+    """Same events as stream_batch in app.py."""
+    try:
+        results = []
+        async for result in analyze_batch_async(vision_client, llm_client, azure_openai_deployment, images, prompt, per_image):
+            results.append(result)
+            yield sse_event({"image": result})
+        if not per_image and any("error" not in result for result in results):
+            async for delta in llm_client.chat_stream(chat_messages(combined_prompt(results, prompt)),
+                                                      azure_openai_deployment, **MODEL_PARAMS):
+                yield sse_event({"delta": delta})
+        yield sse_event({"done": True})
+    except Exception as e:
+        logger.error(f"Error in analyze-images stream: {str(e)}")
+        yield sse_event({"error": str(e)})
+
+@app.route('/api/analyze-images', methods=['POST'])
+async def analyze_images():
+    try:
+        files = (await request.files).getlist('images')
+        if not files:
+            return jsonify({"error": "No images provided"}), 400
+        if len(files) > BATCH_MAX_IMAGES:
+            return jsonify({"error": f"At most {BATCH_MAX_IMAGES} images per request"}), 400
+
+        form = await request.form
+        prompt = form.get('prompt', 'Describe these images in detail.')
+        per_image = form.get('mode', 'combined') == 'per_image'
+
+        try:
+            with span("image.load"):
+                images = [(image_file.filename, read_image_bytes(image_file)) for image_file in files]
+        except ImageTooLargeError as size_error:
+            return jsonify({"error": str(size_error)}), 413
+
+        if form.get('stream') == 'true':
+            response = app.response_class(stream_batch(images, prompt, per_image), mimetype='text/event-stream',
+                                          headers=SSE_HEADERS)
+            response.timeout = None
+            return response
+
+        results = [result async for result in analyze_batch_async(vision_client, llm_client, azure_openai_deployment,
+                                                                  images, prompt, per_image)]
+        results.sort(key=lambda result: result["index"])
+        response_data = {"results": results}
+        if not per_image:
+            if all("error" in result for result in results):
+                return jsonify({"error": "Failed to analyze images", "results": results}), 500
+            response_data["message"] = await llm_client.chat_text(chat_messages(combined_prompt(results, prompt)),
+                                                                  azure_openai_deployment, **MODEL_PARAMS)
+        return jsonify(response_data)
+
+    except Exception as e:
+        logger.error(f"Error in analyze-images endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/vision-cache-stats', methods=['GET'])
+async def vision_cache_stats():
+    return jsonify(vision_cache.stats())
+
+@app.route('/api/llm-stats', methods=['GET'])
+async def llm_stats():
+    return jsonify(llm_client.stats())
+
+if __name__ == '__main__':
+    app.run(debug=True, port=5000)
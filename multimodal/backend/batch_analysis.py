@@ -0,0 +1,137 @@
+# batch_analysis.py
+import asyncio
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from common.image_ingest import downscale_image
+from common.vision_cache import analyze_image as analyze_image_cached, analyze_image_async
+
+logger = logging.getLogger(__name__)
+
+# Largest number of images accepted by /api/analyze-images
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "32"))
+# Largest total upload of one batch request
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(100 * 1024 * 1024)))
+# Images analyzed at once, shared by all batch requests of the process
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+SYSTEM_PROMPT = "You are a helpful assistant that analyzes images."
+MODEL_PARAMS = {"temperature": 0.7, "max_tokens": 800}
+
+def analysis_prompt(caption: str, tags: list, objects: list, prompt: str) -> str:
+    analysis = f"""
+            Image Analysis:
+            - Caption: {caption}
+            - Tags: {', '.join(tags)}
+            - Objects: {', '.join(objects)}
+            """
+    return analysis + f"\n\nUser prompt: {prompt}\n\nBased on the image analysis above, please respond to the user's prompt."
+
+def combined_prompt(results: list, prompt: str) -> str:
+    """One prompt covering every successfully analyzed image of a batch, in upload order."""
+    sections = []
+    for result in sorted(results, key=lambda r: r["index"]):
+        if "error" in result:
+            continue
+        sections.append(
+            f"Image {result['index'] + 1} ({result['filename']}):\n"
+            f"- Caption: {result['caption']}\n"
+            f"- Tags: {', '.join(result['tags'])}\n"
+            f"- Objects: {', '.join(result['objects'])}"
+        )
+    return ("Image Analyses:\n\n" + "\n\n".join(sections) +
+            f"\n\nUser prompt: {prompt}\n\nBased on the image analyses above, please respond to the user's prompt.")
+
+def chat_messages(content: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+def _analyze_one(vision_client, llm_client, deployment: str, index: int, filename: str, image_data: bytes,
+                 prompt: str, per_image: bool) -> dict:
+    result = {"index": index, "filename": filename}
+    try:
+        caption, tags, objects = analyze_image_cached(vision_client, downscale_image(image_data))
+    except Exception as e:
+        logger.error(f"Image analysis error for {filename}: {str(e)}")
+        result["error"] = "Failed to analyze image"
+        return result
+    result.update(caption=caption, tags=tags, objects=objects)
+    if per_image:
+        try:
+            result["message"] = llm_client.chat_text(chat_messages(analysis_prompt(caption, tags, objects, prompt)),
+                                                     deployment, **MODEL_PARAMS)
+        except Exception as e:
+            logger.error(f"LLM error for {filename}: {str(e)}")
+            result["error"] = "Failed to generate a response"
+    return result
+
+# Bounds the Vision (and per-image LLM) calls of all batch requests together
+_pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch-analysis")
+
+def analyze_batch(vision_client, llm_client, deployment: str, images: list, prompt: str, per_image: bool = False):
+    """
+    Analyzes (filename, image bytes) pairs concurrently and yields each image's
+    result as soon as it is ready: {"index", "filename", "caption", "tags",
+    "objects"} plus "message" in per-image mode, or {"index", "filename", "error"}.
+    """
+    futures = [
+        # Copy the request context so the workers' spans show up in its Server-Timing header
+        _pool.submit(contextvars.copy_context().run, _analyze_one, vision_client, llm_client, deployment,
+                     index, filename, image_data, prompt, per_image)
+        for index, (filename, image_data) in enumerate(images)
+    ]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # The client went away mid-stream: drop the images not started yet
+        for future in futures:
+            future.cancel()
+
+async def _analyze_one_async(vision_client, llm_client, deployment: str, index: int, filename: str,
+                             image_data: bytes, prompt: str, per_image: bool) -> dict:
+    result = {"index": index, "filename": filename}
+    try:
+        image_data = await asyncio.to_thread(downscale_image, image_data)
+        caption, tags, objects = await analyze_image_async(vision_client, image_data)
+    except Exception as e:
+        logger.error(f"Image analysis error for {filename}: {str(e)}")
+        result["error"] = "Failed to analyze image"
+        return result
+    result.update(caption=caption, tags=tags, objects=objects)
+    if per_image:
+        try:
+            result["message"] = await llm_client.chat_text(
+                chat_messages(analysis_prompt(caption, tags, objects, prompt)), deployment, **MODEL_PARAMS)
+        except Exception as e:
+            logger.error(f"LLM error for {filename}: {str(e)}")
+            result["error"] = "Failed to generate a response"
+    return result
+
+_semaphore = None
+
+async def analyze_batch_async(vision_client, llm_client, deployment: str, images: list, prompt: str,
+                              per_image: bool = False):
+    """analyze_batch for the ASGI app; an async generator over the per-image results."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def bounded(index: int, filename: str, image_data: bytes) -> dict:
+        async with _semaphore:
+            return await _analyze_one_async(vision_client, llm_client, deployment, index, filename,
+                                            image_data, prompt, per_image)
+
+    tasks = [asyncio.ensure_future(bounded(index, filename, image_data))
+             for index, (filename, image_data) in enumerate(images)]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # The client went away mid-stream
+        for task in tasks:
+            task.cancel()
@@ -2,7 +2,7 @@ import React, { useState, useRef, useEffect } from 'react';
 import { Send, Mic, MicOff, Image as ImageIcon, Volume2, VolumeX, Loader2 } from 'lucide-react';
 import ChatMessage from './components/ChatMessage';
 import { Message } from './types';
-import { sendMessage, analyzeImage } from './api';
+import { streamMessage, analyzeImage } from './api';
 
 function App() {
   const [messages, setMessages] = useState<Message[]>([
@@ -90,17 +90,23 @@ function App() {
       return;
     }
   
-    // Send message to chat API
+    // Send message to chat API, showing the reply as it streams in
     setIsLoading(true);
+    let receivedDelta = false;
     try {
-      const response = await sendMessage(messageToSend);
-      
-      const newAiMessage: Message = { 
-        role: 'assistant', 
-        content: response.message 
-      };
-      
-      setMessages(prev => [...prev, newAiMessage]);
+      await streamMessage(messageToSend, (delta) => {
+        if (!receivedDelta) {
+          receivedDelta = true;
+          setIsLoading(false);
+          setMessages(prev => [...prev, { role: 'assistant', content: delta }]);
+          return;
+        }
+        setMessages(prev => 
+          prev.map((msg, idx) => 
+            idx === prev.length - 1 ? { ...msg, content: msg.content + delta } : msg
+          )
+        );
+      });
     } catch (error) {
       console.error('Error sending message:', error);
       setMessages(prev => [...prev, { 
@@ -1,7 +1,36 @@
 import axios from 'axios';
+import { StreamEvent } from './types';
 
 const API_URL = 'http://localhost:5000/api';
 
+// Reads a server-sent event stream, calling onEvent with each JSON payload
+const readEventStream = async (response: Response, onEvent: (event: StreamEvent) => void): Promise<void> => {
+  if (!response.ok || !response.body) {
+    throw new Error(`Request failed with status ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('data: ')) {
+          const event: StreamEvent = JSON.parse(line.slice(6));
+          if (event.error) throw new Error(event.error);
+          onEvent(event);
+        }
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+};
+
 export const sendMessage = async (message: string): Promise<{ message: string }> => {
   try {
     const response = await axios.post(`${API_URL}/chat`, { message });
@@ -12,6 +41,28 @@ export const sendMessage = async (message: string): Promise<{ message: string }>
   }
 };
 
+// Streams the reply, calling onDelta with each piece as it arrives; resolves with the full message
+export const streamMessage = async (message: string, onDelta: (delta: string) => void): Promise<{ message: string }> => {
+  try {
+    const response = await fetch(`${API_URL}/chat`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ message, stream: true }),
+    });
+    let fullMessage = '';
+    await readEventStream(response, (event) => {
+      if (event.delta) {
+        fullMessage += event.delta;
+        onDelta(event.delta);
+      }
+    });
+    return { message: fullMessage };
+  } catch (error) {
+    console.error('Error streaming message:', error);
+    throw error;
+  }
+};
+
 export const analyzeImage = async (image: File, prompt?: string): Promise<{ message: string }> => {
   try {
     const formData = new FormData();
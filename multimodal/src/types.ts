@@ -10,4 +10,11 @@ export interface Message {
 export interface ApiResponse {
   message: string;
   error?: string;
-}
\ No newline at end of file
+}
+
+// One server-sent event from a streaming chat endpoint
+export interface StreamEvent {
+  delta?: string;
+  done?: boolean;
+  error?: string;
+}